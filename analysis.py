@@ -0,0 +1,114 @@
+import queue
+import threading
+from typing import Callable, NamedTuple, Optional, Union
+import utility
+from engine import Engine, SearchResult, MATE, MAX_PLY
+from parallel import ParallelSearch
+from position import Position, Move, WHITE, CHECKMATE, GAME_OVER
+
+
+class Analysis(NamedTuple):
+    generation: int
+    key: int
+    move: Optional[Move]
+    score: int
+    depth: int
+    nodes: int
+    pv: tuple
+    status: str
+    final: bool
+
+    @property
+    def score_text(self) -> str:
+        # score is from white's point of view; tablebase mates can lie beyond the search horizon
+        if abs(self.score) >= MATE - 2 * MAX_PLY:
+            moves = (MATE - abs(self.score) + 1) // 2
+            return f'#{moves}' if self.score > 0 else f'#-{moves}'
+        return f'{self.score / 100:+.2f}'
+
+
+class Analyzer:
+    def __init__(self, engine: Union[Engine, ParallelSearch], notify: Optional[Callable[[], None]] = None) -> None:
+        self.__engine = engine
+        self.__notify = notify
+        self.__requests = queue.SimpleQueue()
+        self.__results = queue.SimpleQueue()
+        self.__generation = 0
+        # set to call off the current request, one per request so a cancel can't hit the next search
+        self.__cancel = threading.Event()
+        self.__lock = threading.Lock()
+        # results are handed to the main thread: dispatch() fires this from there
+        self.result_event = utility.GameEvent(event_type='analysis')
+        self.__thread = threading.Thread(target=self.__run, name='analysis', daemon=True)
+        self.__thread.start()
+
+    @property
+    def engine(self) -> Union[Engine, ParallelSearch]:
+        return self.__engine
+
+    @property
+    def generation(self) -> int:
+        return self.__generation
+
+    def submit(self, pos: Position) -> int:
+        # the worker gets its own copy, the caller may go on changing pos
+        with self.__lock:
+            generation = self.__next()
+            self.__requests.put((generation, pos.copy(), self.__cancel))
+        return generation
+
+    def cancel(self) -> int:
+        with self.__lock:
+            return self.__next()
+
+    def __next(self) -> int:
+        self.__cancel.set()
+        self.__cancel = threading.Event()
+        self.__generation += 1
+        return self.__generation
+
+    def dispatch(self) -> int:
+        count = 0
+        while True:
+            try:
+                analysis = self.__results.get_nowait()
+            except queue.Empty:
+                return count
+            # a newer request may have come in after the worker queued this
+            if analysis.generation == self.__generation:
+                self.result_event(analysis)
+                count += 1
+
+    def close(self) -> None:
+        self.cancel()
+        self.__requests.put((None, None, None))
+        self.__thread.join()
+
+    def __run(self) -> None:
+        while True:
+            generation, pos, cancel = self.__requests.get()
+            if generation is None:
+                return
+            if generation != self.__generation:
+                continue
+            status = pos.status()
+            if status in GAME_OVER:
+                score = -MATE if status == CHECKMATE else 0
+                self.__post(generation, pos, status, SearchResult(None, score, 0, 0, 0.0, ()), True)
+                continue
+
+            def on_iteration(result: SearchResult) -> None:
+                self.__post(generation, pos, status, result, False)
+
+            result = self.__engine.search(pos, on_iteration=on_iteration, cancel=cancel)
+            self.__post(generation, pos, status, result, True)
+
+    def __post(self, generation: int, pos: Position, status: str, result: SearchResult, final: bool) -> None:
+        if generation != self.__generation:
+            # superseded while searching, the search has been cancelled already
+            return
+        score = result.score if pos.turn == WHITE else -result.score
+        self.__results.put(Analysis(generation, pos.key, result.move, score, result.depth, result.nodes,
+                                    result.pv, status, final))
+        if self.__notify:
+            self.__notify()
@@ -0,0 +1,83 @@
+import pygame as pg
+from collections import OrderedDict
+from typing import Optional
+
+
+class SpriteCache:
+    def __init__(self, directory: str = 'resources') -> None:
+        self.__directory = directory
+        self.__images = {}
+        self.__sprites = {}
+
+    def image(self, name: str) -> pg.Surface:
+        image = self.__images.get(name)
+        if image is None:
+            image = pg.image.load(f'{self.__directory}/{name}.png').convert_alpha()
+            self.__images[name] = image
+        return image
+
+    def get(self, name: str, size: Optional[tuple] = None, tint: Optional[tuple] = None) -> pg.Surface:
+        size = None if size is None else (int(size[0]), int(size[1]))
+        key = (name, size, tint)
+        sprite = self.__sprites.get(key)
+        if sprite is None:
+            image = self.image(name)
+            sprite = pg.transform.scale(image, size) if size is not None else image.copy()
+            if tint is not None:
+                sprite.fill(tint, None, pg.BLEND_RGB_MULT)
+            self.__sprites[key] = sprite
+        return sprite
+
+    def invalidate(self) -> None:
+        self.__sprites.clear()
+
+    def clear(self) -> None:
+        self.__sprites.clear()
+        self.__images.clear()
+
+    def __len__(self) -> int:
+        return len(self.__sprites)
+
+
+class TextCache:
+    def __init__(self, max_size: int = 256) -> None:
+        self.__fonts = {}
+        self.__surfaces = OrderedDict()
+        self.__max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def font(self, family: str, size: int, bold: bool) -> pg.font.Font:
+        key = (family, size, bold)
+        font = self.__fonts.get(key)
+        if font is None:
+            font = pg.font.SysFont(family, size, bold)
+            self.__fonts[key] = font
+        return font
+
+    def render(self, text: str, size: int, color: tuple, family: str = 'Arial', bold: bool = True) -> pg.Surface:
+        key = (text, size, color, family, bold)
+        surface = self.__surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.__surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        surface = self.font(family, size, bold).render(text, True, color)
+        self.__surfaces[key] = surface
+        if len(self.__surfaces) > self.__max_size:
+            self.__surfaces.popitem(last=False)
+        return surface
+
+    @property
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses,
+                'fonts': len(self.__fonts), 'surfaces': len(self.__surfaces)}
+
+    def clear(self) -> None:
+        self.__surfaces.clear()
+        self.__fonts.clear()
+
+
+sprites = SpriteCache()
+texts = TextCache()
@@ -0,0 +1,213 @@
+import argparse
+import random
+import time
+from typing import Iterable
+import numpy as np
+import bitboard
+import evaluation
+from position import Position, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, SIZE
+
+PLANES = 12
+
+# plane p holds the pieces with code _PLANE_CODES[p]: white pawn..king, then black pawn..king
+_PLANE_CODES = np.array([kind | color << 3 for color in (WHITE, BLACK) for kind in range(PAWN, KING + 1)],
+                        dtype=np.int8)
+# material plus square bonus for every piece code and square, signed from white's point of view
+_CODE_SCORES = np.zeros((16, SIZE * SIZE), dtype=np.int64)
+for _color, _sign in ((WHITE, 1), (BLACK, -1)):
+    for _kind in range(PAWN, KING + 1):
+        _table = np.array(evaluation.PIECE_SQUARE_TABLES[_kind]).reshape(SIZE, SIZE)
+        _CODE_SCORES[_kind | _color << 3] = _sign * (evaluation.PIECE_VALUES[_kind]
+                                                     + (_table if _color == WHITE else _table[::-1]).ravel())
+
+_FULL = np.uint64(bitboard.FULL)
+_FILE_A = np.uint64(bitboard.FILE_A)
+_FILE_H = np.uint64(bitboard.FILE_H)
+_NOT_A = ~_FILE_A
+_NOT_H = ~_FILE_H
+_NOT_AB = ~(_FILE_A | np.uint64(bitboard.FILE_A << 1))
+_NOT_GH = ~(_FILE_H | np.uint64(bitboard.FILE_H >> 1))
+_FILES = np.array([bitboard.FILE_A << x for x in range(SIZE)], dtype=np.uint64)
+_ROWS = np.array([0xFF << (y * SIZE) for y in range(SIZE)], dtype=np.uint64)
+
+# (square index shift, mask of squares a shifted bit may land on without wrapping around the board)
+_ROOK_SHIFTS = ((1, _NOT_A), (-1, _NOT_H), (SIZE, _FULL), (-SIZE, _FULL))
+_BISHOP_SHIFTS = ((SIZE + 1, _NOT_A), (SIZE - 1, _NOT_H), (-SIZE + 1, _NOT_A), (-SIZE - 1, _NOT_H))
+_KNIGHT_SHIFTS = ((2 * SIZE + 1, _NOT_A), (2 * SIZE - 1, _NOT_H), (SIZE + 2, _NOT_AB), (SIZE - 2, _NOT_GH),
+                  (-SIZE + 2, _NOT_AB), (-SIZE - 2, _NOT_GH), (-2 * SIZE + 1, _NOT_A), (-2 * SIZE - 1, _NOT_H))
+
+if hasattr(np, 'bitwise_count'):
+    _popcount = np.bitwise_count
+else:
+    _BYTE_COUNTS = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+    def _popcount(boards: np.ndarray) -> np.ndarray:
+        counts = _BYTE_COUNTS[np.ascontiguousarray(boards).view(np.uint8)]
+        return counts.reshape(*boards.shape, 8).sum(axis=-1)
+
+
+def squares_array(positions: Iterable[Position]) -> np.ndarray:
+    return np.array([pos.squares for pos in positions], dtype=np.int8).reshape(-1, SIZE * SIZE)
+
+
+def to_planes(squares: np.ndarray) -> np.ndarray:
+    squares = squares.reshape(len(squares), 1, SIZE * SIZE)
+    return (squares == _PLANE_CODES[None, :, None]).reshape(len(squares), PLANES, SIZE, SIZE)
+
+
+def to_squares(planes: np.ndarray) -> np.ndarray:
+    planes = planes.reshape(len(planes), PLANES, SIZE * SIZE).astype(np.int8, copy=False)
+    return (planes * _PLANE_CODES[None, :, None]).sum(axis=1, dtype=np.int8)
+
+
+def planes_array(positions: Iterable[Position]) -> np.ndarray:
+    return to_planes(squares_array(positions))
+
+
+def _bitboards(squares: np.ndarray) -> np.ndarray:
+    # one uint64 per board and plane, bit n set when square n holds that plane's piece
+    planes = squares[:, None, :] == _PLANE_CODES[None, :, None]
+    return np.packbits(planes, axis=-1, bitorder='little').view('<u8')[..., 0]
+
+
+def _shift(boards: np.ndarray, shift: int) -> np.ndarray:
+    return boards << np.uint64(shift) if shift > 0 else boards >> np.uint64(-shift)
+
+
+def _ray_attacks(sliders: np.ndarray, empty: np.ndarray, shift: int, mask: np.uint64) -> np.ndarray:
+    # Kogge-Stone fill: sliders spread through empty squares in 1, 2 and 4 step doublings
+    open_squares = empty & mask
+    sliders = sliders | (open_squares & _shift(sliders, shift))
+    open_squares = open_squares & _shift(open_squares, shift)
+    sliders = sliders | (open_squares & _shift(sliders, 2 * shift))
+    open_squares = open_squares & _shift(open_squares, 2 * shift)
+    sliders = sliders | (open_squares & _shift(sliders, 4 * shift))
+    return _shift(sliders, shift) & mask
+
+
+def _count(pieces: np.ndarray, free: np.ndarray, empty: np.ndarray, shifts: tuple, slide: bool) -> np.ndarray:
+    # rays of one direction never overlap, so per direction counts add up to the per piece total
+    count = np.zeros(pieces.shape, dtype=np.int64)
+    for shift, mask in shifts:
+        attacks = _ray_attacks(pieces, empty, shift, mask) if slide else _shift(pieces, shift) & mask
+        count += _popcount(attacks & free)
+    return count
+
+
+def mobility(boards: np.ndarray) -> np.ndarray:
+    occupied = np.bitwise_or.reduce(boards, axis=1)
+    empty = ~occupied[:, None]
+    sides = (np.bitwise_or.reduce(boards[:, :6], axis=1), np.bitwise_or.reduce(boards[:, 6:], axis=1))
+    free = ~np.stack((sides[WHITE], sides[WHITE], sides[BLACK], sides[BLACK]), axis=1)
+    weights = evaluation.MOBILITY_WEIGHTS
+
+    def pieces(kind: int, other_kind: int) -> np.ndarray:
+        return boards[:, [kind - 1, other_kind - 1, 6 + kind - 1, 6 + other_kind - 1]]
+
+    # columns: white kind, white queens, black kind, black queens
+    signs = np.array([1, 1, -1, -1])
+    diagonal = _count(pieces(BISHOP, QUEEN), free, empty, _BISHOP_SHIFTS, True)
+    straight = _count(pieces(ROOK, QUEEN), free, empty, _ROOK_SHIFTS, True)
+    knights = _count(pieces(KNIGHT, QUEEN)[:, [0, 2]], free[:, [0, 2]], empty, _KNIGHT_SHIFTS, False)
+    return (diagonal[:, [0, 2]] @ signs[[0, 2]] * weights[BISHOP]
+            + straight[:, [0, 2]] @ signs[[0, 2]] * weights[ROOK]
+            + (diagonal[:, [1, 3]] + straight[:, [1, 3]]) @ signs[[1, 3]] * weights[QUEEN]
+            + knights @ signs[[0, 2]] * weights[KNIGHT])
+
+
+def _fill(boards: np.ndarray, shift: int) -> np.ndarray:
+    boards = boards | _shift(boards, shift)
+    boards = boards | _shift(boards, 2 * shift)
+    return boards | _shift(boards, 4 * shift)
+
+
+def _spread_files(boards: np.ndarray) -> np.ndarray:
+    return boards | ((boards << np.uint64(1)) & _NOT_A) | ((boards >> np.uint64(1)) & _NOT_H)
+
+
+def pawn_structure(boards: np.ndarray) -> np.ndarray:
+    pawns = (boards[:, PAWN - 1], boards[:, 6 + PAWN - 1])
+    # squares behind each enemy pawn, seen from the other side, on its own and neighbouring files;
+    # a pawn standing on one of them has an enemy pawn ahead of it and is not passed
+    blocked = (_spread_files(_fill(pawns[BLACK], SIZE) << np.uint64(SIZE)),
+               _spread_files(_fill(pawns[WHITE], -SIZE) >> np.uint64(SIZE)))
+    passed_bonus = (np.array(evaluation.PASSED_PAWN[::-1]), np.array(evaluation.PASSED_PAWN))
+
+    score = np.zeros(len(boards), dtype=np.int64)
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        counts = _popcount(pawns[color][:, None] & _FILES).astype(np.int64)
+        occupied_files = counts > 0
+        neighbours = np.zeros_like(occupied_files)
+        neighbours[:, 1:] |= occupied_files[:, :-1]
+        neighbours[:, :-1] |= occupied_files[:, 1:]
+        passed = _popcount((pawns[color] & ~blocked[color])[:, None] & _ROWS).astype(np.int64)
+        score += sign * (evaluation.DOUBLED_PAWN * np.maximum(counts - 1, 0).sum(axis=1)
+                         + evaluation.ISOLATED_PAWN * (counts * ~neighbours).sum(axis=1)
+                         + passed @ passed_bonus[color])
+    return score
+
+
+def evaluate_batch(boards: np.ndarray) -> np.ndarray:
+    # takes (N, 64) piece codes or (N, 12, 8, 8) planes, returns N scores from white's point of view
+    squares = to_squares(boards) if boards.ndim == 4 else boards.astype(np.int8, copy=False)
+    material = _CODE_SCORES[squares, np.arange(SIZE * SIZE)].sum(axis=1)
+    bitboards = _bitboards(squares)
+    return material + mobility(bitboards) + pawn_structure(bitboards)
+
+
+def rank_moves(pos: Position) -> list:
+    moves = pos.legal_moves()
+    children = []
+    for move in moves:
+        undo = pos._make(move)
+        children.append(pos.squares.copy())
+        pos._unmake(move, undo)
+    scores = evaluate_batch(np.array(children, dtype=np.int8).reshape(-1, SIZE * SIZE))
+    sign = 1 if pos.turn == WHITE else -1
+    return sorted(zip(moves, (sign * int(score) for score in scores)), key=lambda item: -item[1])
+
+
+def random_positions(count: int, seed: int = 0, max_plies: int = 80) -> list:
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        pos = Position.initial()
+        for _ in range(rng.randint(0, max_plies)):
+            moves = pos.legal_moves()
+            if not moves:
+                break
+            pos.make_move(rng.choice(moves))
+        positions.append(pos)
+    return positions
+
+
+def benchmark(count: int, seed: int = 0) -> None:
+    positions = random_positions(count, seed)
+
+    start = time.perf_counter()
+    scalar = [evaluation.evaluate_full(pos) for pos in positions]
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    squares = squares_array(positions)
+    export_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = evaluate_batch(squares)
+    batch_time = time.perf_counter() - start
+
+    mismatches = int(np.count_nonzero(batch != np.array(scalar)))
+    print(f'positions {count}  scalar {scalar_time:.3f} s ({count / scalar_time:.0f}/s)  '
+          f'batch {batch_time:.3f} s ({count / batch_time:.0f}/s) + export {export_time:.3f} s  '
+          f'speedup {scalar_time / (batch_time + export_time):.1f}x  mismatches {mismatches}')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare batch and scalar evaluation')
+    parser.add_argument('--count', type=int, default=10000, help='number of random positions')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    benchmark(args.count, args.seed)
+
+
+if __name__ == '__main__':
+    main()
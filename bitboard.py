@@ -0,0 +1,117 @@
+from typing import Iterator
+
+SIZE = 8
+FULL = (1 << SIZE * SIZE) - 1
+FILE_A = sum(1 << (y * SIZE) for y in range(SIZE))
+FILE_H = FILE_A << (SIZE - 1)
+
+# (dx, dy) steps; the first four are orthogonal, the last four diagonal
+DIRECTIONS = ((1, 0), (-1, 0), (0, -1), (0, 1), (-1, 1), (1, -1), (-1, -1), (1, 1))
+_KNIGHT_STEPS = ((2, 1), (1, 2), (-1, 2), (2, -1), (1, -2), (-2, 1), (-1, -2), (-2, -1))
+
+
+def bit(sq: int) -> int:
+    return 1 << sq
+
+
+def lsb(bb: int) -> int:
+    return (bb & -bb).bit_length() - 1
+
+
+def msb(bb: int) -> int:
+    return bb.bit_length() - 1
+
+
+def popcount(bb: int) -> int:
+    return bin(bb).count('1')
+
+
+def iterate(bb: int) -> Iterator[int]:
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def _step_mask(sq: int, steps: tuple) -> int:
+    x, y = sq % SIZE, sq // SIZE
+    mask = 0
+    for dx, dy in steps:
+        if 0 <= x + dx < SIZE and 0 <= y + dy < SIZE:
+            mask |= 1 << ((y + dy) * SIZE + x + dx)
+    return mask
+
+
+def _ray_mask(sq: int, direction: tuple) -> int:
+    x, y = sq % SIZE, sq // SIZE
+    mask = 0
+    while True:
+        x += direction[0]
+        y += direction[1]
+        if not (0 <= x < SIZE and 0 <= y < SIZE):
+            return mask
+        mask |= 1 << (y * SIZE + x)
+
+
+KNIGHT_ATTACKS = tuple(_step_mask(sq, _KNIGHT_STEPS) for sq in range(SIZE * SIZE))
+KING_ATTACKS = tuple(_step_mask(sq, DIRECTIONS) for sq in range(SIZE * SIZE))
+# indexed by color: white pawns attack towards y == 0, black pawns towards y == SIZE - 1
+PAWN_ATTACKS = (tuple(_step_mask(sq, ((-1, -1), (1, -1))) for sq in range(SIZE * SIZE)),
+                tuple(_step_mask(sq, ((-1, 1), (1, 1))) for sq in range(SIZE * SIZE)))
+RAYS = tuple(tuple(_ray_mask(sq, d) for sq in range(SIZE * SIZE)) for d in DIRECTIONS)
+
+
+def _slider_rays(directions: range) -> tuple:
+    # per square: (ray, ray table of the same direction, whether the ray walks to higher squares)
+    return tuple(tuple((RAYS[d][sq], RAYS[d], DIRECTIONS[d][1] * SIZE + DIRECTIONS[d][0] > 0) for d in directions)
+                 for sq in range(SIZE * SIZE))
+
+
+_ROOK_RAYS = _slider_rays(range(0, 4))
+_BISHOP_RAYS = _slider_rays(range(4, 8))
+
+
+def _slide(rays: tuple, occupied: int) -> int:
+    attacks = 0
+    for ray, table, ascending in rays:
+        blockers = ray & occupied
+        if blockers:
+            ray ^= table[(blockers & -blockers).bit_length() - 1 if ascending else blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+def rook_attacks(sq: int, occupied: int) -> int:
+    return _slide(_ROOK_RAYS[sq], occupied)
+
+
+def bishop_attacks(sq: int, occupied: int) -> int:
+    return _slide(_BISHOP_RAYS[sq], occupied)
+
+
+def queen_attacks(sq: int, occupied: int) -> int:
+    return _slide(_ROOK_RAYS[sq], occupied) | _slide(_BISHOP_RAYS[sq], occupied)
+
+
+def pawn_attacks(pawns: int, color: int) -> int:
+    if color == 0:
+        return ((pawns & ~FILE_A) >> (SIZE + 1)) | ((pawns & ~FILE_H) >> (SIZE - 1))
+    return (((pawns & ~FILE_A) << (SIZE - 1)) | ((pawns & ~FILE_H) << (SIZE + 1))) & FULL
+
+
+def _between(a: int, b: int) -> int:
+    for d, rays in enumerate(RAYS):
+        if rays[a] >> b & 1:
+            return rays[a] & RAYS[d ^ 1][b]
+    return 0
+
+
+def _line(a: int, b: int) -> int:
+    for d, rays in enumerate(RAYS):
+        if rays[a] >> b & 1:
+            return rays[a] | RAYS[d ^ 1][a] | 1 << a
+    return 0
+
+
+BETWEEN = tuple(tuple(_between(a, b) for b in range(SIZE * SIZE)) for a in range(SIZE * SIZE))
+LINE = tuple(tuple(_line(a, b) for b in range(SIZE * SIZE)) for a in range(SIZE * SIZE))
@@ -0,0 +1,217 @@
+import argparse
+import bisect
+import mmap
+import os
+import random
+import struct
+import sys
+import time
+from array import array
+from typing import Any, Iterable, Optional
+import pgn
+from position import Position, Move, START_FEN
+
+# header, then a bucket table indexed by the top bits of the key, then every key in ascending
+# order, then (move, weight, learn) for each key in the same order; all little-endian
+_MAGIC = b'SCHBOOK\0'
+_VERSION = 1
+_HEADER = struct.Struct('<8sIIQ')
+_ENTRY = struct.Struct('<HHI')
+_MAX_WEIGHT = 0xFFFF
+# weight a move gets for every game it was played in, by the result for the side that played it
+WIN, DRAW, LOSS = 2, 1, 0
+
+
+def _bucket_bits(count: int) -> int:
+    # about eight keys per bucket, so a lookup bisects a handful of entries
+    return max(0, min(20, count.bit_length() - 3))
+
+
+def _aligned(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def write_book(path: str, weights: dict) -> int:
+    # weights maps (key, packed move) to a total weight; moves of one key are stored best first
+    entries = sorted(((key, -weight, move) for (key, move), weight in weights.items() if weight > 0))
+    scale = min(1.0, _MAX_WEIGHT / max((-weight for _, weight, _ in entries), default=1))
+    bits = _bucket_bits(len(entries))
+    keys = array('Q', (key for key, _, _ in entries))
+    buckets = array('I', [0] * ((1 << bits) + 1))
+    for bucket in range(1 << bits):
+        buckets[bucket + 1] = bisect.bisect_left(keys, (bucket + 1) << (64 - bits), buckets[bucket])
+    if sys.byteorder != 'little':
+        keys.byteswap()
+        buckets.byteswap()
+
+    with open(path, 'wb') as out:
+        out.write(_HEADER.pack(_MAGIC, _VERSION, bits, len(entries)))
+        out.write(buckets.tobytes())
+        out.write(bytes(_aligned(out.tell()) - out.tell()))
+        out.write(keys.tobytes())
+        for _, weight, move in entries:
+            out.write(_ENTRY.pack(move, max(1, round(-weight * scale)), 0))
+    return len(entries)
+
+
+def build(pgn_paths: Iterable[str], path: str, max_plies: int = 30, min_games: int = 1) -> tuple:
+    weights = {}
+    counts = {}
+    games = errors = 0
+    score = {'1-0': (WIN, LOSS), '0-1': (LOSS, WIN), '1/2-1/2': (DRAW, DRAW)}
+    for pgn_path in pgn_paths:
+        for game in pgn.open_games(pgn_path):
+            pos = Position.from_fen(game.fen)
+            gained = score.get(game.result, (DRAW, DRAW))
+            try:
+                for text in game.sans[:max_plies]:
+                    move = pgn.parse_san(pos, text)
+                    entry = (pos.key, move.pack())
+                    weights[entry] = weights.get(entry, 0) + gained[pos.turn]
+                    counts[entry] = counts.get(entry, 0) + 1
+                    pos._make(move)
+            except RuntimeError as error:
+                errors += 1
+                print(f'game {games + errors}: {error}')
+                continue
+            games += 1
+    if min_games > 1:
+        weights = {entry: weight for entry, weight in weights.items() if counts[entry] >= min_games}
+    return games, errors, write_book(path, weights)
+
+
+class OpeningBook:
+    def __init__(self, path: str) -> None:
+        self.__file = open(path, 'rb')
+        size = os.fstat(self.__file.fileno()).st_size
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if size < _HEADER.size:
+            raise RuntimeError(f'not an opening book: {path}')
+        magic, version, bits, count = _HEADER.unpack_from(self.__map)
+        if magic != _MAGIC or version != _VERSION:
+            raise RuntimeError(f'not an opening book: {path}')
+        self.__bits = bits
+        self.__count = count
+        bucket_start = _HEADER.size
+        key_start = _aligned(bucket_start + 4 * ((1 << bits) + 1))
+        entry_start = key_start + 8 * count
+        if size < entry_start + _ENTRY.size * count:
+            raise RuntimeError(f'truncated opening book: {path}')
+
+        view = memoryview(self.__map)
+        sections = (view[bucket_start:bucket_start + 4 * ((1 << bits) + 1)].cast('I'),
+                    view[key_start:entry_start].cast('Q'),
+                    view[entry_start:entry_start + _ENTRY.size * count].cast('H'))
+        if sys.byteorder != 'little':
+            # a big-endian machine reads swapped copies instead of the mapping
+            sections = tuple(memoryview(self.__swapped(section)) for section in sections)
+        self.__views = (view,) + sections
+        self.__buckets, self.__keys, self.__entries = sections
+
+    @staticmethod
+    def __swapped(section: memoryview) -> array:
+        values = array(section.format, section)
+        values.byteswap()
+        return values
+
+    def __enter__(self) -> 'OpeningBook':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def entries(self, key: int) -> list:
+        # (packed move, weight) pairs stored for key, best first
+        bucket = key >> (64 - self.__bits)
+        keys = self.__keys
+        end = self.__buckets[bucket + 1]
+        index = bisect.bisect_left(keys, key, self.__buckets[bucket], end)
+        found = []
+        while index < end and keys[index] == key:
+            found.append((self.__entries[4 * index], self.__entries[4 * index + 1]))
+            index += 1
+        return found
+
+    def moves(self, pos: Position) -> list:
+        # (move, weight) pairs, checked against the position so a key collision can't play nonsense
+        found = []
+        for packed, weight in self.entries(pos.key):
+            move = Move.unpack(packed)
+            legal = pos.find_move(move.start, move.end, move.promotion)
+            if legal is not None and legal.promotion == move.promotion:
+                found.append((legal, weight))
+        return found
+
+    def choose(self, pos: Position, rng: Optional[random.Random] = None) -> Optional[Move]:
+        # the heaviest move, or a weighted random one when given a generator
+        moves = self.moves(pos)
+        if not moves:
+            return None
+        if rng is None:
+            return moves[0][0]
+        return rng.choices([move for move, _ in moves], [weight for _, weight in moves])[0]
+
+    def close(self) -> None:
+        for view in reversed(self.__views):
+            if isinstance(view, memoryview):
+                view.release()
+        if isinstance(self.__map, mmap.mmap):
+            self.__map.close()
+        self.__file.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Build and query opening books')
+    commands = parser.add_subparsers(dest='command', required=True)
+    make = commands.add_parser('build', help='compile PGN files into a book')
+    make.add_argument('pgn', nargs='+')
+    make.add_argument('book')
+    make.add_argument('--plies', type=int, default=30, help='moves taken from the start of every game')
+    make.add_argument('--min-games', type=int, default=1, help='drop moves played in fewer games')
+    probe = commands.add_parser('probe', help='list the book moves of a position')
+    probe.add_argument('book')
+    probe.add_argument('--fen', default=START_FEN)
+    bench = commands.add_parser('bench', help='time lookups along book lines and of random keys')
+    bench.add_argument('book')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        games, errors, entries = build(args.pgn, args.book, args.plies, args.min_games)
+        print(f'games {games}  errors {errors}  entries {entries}  {time.perf_counter() - start:.2f} s')
+        return
+    with OpeningBook(args.book) as book:
+        if args.command == 'probe':
+            pos = Position.from_fen(args.fen)
+            moves = book.moves(pos)
+            total = sum(weight for _, weight in moves) or 1
+            for move, weight in moves:
+                print(f'{pgn.san(pos, move):<8} {move.uci:<6} weight {weight:>6}  {100 * weight / total:5.1f}%')
+            if not moves:
+                print('not in book')
+            return
+        # keys along random book lines, which hit, and random keys, which mostly miss
+        rng = random.Random(0)
+        keys = [rng.getrandbits(64) for _ in range(1000)]
+        for _ in range(1000):
+            pos = Position.initial()
+            move = book.choose(pos, rng)
+            while move is not None:
+                keys.append(pos.key)
+                pos.make_move(move)
+                move = book.choose(pos, rng)
+        rounds = max(1, 200000 // len(keys))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for key in keys:
+                book.entries(key)
+        elapsed = time.perf_counter() - start
+        print(f'entries {len(book)}  lookups {rounds * len(keys)}  '
+              f'{elapsed / (rounds * len(keys)) * 1e6:.2f} us per lookup')
+
+
+if __name__ == '__main__':
+    main()
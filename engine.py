@@ -0,0 +1,289 @@
+import argparse
+import time
+from typing import Any, Callable, Iterable, NamedTuple, Optional
+import bitboard
+import evaluation
+from book import OpeningBook
+from position import Position, Move, START_FEN, PAWN, QUEEN
+from tablebase import Tablebase, Probe, WIN, LOSS, MAX_PIECES
+from transposition import TranspositionTable, EXACT, LOWER, UPPER
+
+MATE = 100000
+MAX_PLY = 64
+INFINITY = 1000000
+
+_HASH_MOVE_SCORE = 1 << 30
+_CAPTURE_SCORE = 1 << 20
+_KILLER_SCORE = 1 << 19
+
+
+class SearchResult(NamedTuple):
+    move: Optional[Move]
+    score: int
+    depth: int
+    nodes: int
+    elapsed: float
+    pv: tuple
+
+    @property
+    def nps(self) -> float:
+        return self.nodes / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self) -> str:
+        return (f'depth {self.depth} score {self.score} nodes {self.nodes} nps {self.nps:.0f} '
+                f'time {self.elapsed:.2f} pv {" ".join(move.uci for move in self.pv)}')
+
+
+class _Timeout(Exception):
+    pass
+
+
+def _to_table(score: int, ply: int) -> int:
+    # mate scores are stored relative to the node, not the root
+    if score >= MATE - 2 * MAX_PLY:
+        return score + ply
+    if score <= -MATE + 2 * MAX_PLY:
+        return score - ply
+    return score
+
+
+def _from_table(score: int, ply: int) -> int:
+    if score >= MATE - 2 * MAX_PLY:
+        return score - ply
+    if score <= -MATE + 2 * MAX_PLY:
+        return score + ply
+    return score
+
+
+def tablebase_score(probe: Probe, ply: int) -> int:
+    # exact mate distances, on the same scale as mates found by the search
+    if probe.wdl == WIN:
+        return MATE - ply - probe.dtm
+    if probe.wdl == LOSS:
+        return -MATE + ply + probe.dtm
+    return 0
+
+
+class Engine:
+    def __init__(self, max_depth: int = MAX_PLY, time_limit: Optional[float] = None,
+                 table: Optional[TranspositionTable] = None, stop_flag: Any = None,
+                 book: Optional[OpeningBook] = None, tablebase: Optional[Tablebase] = None) -> None:
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        self.book = book
+        self.tablebase = tablebase
+        self.__table = table if table is not None else TranspositionTable()
+        # anything with is_set(), e.g. a multiprocessing.Event shared by several searching processes
+        self.__stop_flag = stop_flag
+        self.__nodes = 0
+        self.__deadline = None
+        self.__stopped = False
+        self.__cancel = None
+        self.__root_moves = None
+        self.__killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.__history = [0] * (64 * 64)
+        self.__pv = [[] for _ in range(MAX_PLY + 2)]
+
+    @property
+    def nodes(self) -> int:
+        return self.__nodes
+
+    @property
+    def table(self) -> TranspositionTable:
+        return self.__table
+
+    def stop(self) -> None:
+        self.__stopped = True
+
+    def search(self, pos: Position, max_depth: Optional[int] = None, time_limit: Optional[float] = None,
+               on_iteration: Optional[Callable[[SearchResult], None]] = None,
+               root_moves: Optional[Iterable[Move]] = None, min_depth: int = 1,
+               age: Optional[int] = None, cancel: Any = None) -> SearchResult:
+        # cancel is anything with is_set() that belongs to this one search, so unlike stop() it can be
+        # set before the search gets going
+        if self.book is not None and root_moves is None:
+            # a book hit costs one lookup, no move generation or search
+            move = self.book.choose(pos)
+            if move is not None:
+                return SearchResult(move, 0, 0, 0, 0.0, (move,))
+        if self.tablebase is not None and root_moves is None:
+            probe = self.tablebase.probe(pos)
+            move = self.tablebase.best_move(pos) if probe is not None else None
+            if move is not None:
+                return SearchResult(move, tablebase_score(probe, 0), 0, 0, 0.0, (move,))
+        max_depth = min(max_depth or self.max_depth, MAX_PLY)
+        time_limit = self.time_limit if time_limit is None else time_limit
+        # a timeout unwinds without unmaking, so the search always runs on its own copy
+        pos = pos.copy()
+        start = time.perf_counter()
+        self.__nodes = 0
+        self.__deadline = None
+        self.__stopped = False
+        self.__cancel = cancel
+        self.__killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        self.__history = [0] * (64 * 64)
+        self.__table.new_search(age)
+
+        # a restricted root is searched even for a single move, since the caller wants its score
+        self.__root_moves = None if root_moves is None else list(root_moves)
+        moves = pos.legal_moves() if root_moves is None else self.__root_moves
+        result = SearchResult(moves[0] if moves else None, 0, 0, 0, 0.0, ())
+        if not moves or (len(moves) < 2 and root_moves is None) or (cancel is not None and cancel.is_set()):
+            return result
+        for depth in range(min(min_depth, max_depth), max_depth + 1):
+            try:
+                score = self.__negamax(pos, depth, -INFINITY, INFINITY, 0)
+            except _Timeout:
+                break
+            pv = tuple(self.__pv[0])
+            elapsed = time.perf_counter() - start
+            result = SearchResult(pv[0] if pv else result.move, score, depth, self.__nodes, elapsed, pv)
+            if on_iteration:
+                on_iteration(result)
+            if abs(score) >= MATE - MAX_PLY:
+                break
+            if time_limit is not None:
+                # the next iteration costs several times this one, so don't start what can't finish
+                if elapsed * 2 > time_limit:
+                    break
+                self.__deadline = start + time_limit
+        return result._replace(nodes=self.__nodes, elapsed=time.perf_counter() - start)
+
+    def __count(self) -> None:
+        self.__nodes += 1
+        if self.__nodes & 1023 == 0 and (self.__stopped
+                                         or (self.__stop_flag is not None and self.__stop_flag.is_set())
+                                         or (self.__cancel is not None and self.__cancel.is_set())
+                                         or (self.__deadline is not None and time.perf_counter() > self.__deadline)):
+            raise _Timeout()
+
+    def __negamax(self, pos: Position, depth: int, alpha: int, beta: int, ply: int) -> int:
+        self.__pv[ply] = []
+        if depth <= 0 or ply >= MAX_PLY:
+            return self.__quiescence(pos, alpha, beta, ply)
+        self.__count()
+        if ply and (pos.halfmove_clock >= 100 or pos.is_repetition(2)):
+            return 0
+        if ply and self.tablebase is not None and bitboard.popcount(pos.occupied) <= MAX_PIECES:
+            probe = self.tablebase.probe(pos)
+            if probe is not None:
+                return tablebase_score(probe, ply)
+
+        key = pos.key
+        entry = self.__table.probe(key)
+        hash_move = None
+        if entry is not None:
+            hash_move = entry.move
+            if ply and entry.depth >= depth:
+                score = _from_table(entry.score, ply)
+                if entry.flag == EXACT or (entry.flag == LOWER and score >= beta) \
+                        or (entry.flag == UPPER and score <= alpha):
+                    return score
+
+        moves = self.__root_moves if not ply and self.__root_moves is not None else pos.legal_moves()
+        in_check = pos.is_checked()
+        if not moves:
+            return -MATE + ply if in_check else 0
+        if in_check:
+            depth += 1
+
+        original_alpha = alpha
+        best = -INFINITY
+        best_move = None
+        for move in self.__order(pos, moves, ply, hash_move):
+            undo = pos._make(move)
+            score = -self.__negamax(pos, depth - 1, -beta, -alpha, ply + 1)
+            pos._unmake(move, undo)
+            if score > best:
+                best = score
+                best_move = move
+            if score > alpha:
+                alpha = score
+                self.__pv[ply] = [move] + self.__pv[ply + 1]
+                if alpha >= beta:
+                    if pos.captured_square(move) is None and not move.promotion:
+                        killers = self.__killers[ply]
+                        if killers[0] != move:
+                            killers[0], killers[1] = move, killers[0]
+                        self.__history[move.start * 64 + move.end] += depth * depth
+                    break
+
+        if ply or self.__root_moves is None:
+            flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+            self.__table.store(key, best_move, _to_table(best, ply), depth, flag)
+        return best
+
+    def __quiescence(self, pos: Position, alpha: int, beta: int, ply: int) -> int:
+        self.__count()
+        self.__pv[ply] = []
+        if ply >= MAX_PLY:
+            return evaluation.evaluate_relative(pos)
+
+        in_check = pos.is_checked()
+        if in_check:
+            moves = pos.legal_moves()
+            if not moves:
+                return -MATE + ply
+        else:
+            stand_pat = evaluation.evaluate_relative(pos)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            moves = [move for move in pos.legal_moves()
+                     if move.promotion == QUEEN or pos.captured_square(move) is not None]
+
+        for move in self.__order(pos, moves, ply):
+            undo = pos._make(move)
+            score = -self.__quiescence(pos, -beta, -alpha, ply + 1)
+            pos._unmake(move, undo)
+            if score >= beta:
+                return score
+            if score > alpha:
+                alpha = score
+        return alpha
+
+    def __order(self, pos: Position, moves: list, ply: int, hash_move: Optional[Move] = None) -> list:
+        squares = pos.squares
+        killers = self.__killers[ply] if ply <= MAX_PLY else (None, None)
+        history = self.__history
+
+        def score(move: Move) -> int:
+            if move == hash_move:
+                return _HASH_MOVE_SCORE
+            victim = squares[move.end] & 7
+            if not victim and squares[move.start] & 7 == PAWN and move.end == pos.ep_square:
+                victim = PAWN
+            if victim or move.promotion:
+                # most valuable victim first, then least valuable attacker
+                return _CAPTURE_SCORE + (victim << 3) + (move.promotion << 3) - (squares[move.start] & 7)
+            if move == killers[0]:
+                return _KILLER_SCORE + 1
+            if move == killers[1]:
+                return _KILLER_SCORE
+            return min(history[move.start * 64 + move.end], _KILLER_SCORE - 1)
+
+        return sorted(moves, key=score, reverse=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Search a position')
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--depth', type=int, default=MAX_PLY)
+    parser.add_argument('--time', type=float, default=5.0, help='time limit in seconds')
+    parser.add_argument('--hash', type=float, default=16, help='transposition table size in MB')
+    parser.add_argument('--book', default=None, help='opening book to play from before searching')
+    parser.add_argument('--tablebases', default=None, help='directory of endgame tables to probe')
+    args = parser.parse_args()
+
+    engine = Engine(table=TranspositionTable(args.hash), book=OpeningBook(args.book) if args.book else None,
+                    tablebase=Tablebase(args.tablebases) if args.tablebases else None)
+    result = engine.search(Position.from_fen(args.fen), args.depth, args.time, on_iteration=print)
+    print(f'bestmove {result.move.uci if result.move else "none"}  depth {result.depth}  '
+          f'nodes {result.nodes}  {result.nps:.0f} nps')
+    stats = engine.table.stats
+    print(f'hash {stats["size_mb"]:.1f} MB  hit rate {stats["hit_rate"]:.1%}  occupancy {stats["occupancy"]:.1%}')
+
+
+if __name__ == '__main__':
+    main()
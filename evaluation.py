@@ -0,0 +1,138 @@
+import bitboard
+from position import Position, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING
+
+PIECE_VALUES = (0, 100, 320, 330, 500, 900, 20000)
+# per square a piece attacks that isn't occupied by its own side
+MOBILITY_WEIGHTS = (0, 0, 4, 5, 2, 1, 0)
+DOUBLED_PAWN = -15
+ISOLATED_PAWN = -12
+# by rank counted from the pawn's own side
+PASSED_PAWN = (0, 5, 10, 20, 35, 60, 100, 0)
+
+# piece-square tables from white's point of view, indexed like Position.squares (a8 first)
+PIECE_SQUARE_TABLES = (
+    (0,) * 64,
+    (0, 0, 0, 0, 0, 0, 0, 0,
+     50, 50, 50, 50, 50, 50, 50, 50,
+     10, 10, 20, 30, 30, 20, 10, 10,
+     5, 5, 10, 25, 25, 10, 5, 5,
+     0, 0, 0, 20, 20, 0, 0, 0,
+     5, -5, -10, 0, 0, -10, -5, 5,
+     5, 10, 10, -20, -20, 10, 10, 5,
+     0, 0, 0, 0, 0, 0, 0, 0),
+    (-50, -40, -30, -30, -30, -30, -40, -50,
+     -40, -20, 0, 0, 0, 0, -20, -40,
+     -30, 0, 10, 15, 15, 10, 0, -30,
+     -30, 5, 15, 20, 20, 15, 5, -30,
+     -30, 0, 15, 20, 20, 15, 0, -30,
+     -30, 5, 10, 15, 15, 10, 5, -30,
+     -40, -20, 0, 5, 5, 0, -20, -40,
+     -50, -40, -30, -30, -30, -30, -40, -50),
+    (-20, -10, -10, -10, -10, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 10, 10, 5, 0, -10,
+     -10, 5, 5, 10, 10, 5, 5, -10,
+     -10, 0, 10, 10, 10, 10, 0, -10,
+     -10, 10, 10, 10, 10, 10, 10, -10,
+     -10, 5, 0, 0, 0, 0, 5, -10,
+     -20, -10, -10, -10, -10, -10, -10, -20),
+    (0, 0, 0, 0, 0, 0, 0, 0,
+     5, 10, 10, 10, 10, 10, 10, 5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     -5, 0, 0, 0, 0, 0, 0, -5,
+     0, 0, 0, 5, 5, 0, 0, 0),
+    (-20, -10, -10, -5, -5, -10, -10, -20,
+     -10, 0, 0, 0, 0, 0, 0, -10,
+     -10, 0, 5, 5, 5, 5, 0, -10,
+     -5, 0, 5, 5, 5, 5, 0, -5,
+     0, 0, 5, 5, 5, 5, 0, -5,
+     -10, 5, 5, 5, 5, 5, 0, -10,
+     -10, 0, 5, 0, 0, 0, 0, -10,
+     -20, -10, -10, -5, -5, -10, -10, -20),
+    (-30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -30, -40, -40, -50, -50, -40, -40, -30,
+     -20, -30, -30, -40, -40, -30, -30, -20,
+     -10, -20, -20, -20, -20, -20, -20, -10,
+     20, 20, 0, 0, 0, 0, 20, 20,
+     20, 30, 10, 0, 0, 10, 30, 20),
+)
+
+# value plus square bonus for every (color, kind, square); black reads the mirrored rank
+_SCORES = tuple(tuple(tuple((PIECE_VALUES[kind] + PIECE_SQUARE_TABLES[kind][sq if color == WHITE else sq ^ 56])
+                            * (1 if color == WHITE else -1) for sq in range(64))
+                      for kind in range(KING + 1))
+                for color in (WHITE, BLACK))
+
+
+_FILES = tuple(bitboard.FILE_A << x for x in range(bitboard.SIZE))
+_ADJACENT_FILES = tuple((_FILES[x - 1] if x else 0) | (_FILES[x + 1] if x < bitboard.SIZE - 1 else 0)
+                        for x in range(bitboard.SIZE))
+
+
+def _passed_mask(sq: int, color: int) -> int:
+    # squares ahead of a pawn on its own and neighbouring files; it is passed when no enemy pawn stands there
+    x, y = sq % bitboard.SIZE, sq // bitboard.SIZE
+    rows = range(y) if color == WHITE else range(y + 1, bitboard.SIZE)
+    return sum(1 << (row * bitboard.SIZE + file) for row in rows
+               for file in range(max(x - 1, 0), min(x + 2, bitboard.SIZE)))
+
+
+_PASSED_MASKS = tuple(tuple(_passed_mask(sq, color) for sq in range(64)) for color in (WHITE, BLACK))
+
+
+def evaluate(pos: Position) -> int:
+    score = 0
+    for color in (WHITE, BLACK):
+        scores = _SCORES[color]
+        for kind in (PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING):
+            table = scores[kind]
+            for sq in bitboard.iterate(pos.pieces(color, kind)):
+                score += table[sq]
+    return score
+
+
+def mobility(pos: Position) -> int:
+    occupied = pos.occupied
+    score = 0
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        free = ~pos.pieces(color)
+        for sq in bitboard.iterate(pos.pieces(color, KNIGHT)):
+            score += sign * MOBILITY_WEIGHTS[KNIGHT] * bitboard.popcount(bitboard.KNIGHT_ATTACKS[sq] & free)
+        for sq in bitboard.iterate(pos.pieces(color, BISHOP)):
+            score += sign * MOBILITY_WEIGHTS[BISHOP] * bitboard.popcount(bitboard.bishop_attacks(sq, occupied) & free)
+        for sq in bitboard.iterate(pos.pieces(color, ROOK)):
+            score += sign * MOBILITY_WEIGHTS[ROOK] * bitboard.popcount(bitboard.rook_attacks(sq, occupied) & free)
+        for sq in bitboard.iterate(pos.pieces(color, QUEEN)):
+            score += sign * MOBILITY_WEIGHTS[QUEEN] * bitboard.popcount(bitboard.queen_attacks(sq, occupied) & free)
+    return score
+
+
+def pawn_structure(pos: Position) -> int:
+    score = 0
+    for color, sign in ((WHITE, 1), (BLACK, -1)):
+        pawns = pos.pieces(color, PAWN)
+        enemy_pawns = pos.pieces(color ^ 1, PAWN)
+        for x in range(bitboard.SIZE):
+            count = bitboard.popcount(pawns & _FILES[x])
+            if count:
+                score += sign * DOUBLED_PAWN * (count - 1)
+                if not pawns & _ADJACENT_FILES[x]:
+                    score += sign * ISOLATED_PAWN * count
+        for sq in bitboard.iterate(pawns):
+            if not enemy_pawns & _PASSED_MASKS[color][sq]:
+                score += sign * PASSED_PAWN[7 - sq // 8 if color == WHITE else sq // 8]
+    return score
+
+
+def evaluate_full(pos: Position) -> int:
+    return evaluate(pos) + mobility(pos) + pawn_structure(pos)
+
+
+def evaluate_relative(pos: Position) -> int:
+    score = evaluate(pos)
+    return score if pos.turn == WHITE else -score
@@ -1,38 +1,99 @@
 import pygame as pg
+import time
 from sortedcontainers import SortedSet
+from typing import Optional, TextIO, Union
 import utility
-from game_objects import Board, Text, Clickable
+import assets
+import pgn
+import position
+from analysis import Analysis, Analyzer
+from engine import Engine
+from parallel import ParallelSearch
+from replay import ReplayLog, DEFAULT_INTERVAL
+from tablebase import Tablebase, WIN, DRAW
+from transposition import TranspositionTable
+from game_objects import Board, Cell, Text, Clickable
+from spatial import ColliderGrid
+from profiler import profiler, TOGGLE_KEY, EXPORT_KEY
+
+# posted by analysis threads so a loop blocked on events wakes up to collect their results
+ANALYSIS_READY = pg.event.custom_type()
 
 
 class GameSession:
-    def __init__(self) -> None:
+    def __init__(self, fps: Optional[int] = None, dirty_rects: bool = True,
+                 engines: Optional[dict] = None, fen: str = position.START_FEN,
+                 pgn_path: str = 'games.pgn', trace_path: str = 'trace.json',
+                 analysis: bool = False, analysis_time: float = 1.0, tablebase: Optional[Tablebase] = None,
+                 replay: Optional[ReplayLog] = None, replay_interval: int = DEFAULT_INTERVAL) -> None:
         pg.init()
         pg.font.init()
         self.__colliders = SortedSet(key=lambda x: x.layer)
+        # cells are found from board coordinates, everything else through the grid
+        self.__collider_grid = ColliderGrid()
         self.__window_size = (1200, 800)
         self.__surface = pg.display.set_mode(self.__window_size)
         pg.display.set_caption('Simple chess')
-        icon = 'resources/pawn.png'
-        icon = pg.image.load(icon).convert_alpha()
-        icon.fill(utility.BLACK, None, pg.BLEND_RGB_MULT)
-        pg.display.set_icon(icon)
+        pg.display.set_icon(assets.sprites.get('pawn', tint=utility.BLACK))
 
         self.quit_event = utility.GameEvent(event_type='quit')
+        self.quit_event += self.__export_trace
         self.quit_event += lambda: (pg.quit(), exit())
         self.update_event = utility.GameEvent(event_type='update')
         self.mouse_on_event = utility.GameEvent(event_type='mouse_collision')
         self.mouse_down_event = utility.GameEvent(event_type='mouse_collision_click')
+        self.move_event = utility.GameEvent(event_type='move')
+
+        self.__fps = fps
+        self.__dirty_mode = dirty_rects
+        self.__dirty = []
+        self.__full_redraw = True
+        self.__hovered = None
+        self.__pgn_path = pgn_path
+        self.__trace_path = trace_path
+        self.__analyzers = []
 
-        self.moves_count = 0
         diff = max(self.__window_size) - min(self.__window_size)
-        self.__player_b = Player(self, 'black')
-        self.__player_w = Player(self, 'white')
-        self.__board = Board(self, (diff / 2, 0), min(self.__window_size))
+        self.__player_b = self.__create_player('black', engines or {})
+        self.__player_w = self.__create_player('white', engines or {})
+        self.__board = Board(self, (diff / 2, 0), min(self.__window_size), fen, tablebase)
+        # every move and takeback is mirrored here, so any ply can be shown again without replaying the game
+        self.__replay_log = ReplayLog(self.__board.start_fen, replay_interval)
+        self.move_event += self.__record
         self.update_event += self.__player_w.update
         self.update_event += self.__player_b.update
+        self.move_event += self.__player_w._moved
+        self.move_event += self.__player_b._moved
+        self.__analysis_panel = AnalysisPanel(self, analysis_time, analysis)
+        self.__replay_viewer = ReplayViewer(self)
+        if replay is not None:
+            self.load_replay(replay)
+
+    def __create_player(self, player_type: str, engines: dict) -> 'Player':
+        if player_type in engines:
+            return EnginePlayer(self, player_type, engines[player_type])
+        return Player(self, player_type)
+
+    def add_analyzer(self, analyzer: Analyzer) -> None:
+        self.__analyzers.append(analyzer)
+
+    def wake(self) -> None:
+        # safe to call from any thread
+        if pg.display.get_init():
+            pg.event.post(pg.event.Event(ANALYSIS_READY))
 
     def add_collider(self, collider: Clickable) -> None:
         self.__colliders.add(collider)
+        if collider.__class__ != Cell:
+            self.__collider_grid.add(collider)
+
+    def remove_collider(self, collider: Clickable) -> None:
+        self.__colliders.discard(collider)
+        if collider in self.__collider_grid:
+            self.__collider_grid.remove(collider)
+        if collider is self.__hovered:
+            self.invalidate(collider.rect)
+            self.__hovered = None
 
     @property
     def board(self) -> Board:
@@ -48,7 +109,32 @@ class GameSession:
 
     @property
     def next_player(self) -> 'Player':
-        return self.__player_w if self.moves_count % 2 == 0 else self.__player_b
+        return self.player(self.__board.position.turn)
+
+    def player(self, side: int) -> 'Player':
+        return self.__player_w if side == position.WHITE else self.__player_b
+
+    @property
+    def analysis_panel(self) -> 'AnalysisPanel':
+        return self.__analysis_panel
+
+    @property
+    def replay_log(self) -> ReplayLog:
+        return self.__replay_log
+
+    @property
+    def replay_viewer(self) -> 'ReplayViewer':
+        return self.__replay_viewer
+
+    def __record(self) -> None:
+        self.__replay_log.sync(self.__board.start_fen, self.__board.history)
+
+    def load_replay(self, log: ReplayLog) -> None:
+        # plays the recorded game on the board and opens the viewer at its first position
+        self.__board.load_fen(log.start_fen)
+        for move in log.moves:
+            self.__board.play(move)
+        self.__replay_viewer.open(0)
 
     @property
     def window_size(self) -> tuple:
@@ -60,29 +146,144 @@ class GameSession:
 
     @property
     def colliders(self) -> SortedSet:
-        return self._colliders
+        return self.__colliders
+
+    def takeback(self) -> None:
+        if not self.__board.takeback():
+            return
+        # against the computer, undo its reply as well so the human is to move again
+        if isinstance(self.next_player, EnginePlayer) and not isinstance(self.next_player.opponent, EnginePlayer):
+            self.__board.takeback()
+
+    def write_pgn(self, out: TextIO) -> None:
+        names = {side: 'Computer' if isinstance(self.player(side), EnginePlayer) else 'Human'
+                 for side in (position.WHITE, position.BLACK)}
+        headers = {'Event': 'Simple chess', 'Date': time.strftime('%Y.%m.%d'),
+                   'White': names[position.WHITE], 'Black': names[position.BLACK]}
+        pgn.write_game(out, self.__board.history, headers, self.__board.start_fen)
+
+    def save_pgn(self, path: Optional[str] = None) -> None:
+        with open(path or self.__pgn_path, 'a', encoding='utf-8') as out:
+            self.write_pgn(out)
+
+    def toggle_profiler(self) -> None:
+        # the overlay region is repainted once more when hiding, so it disappears
+        self.invalidate(profiler.overlay_rect(self.__surface))
+        profiler.toggle()
+
+    def __export_trace(self) -> None:
+        if profiler.trace_size:
+            count = profiler.export(self.__trace_path)
+            print(f'wrote {count} trace events to {self.__trace_path}')
+
+    def invalidate(self, rect: Optional[pg.Rect] = None) -> None:
+        if rect is None:
+            self.__full_redraw = True
+        else:
+            self.__dirty.append(pg.Rect(rect))
 
     def start(self) -> None:
+        clock = pg.time.Clock()
+        self.__hover(pg.mouse.get_pos())
+        self.invalidate()
         while True:
-            self.__surface.fill(utility.BG)
-            for event in pg.event.get():
-                if event.type == pg.QUIT:
-                    self.quit_event()
-                elif event.type == pg.MOUSEBUTTONDOWN:
-                    r_colliders = reversed(self.__colliders)
-                    for collider in r_colliders:
-                        if collider.rect.collidepoint(pg.mouse.get_pos()):
-                            self.mouse_down_event(collider)
-                            break
-
-            self.update_event()
-
-            r_colliders = reversed(self.__colliders)
-            for collider in r_colliders:
-                if collider.rect.collidepoint(pg.mouse.get_pos()):
-                    self.mouse_on_event(collider)
-                    break
-            pg.display.flip()
+            if self.__dirty_mode and self.__fps is None and not self.__dirty and not self.__full_redraw:
+                events = [pg.event.wait()] + pg.event.get()
+            else:
+                events = pg.event.get()
+            profiler.begin_frame()
+            with profiler.span('events'):
+                for event in events:
+                    self.__dispatch(event)
+            with profiler.span('analysis'):
+                for analyzer in self.__analyzers:
+                    analyzer.dispatch()
+
+            with profiler.span('render'):
+                if not self.__dirty_mode:
+                    self.__surface.fill(utility.BG)
+                    self.update_event()
+                    if self.__hovered:
+                        self.mouse_on_event(self.__hovered)
+                    profiler.draw(self.__surface)
+                    pg.display.flip()
+                elif self.__dirty or self.__full_redraw:
+                    self.__render_dirty()
+
+            with profiler.span('play'):
+                self.next_player.play()
+            profiler.end_frame()
+
+            if self.__fps:
+                clock.tick(self.__fps)
+            elif profiler.enabled:
+                # the overlay repaints itself every frame, so cap the rate instead of spinning
+                self.invalidate(profiler.overlay_rect(self.__surface))
+                clock.tick(60)
+
+    def __dispatch(self, event: pg.event.Event) -> None:
+        if self.__replay_viewer.shown and self.__replay_viewer.handle(event):
+            return
+        if event.type == pg.QUIT:
+            self.quit_event()
+        elif event.type == pg.VIDEORESIZE:
+            assets.sprites.invalidate()
+            self.__board.invalidate_background()
+            self.invalidate()
+        elif event.type == pg.VIDEOEXPOSE:
+            self.invalidate()
+        elif event.type == pg.MOUSEMOTION:
+            self.__hover(event.pos)
+        elif event.type == pg.KEYDOWN and (event.key == pg.K_BACKSPACE
+                                           or (event.key == pg.K_z and event.mod & pg.KMOD_CTRL)):
+            self.takeback()
+        elif event.type == pg.KEYDOWN and event.key == pg.K_s and event.mod & pg.KMOD_CTRL:
+            self.save_pgn()
+        elif event.type == pg.KEYDOWN and event.key == pg.K_h:
+            self.__analysis_panel.toggle()
+        elif event.type == pg.KEYDOWN and event.key == pg.K_r:
+            self.__replay_viewer.toggle()
+        elif event.type == pg.KEYDOWN and event.key == TOGGLE_KEY:
+            self.toggle_profiler()
+        elif event.type == pg.KEYDOWN and event.key == EXPORT_KEY:
+            self.__export_trace()
+        elif event.type == pg.MOUSEBUTTONDOWN:
+            collider = self.__collider_at(event.pos)
+            if collider:
+                self.mouse_down_event(collider)
+
+    def __collider_at(self, pos: tuple) -> Optional[Clickable]:
+        collider = self.__collider_grid.at(pos)
+        cell = self.__board.cell_at_point(pos)
+        if cell and (collider is None or cell.layer > collider.layer):
+            return cell
+        return collider
+
+    def __hover(self, pos: tuple) -> None:
+        collider = self.__collider_at(pos)
+        if collider is self.__hovered:
+            return
+        if self.__hovered:
+            self.invalidate(self.__hovered.rect)
+        if collider:
+            self.invalidate(collider.rect)
+        self.__hovered = collider
+
+    def __render_dirty(self) -> None:
+        rects = [self.__surface.get_rect()] if self.__full_redraw else self.__dirty
+        self.__dirty = []
+        self.__full_redraw = False
+
+        # everything inside the clip is repainted from the background up, so
+        # translucent overlays never blend twice over stale pixels
+        self.__surface.set_clip(rects[0].unionall(rects[1:]))
+        self.__surface.fill(utility.BG)
+        self.update_event()
+        if self.__hovered:
+            self.mouse_on_event(self.__hovered)
+        profiler.draw(self.__surface)
+        self.__surface.set_clip(None)
+        pg.display.update(rects)
 
 
 class Player:
@@ -93,64 +294,95 @@ class Player:
         self.__player_type = player_type
         self.__defeated_figures = {}
         self.__gs = gs
+        self.__drawn = []
 
     @property
     def player_type(self) -> str:
         return self.__player_type
 
+    @property
+    def side(self) -> int:
+        return position.COLOR_NAMES.index(self.__player_type)
+
+    @property
+    def opponent(self) -> 'Player':
+        return self.__gs.player(self.side ^ 1)
+
     def update(self) -> None:
+        self.__drawn = self.__layout()
+        for surface, rect in self.__drawn:
+            self.__gs.canvas.blit(surface, rect)
+
+    def play(self) -> None:
+        pass
+
+    def _moved(self) -> None:
+        for _, rect in self.__drawn + self.__layout():
+            self.__gs.invalidate(rect)
+
+    def __layout(self) -> list:
+        items = []
         w_size = self.__gs.window_size
         if w_size[0] - 150 <= w_size[1]:
-            return
+            return items
 
         if self == self.__gs.next_player:
             t_size = 20
             pos = (10, 10)
             turn_text = Text(f"{self.player_type.capitalize()}'s turn", t_size, pos, self.color)
-            self.__gs.canvas.blit(turn_text.surface, turn_text.rect)
+            items.append((turn_text.surface, turn_text.rect))
 
-        other_player = self.__gs.player_black if self == self.__gs.player_white else self.__gs.player_white
-        if self.__gs.board.get_king(self).is_mated:
+        other_player = self.opponent
+        status = self.__gs.board.status if self == self.__gs.next_player else position.ONGOING
+        if status == position.CHECKMATE:
             t_size = 48
             pos = (self.__gs.window_size[0] / 2, self.__gs.window_size[1] / 2)
             turn_text = Text(f'Player {other_player.player_type.capitalize()} wins!', t_size, pos, other_player.color)
             rect = turn_text.rect.move(-turn_text.rect.size[0] / 2, -turn_text.rect.size[1] / 2)
-            self.__gs.canvas.blit(turn_text.surface, rect)
+            items.append((turn_text.surface, rect))
 
-        elif self.__gs.board.get_king(self).is_checked:
+        elif status in (position.STALEMATE, position.REPETITION, position.FIFTY_MOVES):
+            t_size = 48
+            pos = (self.__gs.window_size[0] / 2, self.__gs.window_size[1] / 2)
+            message = {position.STALEMATE: 'Stalemate!', position.REPETITION: 'Draw by repetition!',
+                       position.FIFTY_MOVES: 'Draw by fifty-move rule!'}[status]
+            turn_text = Text(message, t_size, pos, self.color)
+            rect = turn_text.rect.move(-turn_text.rect.size[0] / 2, -turn_text.rect.size[1] / 2)
+            items.append((turn_text.surface, rect))
+
+        elif status == position.CHECK:
             t_size = 48
             pos = (self.__gs.window_size[0] / 2, self.__gs.window_size[1] / 2)
             turn_text = Text(f'King was attacked!', t_size, pos, self.color)
             rect = turn_text.rect.move(-turn_text.rect.size[0] / 2, -turn_text.rect.size[1] / 2)
-            self.__gs.canvas.blit(turn_text.surface, rect)
+            items.append((turn_text.surface, rect))
 
         size_y = 200
-        position = (10, 100)
+        panel_pos = (10, 100)
 
         if self.player_type == 'white':
-            position = (position[0], self.__gs.window_size[1] - size_y - position[1])
+            panel_pos = (panel_pos[0], self.__gs.window_size[1] - size_y - panel_pos[1])
 
         figures = ['Pawn', 'Bishop', 'Knight', 'Rook', 'Queen']
         im_bias = size_y / len(figures) * 0.1
         size_x = (size_y - (im_bias * (len(figures) - 1) + im_bias / len(figures))) / len(figures)
         im_size = (size_x, size_x)
 
-        x, y = position
+        x, y = panel_pos
         for i in range(0, len(figures)):
-            image = 'resources/' + figures[i].lower() + '.png'
-            image = pg.image.load(image).convert_alpha()
-            image = pg.transform.scale(image, im_size)
-            image.fill(other_player.color, None, pg.BLEND_RGB_MULT)
+            image = assets.sprites.get(figures[i].lower(), im_size, other_player.color)
             rect = image.get_rect().move(x, y)
             text_size = 18
             text_pos = rect.midright
             text_pos = (text_pos[0], text_pos[1] - text_size / 2)
             text = Text(f': {self.get_defeated(figures[i])}', text_size, text_pos, other_player.color)
 
-            self.__gs.canvas.blit(image, rect)
-            self.__gs.canvas.blit(text.surface, text.rect)
+            items.append((image, rect))
+            items.append((text.surface, text.rect))
             y += im_size[1] + im_bias
 
+        return items
+
     @property
     def color(self) -> tuple:
         return utility.WHITE if self.__player_type == 'white' else utility.BLACK
@@ -164,8 +396,274 @@ class Player:
         else:
             self.__defeated_figures[figure] += 1
 
+    def remove_defeated(self, figure: str) -> None:
+        if not self.get_defeated(figure):
+            raise RuntimeError()
+        self.__defeated_figures[figure] -= 1
+
+    def clear_defeated(self) -> None:
+        self.__defeated_figures = {}
+
     def get_defeated(self, figure: str):
         if figure not in self.__defeated_figures:
             return 0
 
         return self.__defeated_figures[figure]
+
+
+class EnginePlayer(Player):
+    def __init__(self, gs: GameSession, player_type: str, engine: Union[Engine, ParallelSearch]) -> None:
+        super().__init__(gs, player_type)
+        self.__gs = gs
+        self.__engine = engine
+        # the search runs on the analyzer's thread, the move is played here once it reports back
+        self.__analyzer = Analyzer(engine, gs.wake)
+        self.__analyzer.result_event += self._analysed
+        self.__pending = None
+        gs.add_analyzer(self.__analyzer)
+
+    @property
+    def engine(self) -> Union[Engine, ParallelSearch]:
+        return self.__engine
+
+    @property
+    def thinking(self) -> bool:
+        return self.__pending is not None
+
+    def play(self) -> None:
+        board = self.__gs.board
+        if board.status in position.GAME_OVER or self.__pending is not None or board.replaying:
+            return
+        # a table lookup is instant, no need to hand it to the search thread
+        move = board.tablebase_move()
+        if move is not None:
+            board.play(move)
+            return
+        self.__pending = self.__analyzer.submit(board.position)
+
+    def _moved(self) -> None:
+        super()._moved()
+        if self.__pending is not None:
+            self.__analyzer.cancel()
+            self.__pending = None
+
+    def _analysed(self, analysis: Analysis) -> None:
+        if not analysis.final or analysis.generation != self.__pending:
+            return
+        self.__pending = None
+        # a move found while the game is being reviewed is searched again once the review ends
+        if analysis.move and analysis.key == self.__gs.board.position.key and not self.__gs.board.replaying:
+            self.__gs.board.play(analysis.move)
+
+
+class AnalysisPanel:
+    def __init__(self, gs: GameSession, time_limit: float, shown: bool = False) -> None:
+        self.__gs = gs
+        self.__time_limit = time_limit
+        self.__analyzer = None
+        self.__analysis = None
+        self.__drawn = []
+        self.__shown = False
+        gs.update_event += self.update
+        gs.move_event += self._moved
+        if shown:
+            self.toggle()
+
+    @property
+    def shown(self) -> bool:
+        return self.__shown
+
+    @property
+    def analysis(self) -> Optional[Analysis]:
+        return self.__analysis
+
+    def toggle(self) -> None:
+        self.__shown = not self.__shown
+        if self.__analyzer is None:
+            engine = Engine(time_limit=self.__time_limit, table=TranspositionTable(8),
+                            tablebase=self.__gs.board.tablebase)
+            self.__analyzer = Analyzer(engine, self.__gs.wake)
+            self.__analyzer.result_event += self._analysed
+            self.__gs.add_analyzer(self.__analyzer)
+        self._moved()
+
+    def update(self) -> None:
+        self.__drawn = self.__layout()
+        for surface, rect in self.__drawn:
+            self.__gs.canvas.blit(surface, rect)
+
+    def _moved(self) -> None:
+        # a new position makes the running analysis stale, the analyzer drops its results
+        self.__analysis = None
+        if self.__analyzer is not None:
+            if self.__shown:
+                self.__analyzer.submit(self.__gs.board.position)
+            else:
+                self.__analyzer.cancel()
+        self.__invalidate()
+
+    def _analysed(self, analysis: Analysis) -> None:
+        self.__analysis = analysis
+        self.__invalidate()
+
+    def __invalidate(self) -> None:
+        for _, rect in self.__drawn + self.__layout():
+            self.__gs.invalidate(rect)
+
+    def __layout(self) -> list:
+        w_size = self.__gs.window_size
+        if not self.__shown or w_size[0] - 150 <= w_size[1]:
+            return []
+        lines = ['Analysis (H hides)']
+        endgame = self.__gs.board.endgame()
+        if endgame is not None and endgame.wdl == DRAW:
+            lines.append('Tablebase: draw')
+        elif endgame is not None:
+            winner = self.__gs.board.position.turn ^ (endgame.wdl != WIN)
+            lines.append(f'Tablebase: {position.COLOR_NAMES[winner]} mates in {(endgame.dtm + 1) // 2}')
+        analysis = self.__analysis
+        if analysis and analysis.key == self.__gs.board.position.key:
+            check = '  check' if analysis.status == position.CHECK else ''
+            lines.append(f'{analysis.score_text}  depth {analysis.depth}{check}')
+            pos = self.__gs.board.position.copy()
+            sans = []
+            for move in analysis.pv[:4]:
+                sans.append(pgn.san(pos, move))
+                pos.make_move(move)
+            if sans:
+                lines.append(' '.join(sans))
+        else:
+            lines.append('thinking...')
+
+        items = []
+        x, y = 10, 360
+        for line in lines:
+            text = Text(line, 16, (x, y), utility.WHITE)
+            items.append((text.surface, text.rect))
+            y += 22
+        return items
+
+
+class ReplayViewer:
+    def __init__(self, gs: GameSession) -> None:
+        self.__gs = gs
+        self.__ply = 0
+        self.__last_move = ''
+        self.__shown = False
+        self.__dragging = False
+        self.__drawn = []
+        gs.update_event += self.update
+        gs.move_event += self._moved
+
+    @property
+    def shown(self) -> bool:
+        return self.__shown
+
+    @property
+    def ply(self) -> int:
+        return self.__ply
+
+    def toggle(self) -> None:
+        if self.__shown:
+            self.close()
+        else:
+            self.open()
+
+    def open(self, ply: Optional[int] = None) -> None:
+        self.__shown = True
+        self.seek(self.__gs.replay_log.plies if ply is None else ply)
+
+    def close(self) -> None:
+        self.__shown = False
+        self.__dragging = False
+        self.__gs.board.end_replay()
+        self.__invalidate()
+
+    def seek(self, ply: int) -> None:
+        log = self.__gs.replay_log
+        ply = max(0, min(ply, log.plies))
+        with profiler.span('replay.seek', 'replay'):
+            pos = log.seek(max(ply - 1, 0))
+            self.__last_move = ''
+            if ply:
+                # the position before the last move is needed for its notation anyway
+                move = log.move(ply)
+                self.__last_move = pgn.san(pos, move)
+                pos.make_move(move)
+            self.__gs.board.show(pos)
+        self.__ply = ply
+        self.__invalidate()
+
+    def handle(self, event: pg.event.Event) -> bool:
+        # arrows step a ply, page keys a keyframe interval, and the bar can be clicked or dragged
+        log = self.__gs.replay_log
+        if event.type == pg.KEYDOWN:
+            steps = {pg.K_LEFT: -1, pg.K_RIGHT: 1, pg.K_PAGEUP: -log.interval, pg.K_PAGEDOWN: log.interval,
+                     pg.K_HOME: -log.plies, pg.K_END: log.plies}
+            if event.key in steps:
+                self.seek(self.__ply + steps[event.key])
+                return True
+            if event.key == pg.K_ESCAPE:
+                self.close()
+                return True
+            return False
+        if event.type == pg.MOUSEBUTTONDOWN and event.button == 1 and self.__bar_rect().collidepoint(event.pos):
+            self.__dragging = True
+            self.__scrub(event.pos[0])
+            return True
+        if event.type == pg.MOUSEMOTION and self.__dragging:
+            self.__scrub(event.pos[0])
+            return True
+        if event.type == pg.MOUSEBUTTONUP and self.__dragging:
+            self.__dragging = False
+            return True
+        return False
+
+    def __scrub(self, x: int) -> None:
+        bar = self.__bar_rect()
+        ply = round((x - bar.left) / bar.width * self.__gs.replay_log.plies)
+        if ply != self.__ply:
+            self.seek(ply)
+
+    def update(self) -> None:
+        self.__drawn = self.__layout()
+        for surface, rect in self.__drawn:
+            self.__gs.canvas.blit(surface, rect)
+
+    def _moved(self) -> None:
+        # a move or takeback on the board puts the game back on the cells, which ends the review
+        if self.__shown and not self.__gs.board.replaying:
+            self.__shown = False
+            self.__dragging = False
+        self.__invalidate()
+
+    def __invalidate(self) -> None:
+        for _, rect in self.__drawn + self.__layout():
+            self.__gs.invalidate(rect)
+
+    def __bar_rect(self) -> pg.Rect:
+        left = int(self.__gs.board.rect.right) + 10
+        return pg.Rect(left, 430, self.__gs.window_size[0] - left - 10, 14)
+
+    def __layout(self) -> list:
+        w_size = self.__gs.window_size
+        if not self.__shown or w_size[0] - 150 <= w_size[1]:
+            return []
+        plies = self.__gs.replay_log.plies
+        bar = self.__bar_rect()
+        lines = ['Replay (R returns)', f'ply {self.__ply} of {plies}  {self.__last_move}',
+                 'arrows, PgUp/PgDn, Home/End']
+
+        items = []
+        x, y = bar.left, 360
+        for line in lines:
+            text = Text(line, 16, (x, y), utility.WHITE)
+            items.append((text.surface, text.rect))
+            y += 22
+        surface = pg.Surface(bar.size)
+        surface.fill(utility.BROWN)
+        done = round(bar.width * self.__ply / plies) if plies else bar.width
+        surface.fill(utility.PALE, (0, 0, done, bar.height))
+        surface.fill(utility.YELLOW, (min(done, bar.width - 4), 0, 4, bar.height))
+        items.append((surface, bar))
+        return items
@@ -1,8 +1,11 @@
 from pygame import Surface, Rect
 import utility
+import assets
+import position
 from figures import *
+from tablebase import Tablebase, Probe
 from abc import abstractmethod, ABC
-from typing import NoReturn, Any, Type, Union
+from typing import NoReturn, Any, Optional, Type, Union
 
 _Figure = Type[Union[None, Pawn, Rook, Bishop, Knight, Queen, King]]
 
@@ -34,8 +37,7 @@ class Clickable(ABC):
 
 class Text:
     def __init__(self, text: str, size: int, pos: tuple = (0, 0), color: tuple = utility.WHITE) -> None:
-        font = pg.font.SysFont('Arial', size, True)
-        self.__ts = font.render(text, True, color)
+        self.__ts = assets.texts.render(text, size, color)
         self.__rect = self.__ts.get_rect().move(pos[0], pos[1])
 
     @property
@@ -48,8 +50,7 @@ class Text:
 
 
 class Cell(Clickable):
-    def __init__(self, gs: 'GameSession', size: int, board: 'Board',
-                 board_pos: tuple, figure: _Figure) -> None:
+    def __init__(self, gs: 'GameSession', size: int, board: 'Board', board_pos: tuple) -> None:
         rect = Rect((board_pos[0] * size + board.start_pos[0],
                      board_pos[1] * size + board.start_pos[1]), (size,) * 2)
         self.__board = board
@@ -59,12 +60,8 @@ class Cell(Clickable):
         self.__figure = None
         self.__board_pos = board_pos
         self.__labels = []
-        player = gs.player_white if board_pos[1] >= self.__board.size / 2 else gs.player_black
-        if figure is not None:
-            self.__figure = figure(self, player)
-        image = pg.image.load('resources/empty.png')
-        self.__image = pg.transform.scale(image, self.rect.size)
-        self.__image.fill(self.color, None, pg.BLEND_RGB_MULT)
+        self.sync_figure()
+        self.__image = assets.sprites.get('empty', self.rect.size, self.color)
 
     def add_label(self, label: str, position: str = 'top_left',
                   size: int = 15, bias: int = 5, color: tuple = utility.WHITE) -> None:
@@ -93,41 +90,65 @@ class Cell(Clickable):
 
     @figure.setter
     def figure(self, value) -> None:
+        if value:
+            value.move_to(self)
         self.__figure = value
 
-    def draw(self) -> None:
-        self.canvas.blit(self.__image, self.rect)
+    def sync_figure(self) -> bool:
+        return self.show_piece(self.__board.position.get(self.__board_pos))
+
+    def show_piece(self, piece: int) -> bool:
+        if not piece:
+            changed = self.__figure is not None
+            self.__figure = None
+        elif not self.__figure or self.__figure.piece != piece:
+            player = self.__gs.player(position.piece_color(piece))
+            self.__figure = FIGURE_TYPES[position.piece_kind(piece)](self, player)
+            changed = True
+        else:
+            changed = False
+        return changed
+
+    def draw_background(self, surface: Surface, offset: tuple = (0, 0)) -> None:
+        surface.blit(self.__image, self.rect.move(offset))
         for label in self.__labels:
-            self.canvas.blit(label.surface, label.rect)
+            surface.blit(label.surface, label.rect.move(offset))
+
+    def draw_figure(self) -> None:
         if self.__figure:
             self.canvas.blit(self.__figure.image, self.__figure.rect)
 
+    def draw(self) -> None:
+        self.draw_background(self.canvas)
+        self.draw_figure()
+
 
 class Board:
     __field: list[list[Cell]]
 
-    def __init__(self, gs: 'GameSession', start_pos: tuple, size: int) -> None:
+    def __init__(self, gs: 'GameSession', start_pos: tuple, size: int, fen: str = position.START_FEN,
+                 tablebase: Optional[Tablebase] = None) -> None:
         self.__cell_labels_text = list(map(lambda x: (x[0], x[1]), 'A1 B2 C3 D4 E5 F6 G7 H8'.split(' ')))
         self.__gs = gs
         self.__start_pos = start_pos
-        self.__start_set = [
-            [Rook,    Pawn, None, None, None, None, Pawn,    Rook],
-            [Knight,  Pawn, None, None, None, None, Pawn,  Knight],
-            [Bishop,  Pawn, None, None, None, None, Pawn,  Bishop],
-            [Queen,   Pawn, None, None, None, None, Pawn,   Queen],
-            [King,    Pawn, None, None, None, None, Pawn,    King],
-            [Bishop,  Pawn, None, None, None, None, Pawn,  Bishop],
-            [Knight,  Pawn, None, None, None, None, Pawn,  Knight],
-            [Rook,    Pawn, None, None, None, None, Pawn,    Rook]
-        ]
-
-        self.__cells_count = len(self.__start_set)
+        self.__position = position.Position.from_fen(fen)
+        self.__start_fen = self.__position.fen()
+        self.__status = self.__position.status()
+        self.__tablebase = tablebase
+        # (position key, probe) of the last classified position
+        self.__endgame = (None, None)
+        # figures of the game itself, put aside while the cells show a replayed position
+        self.__replay_figures = None
+
+        self.__cells_count = position.SIZE
         self.__cell_size = round(size / self.__cells_count)
         self.__field = [[] for _ in range(self.__cells_count)]
+        # squares and labels never change during a game, so they are rendered once into this
+        self.__background = None
 
         for i in range(self.__cells_count):
             for j in range(self.__cells_count):
-                cell = Cell(gs, self.__cell_size, self, (i, j), self.__start_set[i][j])
+                cell = Cell(gs, self.__cell_size, self, (i, j))
                 if i == 0:
                     cell.add_label(self.__cell_labels_text[j][0])
                 if j == 0:
@@ -139,6 +160,8 @@ class Board:
         gs.mouse_down_event += self._mouse_down
         self.__selected_cell = None
         self.__markers = set()
+        # (move, moved figure, captured figure) for every played move, newest last
+        self.__history = []
 
     @property
     def colors(self) -> tuple:
@@ -156,24 +179,121 @@ class Board:
     def game_session(self) -> 'GameSession':
         return self.__gs
 
-    def get_king(self, player: 'Player') -> King:
+    @property
+    def position(self) -> position.Position:
+        return self.__position
+
+    @property
+    def status(self) -> str:
+        return self.__status
+
+    @property
+    def history(self) -> tuple:
+        return tuple(move for move, _, _ in self.__history)
+
+    @property
+    def start_fen(self) -> str:
+        return self.__start_fen
+
+    def fen(self) -> str:
+        return self.__position.fen()
+
+    @property
+    def replaying(self) -> bool:
+        return self.__replay_figures is not None
+
+    def show(self, pos: 'position.Position') -> int:
+        # shows pos instead of the game; only cells whose piece differs get a figure and a repaint
+        if self.__replay_figures is None:
+            self.__clear_selection()
+            self.__replay_figures = [cell.figure for row in self.__field for cell in row]
+        changed = 0
+        for row in self.__field:
+            for cell in row:
+                if cell.show_piece(pos.get(cell.board_pos)):
+                    self.__gs.invalidate(cell.rect)
+                    changed += 1
+        return changed
+
+    def end_replay(self) -> None:
+        if self.__replay_figures is None:
+            return
+        figures = iter(self.__replay_figures)
+        self.__replay_figures = None
+        for row in self.__field:
+            for cell in row:
+                figure = next(figures)
+                if cell.figure is not figure:
+                    cell.figure = figure
+                    self.__gs.invalidate(cell.rect)
+
+    @property
+    def tablebase(self) -> Optional[Tablebase]:
+        return self.__tablebase
+
+    def endgame(self) -> Optional[Probe]:
+        # the tablebase verdict for the side to move, None outside the tables
+        if self.__tablebase is None or self.__status in position.GAME_OVER:
+            return None
+        key = self.__position.key
+        if self.__endgame[0] != key:
+            self.__endgame = (key, self.__tablebase.probe(self.__position))
+        return self.__endgame[1]
+
+    def tablebase_move(self) -> Optional['position.Move']:
+        if self.endgame() is None:
+            return None
+        return self.__tablebase.best_move(self.__position)
+
+    @property
+    def rect(self) -> Rect:
+        return Rect(self.__start_pos, (self.__cell_size * self.__cells_count,) * 2)
+
+    def invalidate_background(self) -> None:
+        # after a resize or a colour theme change
+        self.__background = None
+        self.__gs.invalidate(self.rect)
+
+    def __render_background(self) -> Surface:
+        rect = self.rect
+        background = Surface(rect.size).convert()
         for row in self.__field:
             for cell in row:
-                fig = cell.figure
-                if fig and fig.__class__ == King and fig.player == player:
-                    return cell.figure
-        raise RuntimeError()
+                cell.draw_background(background, (-rect.left, -rect.top))
+        return background
+
+    def load_fen(self, fen: str) -> None:
+        new_position = position.Position.from_fen(fen)
+        self.__clear_selection()
+        self.__replay_figures = None
+        self.__position = new_position
+        self.__start_fen = new_position.fen()
+        self.__history = []
+        self.__status = new_position.status()
+        for row in self.__field:
+            for cell in row:
+                cell.sync_figure()
+        for side in (position.WHITE, position.BLACK):
+            self.__gs.player(side).clear_defeated()
+        self.__gs.invalidate()
+        self.__gs.move_event()
+
+    def get_king(self, player: 'Player') -> King:
+        king = self.get(position.coords(self.__position.king_square(player.side))).figure
+        if king.__class__ != King:
+            raise RuntimeError()
+        return king
+
+    def cell_at_point(self, point: tuple) -> Union[Cell, None]:
+        x = (point[0] - self.__start_pos[0]) // self.__cell_size
+        y = (point[1] - self.__start_pos[1]) // self.__cell_size
+        return self.get((int(x), int(y)))
 
     def get(self, pos: tuple) -> Union[Cell, None]:
         if 0 <= pos[0] < self.__cells_count and 0 <= pos[1] < self.__cells_count:
             return self.__field[pos[0]][pos[1]]
         return None
 
-    def get_from_start_set(self, pos: tuple) -> _Figure:
-        if 0 <= pos[0] < self.__cells_count and 0 <= pos[1] < self.__cells_count:
-            return self.__start_set[pos[0]][pos[1]]
-        return None
-
     @staticmethod
     def _mouse_on(collider: Clickable) -> None:
         if collider.__class__ != Cell:
@@ -184,8 +304,9 @@ class Board:
         collider.canvas.blit(surf, collider.rect.topleft)
 
     def _mouse_down(self, collider: Clickable) -> None:
-        if collider.__class__ != Cell or collider == self.__selected_cell:
+        if collider.__class__ != Cell or collider == self.__selected_cell or self.replaying:
             return
+        old_selected, old_markers = self.__selected_cell, set(self.__markers)
 
         if collider and collider.figure and collider.figure.player == self.__gs.next_player:
             self.__selected_cell = collider
@@ -194,49 +315,122 @@ class Board:
         if self.__selected_cell and collider.board_pos in self.__markers:
             if self.__selected_cell.figure.__class__ is Pawn and (collider.board_pos[1] == 0
                                                                   or collider.board_pos[1] == self.size - 1):
-                self.move_figure(self.__selected_cell, collider, Queen)
-            elif self.__selected_cell.figure.__class__ is King:
-                def move_rook(rook_type: str) -> None:
-                    rook_types = ['left', 'right']
-                    if rook_type not in rook_types:
-                        raise RuntimeError()
-                    move = (-4, -1) if rook_type == 'left' else (3, 1)
-                    rook_cell = self.get((self.__selected_cell.board_pos[0] + move[0],
-                                          self.__selected_cell.board_pos[1]))
-                    new_rook_cell = self.get((self.__selected_cell.board_pos[0] + move[1],
-                                              self.__selected_cell.board_pos[1]))
-                    self.move_figure(rook_cell, new_rook_cell)
-                    self.__selected_cell.figure.moves_count += 1
-
-                if collider.board_pos[0] - self.__selected_cell.board_pos[0] > 1:
-                    move_rook('right')
-                elif collider.board_pos[0] - self.__selected_cell.board_pos[0] < -1:
-                    move_rook('left')
+                fig_type = Queen
+            else:
+                fig_type = None
             self.__markers.clear()
 
-            self.move_figure(self.__selected_cell, collider)
-            self.__gs.moves_count += 1
+            self.move_figure(self.__selected_cell, collider, fig_type)
 
         if not collider.figure:
             self.__markers.clear()
         self.__selected_cell = collider
+        self.__invalidate_selection(old_selected, old_markers)
+        self.__invalidate_selection(self.__selected_cell, self.__markers)
+
+    def __invalidate_selection(self, selected: Union[Cell, None], markers: set) -> None:
+        if selected:
+            self.__gs.invalidate(selected.rect)
+        for marker in markers:
+            self.__gs.invalidate(self.get(marker).rect)
+
+    def __clear_selection(self) -> None:
+        self.__invalidate_selection(self.__selected_cell, self.__markers)
+        self.__selected_cell = None
+        self.__markers = set()
+
+    def __cell_at(self, sq: int) -> Cell:
+        return self.get(position.coords(sq))
+
+    def play(self, move: 'position.Move') -> None:
+        self.__clear_selection()
+        fig_type = FIGURE_TYPES[move.promotion] if move.promotion else None
+        self.move_figure(self.get(position.coords(move.start)), self.get(position.coords(move.end)), fig_type)
 
     def move_figure(self, old_cell: 'Cell', new_cell: 'Cell', fig_type=None) -> None:
+        # a move is always made on the game, not on a replayed position
+        self.end_replay()
         if not old_cell.figure:
             return
-        if new_cell.figure:
-            player = self.__gs.next_player
-            player.add_defeated(str(new_cell.figure))
+        promotion = fig_type.kind if fig_type else 0
+        move = self.__position.find_move(position.square(old_cell.board_pos),
+                                         position.square(new_cell.board_pos), promotion)
+        if move is None:
+            return
 
-        fig = old_cell.figure.__class__ if not fig_type else fig_type
-        new_cell.figure = fig(new_cell, old_cell.figure.player, old_cell.figure.moves_count)
-        old_cell.figure = None
-        new_cell.figure.moves_count += 1
+        # figure objects travel between cells, only a promotion creates a new one
+        captured = None
+        captured_pos = self.__position.captured_square(move)
+        if captured_pos is not None:
+            captured_cell = self.__cell_at(captured_pos)
+            captured, captured_cell.figure = captured_cell.figure, None
+            self.__gs.next_player.add_defeated(str(captured))
+            self.__gs.invalidate(captured_cell.rect)
+
+        figure, old_cell.figure = old_cell.figure, None
+        figure.moves_count += 1
+        if move.promotion:
+            new_cell.figure = FIGURE_TYPES[move.promotion](new_cell, figure.player, figure.moves_count)
+        else:
+            new_cell.figure = figure
+        rook = self.__position.castling_rook(move)
+        if rook:
+            self.__shift_figure(*rook, 1)
+
+        self.__position.make_move(move)
+        self.__history.append((move, figure, captured))
+        self.__moved(old_cell, new_cell)
+
+    def takeback(self) -> bool:
+        if not self.__history:
+            return False
+        self.end_replay()
+        self.__clear_selection()
+        move, figure, captured = self.__history.pop()
+        self.__position.undo_move()
+
+        old_cell, new_cell = self.__cell_at(move.start), self.__cell_at(move.end)
+        new_cell.figure = None
+        old_cell.figure = figure
+        figure.moves_count -= 1
+        if captured:
+            # the captured figure still remembers its square, which differs from the target for en passant
+            captured_cell = self.get(captured.position)
+            captured_cell.figure = captured
+            self.__gs.next_player.remove_defeated(str(captured))
+            self.__gs.invalidate(captured_cell.rect)
+        rook = self.__position.castling_rook(move)
+        if rook:
+            self.__shift_figure(rook[1], rook[0], -1)
+
+        self.__moved(old_cell, new_cell)
+        return True
+
+    def __shift_figure(self, start: int, end: int, moves: int) -> None:
+        start_cell, end_cell = self.__cell_at(start), self.__cell_at(end)
+        figure, start_cell.figure = start_cell.figure, None
+        end_cell.figure = figure
+        figure.moves_count += moves
+        self.__gs.invalidate(start_cell.rect)
+        self.__gs.invalidate(end_cell.rect)
+
+    def __moved(self, old_cell: Cell, new_cell: Cell) -> None:
+        self.__status = self.__position.status()
+        self.__gs.invalidate(old_cell.rect)
+        self.__gs.invalidate(new_cell.rect)
+        self.__gs.move_event()
 
     def _update(self) -> None:
+        canvas = self.__gs.canvas
+        clip = canvas.get_clip()
+        if self.__background is None:
+            self.__background = self.__render_background()
+        # one blit for the whole board, the canvas clip limits it to the dirty region
+        canvas.blit(self.__background, self.rect)
         for row in self.__field:
             for cell in row:
-                cell.draw()
+                if cell.figure and cell.rect.colliderect(clip):
+                    cell.draw_figure()
 
         if self.__selected_cell:
             if self.__selected_cell.figure and self.__selected_cell.figure.player == self.__gs.next_player:
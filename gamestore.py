@@ -0,0 +1,184 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+from array import array
+from typing import Any, Iterable, Iterator, NamedTuple, Union
+import pgn
+from position import Position, Move, PACKED_SIZE
+
+# index file: a header, then one fixed-width record per game pointing into the moves file,
+# which holds nothing but 16-bit packed moves, game after game
+_MAGIC = b'SCHSTORE'
+_VERSION = 1
+_HEADER = struct.Struct('<8sII')
+_RECORD = struct.Struct(f'<{PACKED_SIZE}sQIB3x')
+_MOVE_BYTES = 2
+
+
+class StoredGame(NamedTuple):
+    start: memoryview
+    moves: memoryview
+    result: str
+
+    @property
+    def position(self) -> Position:
+        return Position.unpack(self.start)
+
+    def move_list(self) -> list:
+        return [Move.unpack(value) for value in self.moves]
+
+
+class GameStoreWriter:
+    def __init__(self, path: str, append: bool = False) -> None:
+        mode = 'ab' if append and os.path.exists(path + '.idx') else 'wb'
+        self.__index = open(path + '.idx', mode)
+        self.__moves = open(path + '.mov', mode)
+        if mode == 'wb':
+            self.__index.write(_HEADER.pack(_MAGIC, _VERSION, _RECORD.size))
+        self.__offset = self.__moves.tell() // _MOVE_BYTES
+        self.__count = (self.__index.tell() - _HEADER.size) // _RECORD.size
+
+    def __enter__(self) -> 'GameStoreWriter':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def add(self, start: Union[Position, str], moves: Iterable[Move], result: str = '*') -> int:
+        start = Position.from_fen(start) if isinstance(start, str) else start
+        packed = array('H', (move.pack() for move in moves))
+        if sys.byteorder != 'little':
+            packed.byteswap()
+        self.__moves.write(packed.tobytes())
+        self.__index.write(_RECORD.pack(start.pack(), self.__offset, len(packed), pgn.RESULTS.index(result)))
+        self.__offset += len(packed)
+        self.__count += 1
+        return self.__count - 1
+
+    def close(self) -> None:
+        self.__index.close()
+        self.__moves.close()
+
+
+class GameStore:
+    def __init__(self, path: str) -> None:
+        self.__files = [open(path + '.idx', 'rb'), open(path + '.mov', 'rb')]
+        # an empty file can't be mapped, but an empty bytes object slices the same way
+        self.__index, self.__moves = (mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                                      if os.fstat(file.fileno()).st_size else b'' for file in self.__files)
+        magic, version, record_size = _HEADER.unpack_from(self.__index)
+        if magic != _MAGIC or version != _VERSION or record_size != _RECORD.size:
+            raise RuntimeError(f'not a game store: {path}')
+        self.__count = (len(self.__index) - _HEADER.size) // _RECORD.size
+        self.__index_view = memoryview(self.__index)
+        self.__move_view = memoryview(self.__moves).cast('H') if sys.byteorder == 'little' else None
+
+    def __enter__(self) -> 'GameStore':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.__count
+
+    def __getitem__(self, n: int) -> StoredGame:
+        if not 0 <= n < self.__count:
+            raise IndexError(n)
+        record = _HEADER.size + n * _RECORD.size
+        offset, count, result = _RECORD.unpack_from(self.__index, record)[1:]
+        # views into the mapping, nothing is copied until a caller asks for objects
+        start = self.__index_view[record:record + PACKED_SIZE]
+        if self.__move_view is not None:
+            moves = self.__move_view[offset:offset + count]
+        else:
+            moves = array('H', self.__moves[offset * _MOVE_BYTES:(offset + count) * _MOVE_BYTES])
+            moves.byteswap()
+            moves = memoryview(moves)
+        return StoredGame(start, moves, pgn.RESULTS[result])
+
+    def __iter__(self) -> Iterator[StoredGame]:
+        for n in range(self.__count):
+            yield self[n]
+
+    def positions(self, n: int) -> Iterator[Position]:
+        # one position is updated in place and yielded before every move and after the last
+        game = self[n]
+        pos = game.position
+        yield pos
+        for value in game.moves:
+            pos._make(Move.unpack(value))
+            yield pos
+
+    def close(self) -> None:
+        self.__index_view.release()
+        if self.__move_view is not None:
+            self.__move_view.release()
+        for mapping in (self.__index, self.__moves):
+            if isinstance(mapping, mmap.mmap):
+                try:
+                    mapping.close()
+                except BufferError:
+                    # games handed out earlier still view it; it unmaps once the last one is gone
+                    pass
+        for file in self.__files:
+            file.close()
+
+
+def import_pgn(pgn_path: str, store_path: str, append: bool = False) -> tuple:
+    games = errors = 0
+    with GameStoreWriter(store_path, append) as writer:
+        for game in pgn.open_games(pgn_path):
+            start = Position.from_fen(game.fen)
+            try:
+                moves = list(game.replay())
+            except RuntimeError as error:
+                errors += 1
+                print(f'skipping game {games + errors}: {error}')
+                continue
+            writer.add(start, moves, game.result if game.result in pgn.RESULTS else '*')
+            games += 1
+    return games, errors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Build and read binary game stores')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('import', help='convert a PGN file')
+    build.add_argument('pgn')
+    build.add_argument('store')
+    build.add_argument('--append', action='store_true')
+    show = commands.add_parser('show', help='print game N as PGN')
+    show.add_argument('store')
+    show.add_argument('n', type=int)
+    scan = commands.add_parser('scan', help='replay every position and report speed')
+    scan.add_argument('store')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == 'import':
+        games, errors = import_pgn(args.pgn, args.store, args.append)
+        print(f'games {games}  errors {errors}  {time.perf_counter() - start:.2f} s')
+    elif args.command == 'show':
+        with GameStore(args.store) as store:
+            game = store[args.n]
+            pgn.write_game(sys.stdout, game.move_list(), {'Round': args.n + 1}, game.position.fen(), game.result)
+    else:
+        games = positions = 0
+        with GameStore(args.store) as store:
+            for n in range(len(store)):
+                games += 1
+                positions += sum(1 for _ in store.positions(n))
+        elapsed = time.perf_counter() - start
+        print(f'games {games}  positions {positions}  {elapsed:.2f} s  '
+              f'{positions / elapsed if elapsed else 0:.0f} positions/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,57 @@
+import argparse
+from book import OpeningBook
+from engine import Engine, MAX_PLY
+from parallel import ParallelSearch
+from position import START_FEN
+from tablebase import Tablebase
+from transposition import TranspositionTable
 from game import GameSession
+from profiler import profiler
+from replay import ReplayLog, DEFAULT_INTERVAL
 
 
 def main() -> None:
-    gs = GameSession()
+    parser = argparse.ArgumentParser(description='Simple chess')
+    parser.add_argument('--engine', choices=['white', 'black'], action='append', default=[],
+                        help='let the computer play this side (may be given twice)')
+    parser.add_argument('--think-time', type=float, default=2.0, help='engine seconds per move')
+    parser.add_argument('--depth', type=int, default=None, help='engine depth limit')
+    parser.add_argument('--hash', type=float, default=16, help='transposition table size in MB')
+    parser.add_argument('--workers', type=int, default=1, help='search processes per engine side')
+    parser.add_argument('--book', default=None, help='opening book the computer plays from')
+    parser.add_argument('--tablebases', default=None, help='directory of endgame tables the computer plays from')
+    parser.add_argument('--fen', default=START_FEN, help='start from this position')
+    parser.add_argument('--pgn', default='games.pgn', help='file that Ctrl+S appends the game to')
+    parser.add_argument('--analysis', action='store_true', help='show background analysis (H toggles)')
+    parser.add_argument('--analysis-time', type=float, default=1.0, help='analysis seconds per position')
+    parser.add_argument('--profile', action='store_true', help='start with the profiling overlay shown (F3 toggles)')
+    parser.add_argument('--trace', default='trace.json', help='file that F4 and quitting write the profiling trace to')
+    parser.add_argument('--fps', type=int, default=None, help='frame cap instead of waiting for events')
+    parser.add_argument('--replay', default=None, help='review a replay log or the first game of a PGN file (R toggles)')
+    parser.add_argument('--replay-interval', type=int, default=DEFAULT_INTERVAL,
+                        help='plies between keyframes of the move log')
+    args = parser.parse_args()
+
+    book = OpeningBook(args.book) if args.book else None
+    tablebase = Tablebase(args.tablebases) if args.tablebases else None
+    if args.workers > 1:
+        engines = {side: ParallelSearch(args.workers, args.depth or MAX_PLY, args.think_time, args.hash, book,
+                                        tablebase)
+                   for side in args.engine}
+    else:
+        # both sides search the same game, so they share one table
+        table = TranspositionTable(args.hash)
+        engines = {side: Engine(args.depth or MAX_PLY, args.think_time, table, book=book, tablebase=tablebase)
+                   for side in args.engine}
+    if args.profile:
+        profiler.enabled = True
+    replay = None
+    if args.replay:
+        replay = (ReplayLog.from_pgn(args.replay, interval=args.replay_interval) if args.replay.endswith('.pgn')
+                  else ReplayLog.load(args.replay))
+    gs = GameSession(fps=args.fps, engines=engines, fen=args.fen, pgn_path=args.pgn, trace_path=args.trace,
+                     analysis=args.analysis, analysis_time=args.analysis_time, tablebase=tablebase,
+                     replay=replay, replay_interval=args.replay_interval)
     gs.start()
 
 
@@ -0,0 +1,156 @@
+import argparse
+import multiprocessing
+import time
+from typing import Any, Callable, Optional
+from book import OpeningBook
+from engine import Engine, SearchResult, MATE, MAX_PLY, tablebase_score
+from position import Position, Move, START_FEN
+from tablebase import Tablebase
+from transposition import TranspositionTable, table_bytes
+
+_engine = None
+# seconds between checks for a stop while the workers search
+_WAIT_SLICE = 0.05
+
+
+def _init_worker(memory: Any, stop_flag: Any) -> None:
+    global _engine
+    _engine = Engine(table=TranspositionTable(buffer=memoryview(memory)), stop_flag=stop_flag)
+
+
+def _search_move(task: tuple) -> tuple:
+    # one root move at one depth; earlier depths are already in the shared table
+    state, packed_move, depth, age = task
+    result = _engine.search(Position.from_bytes(state), depth, root_moves=[Move.unpack(packed_move)],
+                            min_depth=depth, age=age)
+    return result.score, result.nodes, tuple(move.pack() for move in result.pv)
+
+
+class ParallelSearch:
+    def __init__(self, workers: Optional[int] = None, max_depth: int = MAX_PLY,
+                 time_limit: Optional[float] = None, hash_mb: float = 64,
+                 book: Optional[OpeningBook] = None, tablebase: Optional[Tablebase] = None) -> None:
+        self.max_depth = max_depth
+        self.time_limit = time_limit
+        # only this process reads the book and the tables, the workers search without them
+        self.book = book
+        self.tablebase = tablebase
+        self.__workers = workers or multiprocessing.cpu_count()
+        # one table for all workers, so subtrees that transpose into each other share results
+        self.__memory = multiprocessing.RawArray('B', table_bytes(hash_mb))
+        # this process only ages it, once per search, and hands the age to every task
+        self.__table = TranspositionTable(buffer=memoryview(self.__memory))
+        self.__stop_flag = multiprocessing.Event()
+        self.__pool = multiprocessing.Pool(self.__workers, _init_worker, (self.__memory, self.__stop_flag))
+
+    def __enter__(self) -> 'ParallelSearch':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def workers(self) -> int:
+        return self.__workers
+
+    def stop(self) -> None:
+        self.__stop_flag.set()
+
+    def close(self) -> None:
+        self.__stop_flag.set()
+        self.__pool.terminate()
+        self.__pool.join()
+
+    def search(self, pos: Position, max_depth: Optional[int] = None, time_limit: Optional[float] = None,
+               on_iteration: Optional[Callable[[SearchResult], None]] = None, cancel: Any = None) -> SearchResult:
+        if self.book is not None:
+            move = self.book.choose(pos)
+            if move is not None:
+                return SearchResult(move, 0, 0, 0, 0.0, (move,))
+        if self.tablebase is not None:
+            probe = self.tablebase.probe(pos)
+            move = self.tablebase.best_move(pos) if probe is not None else None
+            if move is not None:
+                return SearchResult(move, tablebase_score(probe, 0), 0, 0, 0.0, (move,))
+        max_depth = min(max_depth or self.max_depth, MAX_PLY)
+        time_limit = self.time_limit if time_limit is None else time_limit
+        start = time.perf_counter()
+        self.__stop_flag.clear()
+        self.__table.new_search()
+
+        moves = pos.legal_moves()
+        result = SearchResult(moves[0] if moves else None, 0, 0, 0, 0.0, ())
+        if len(moves) < 2 or (cancel is not None and cancel.is_set()):
+            return result
+        state = pos.to_bytes()
+        nodes = 0
+        for depth in range(1, max_depth + 1):
+            # every root move is searched with a full window, one task each, at the same depth
+            pending = self.__pool.map_async(_search_move, [(state, move.pack(), depth, self.__table.age)
+                                                            for move in moves], chunksize=1)
+            # the time limit never cuts the first iteration, so there is a move to return, but a stop does;
+            # waiting in slices lets a stop from another thread through
+            deadline = None if depth == 1 or time_limit is None else start + time_limit
+            while not pending.ready() and not self.__stop_flag.is_set() \
+                    and not (cancel is not None and cancel.is_set()):
+                remaining = _WAIT_SLICE if deadline is None else deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                pending.wait(min(remaining, _WAIT_SLICE))
+            if not pending.ready():
+                self.__stop_flag.set()
+                nodes += sum(task_nodes for _, task_nodes, _ in pending.get())
+                break
+            scores = pending.get()
+            nodes += sum(task_nodes for _, task_nodes, _ in scores)
+
+            # best score first, ties keep the previous order; the scores themselves can vary from run to
+            # run, the workers read each other's table entries in whatever order they get there
+            ranked = sorted(range(len(moves)), key=lambda i: -scores[i][0])
+            best_score, _, pv = scores[ranked[0]]
+            moves = [moves[i] for i in ranked]
+            elapsed = time.perf_counter() - start
+            result = SearchResult(moves[0], best_score, depth, nodes, elapsed, tuple(map(Move.unpack, pv)))
+            if on_iteration:
+                on_iteration(result)
+            if abs(best_score) >= MATE - MAX_PLY:
+                break
+            if time_limit is not None and elapsed * 2 > time_limit:
+                break
+        return result._replace(nodes=nodes, elapsed=time.perf_counter() - start)
+
+
+def benchmark(pos: Position, depth: int, worker_counts: list) -> list:
+    rows = []
+    for workers in worker_counts:
+        with ParallelSearch(workers) as search:
+            result = search.search(pos, depth)
+        rows.append((workers, result))
+        speedup = rows[0][1].elapsed / result.elapsed if result.elapsed else 0.0
+        print(f'workers {workers:>3}  bestmove {result.move.uci}  score {result.score:>6}  nodes {result.nodes:>9}  '
+              f'{result.elapsed:7.2f} s  {result.nps:>8.0f} nps  speedup {speedup:.2f}x')
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Search a position on several processes')
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--depth', type=int, default=None, help='depth limit, 4 for --bench')
+    parser.add_argument('--time', type=float, default=5.0, help='time limit in seconds, ignored by --bench')
+    parser.add_argument('--workers', type=int, nargs='+', default=[multiprocessing.cpu_count()],
+                        help='worker processes; several counts with --bench')
+    parser.add_argument('--bench', action='store_true', help='report speedup for each worker count at --depth')
+    args = parser.parse_args()
+
+    pos = Position.from_fen(args.fen)
+    if args.bench:
+        benchmark(pos, args.depth or 4, args.workers)
+        return
+    with ParallelSearch(args.workers[0], args.depth or MAX_PLY, args.time) as search:
+        result = search.search(pos, on_iteration=print)
+    print(f'bestmove {result.move.uci if result.move else "none"}  depth {result.depth}  '
+          f'nodes {result.nodes}  {result.nps:.0f} nps')
+
+
+if __name__ == '__main__':
+    main()
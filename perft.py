@@ -0,0 +1,109 @@
+import argparse
+import time
+from typing import Optional
+from position import Position, START_FEN
+
+# (name, FEN, expected node counts for depth 1, 2, ...)
+SUITE = (
+    ('start', START_FEN, (20, 400, 8902, 197281, 4865609)),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     (48, 2039, 97862, 4085603)),
+    ('rook endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1', (14, 191, 2812, 43238, 674624)),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1', (6, 264, 9467, 422333)),
+    ('mirrored castling', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8', (44, 1486, 62379, 2103487)),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     (46, 2079, 89890, 3894594)),
+    ('illegal en passant 1', '3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1', (18, 92, 1670, 10138, 185429, 1134888)),
+    ('illegal en passant 2', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1', (13, 102, 1266, 10276, 135655, 1015133)),
+    ('en passant gives check', '8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1', (15, 126, 1928, 13931, 206379, 1440467)),
+    ('castling gives check', '5k2/8/8/8/8/8/8/4K2R w K - 0 1', (15, 66, 1198, 6399, 120330, 661072)),
+    ('long castling gives check', '3k4/8/8/8/8/8/8/R3K3 w Q - 0 1', (16, 71, 1286, 7418, 141077, 803711)),
+    ('castling rights', 'r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1', (26, 1141, 27826, 1274206)),
+    ('castling prevented', 'r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1', (44, 1494, 50509, 1720476)),
+    ('promote out of check', '2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1', (11, 133, 1442, 19174, 266199, 3821001)),
+    ('discovered check', '8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1', (29, 165, 5160, 31961, 1004658)),
+    ('promote to give check', '4k3/1P6/8/8/8/8/K7/8 w - - 0 1', (9, 40, 472, 2661, 38983, 217342)),
+    ('underpromote to give check', '8/P1k5/K7/8/8/8/8/8 w - - 0 1', (6, 27, 273, 1329, 18135, 92683)),
+    ('self stalemate', 'K1k5/8/P7/8/8/8/8/8 w - - 0 1', (2, 6, 13, 63, 382, 2217)),
+    ('stalemate and checkmate 1', '8/k1P5/8/1K6/8/8/8/8 w - - 0 1', (10, 25, 268, 926, 10857, 43261, 567584)),
+    ('stalemate and checkmate 2', '8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1', (37, 183, 6559, 23527)),
+)
+
+
+def perft(pos: Position, depth: int) -> int:
+    if depth == 0:
+        return 1
+    moves = pos.legal_moves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        undo = pos._make(move)
+        nodes += perft(pos, depth - 1)
+        pos._unmake(move, undo)
+    return nodes
+
+
+def divide(pos: Position, depth: int) -> dict:
+    result = {}
+    for move in pos.legal_moves():
+        undo = pos._make(move)
+        result[move.uci] = perft(pos, depth - 1)
+        pos._unmake(move, undo)
+    return result
+
+
+def timed_perft(pos: Position, depth: int) -> tuple:
+    start = time.perf_counter()
+    nodes = perft(pos, depth)
+    elapsed = time.perf_counter() - start
+    return nodes, elapsed, nodes / elapsed if elapsed > 0 else 0.0
+
+
+def run_suite(max_depth: Optional[int] = None, max_nodes: Optional[int] = None) -> bool:
+    passed = True
+    total_nodes, total_time = 0, 0.0
+    for name, fen, expected in SUITE:
+        for depth, expected_nodes in enumerate(expected, 1):
+            if (max_depth is not None and depth > max_depth) or (max_nodes is not None and expected_nodes > max_nodes):
+                break
+            nodes, elapsed, nps = timed_perft(Position.from_fen(fen), depth)
+            ok = nodes == expected_nodes
+            passed = passed and ok
+            total_nodes += nodes
+            total_time += elapsed
+            print(f'{name:28} depth {depth}  nodes {nodes:>9}  expected {expected_nodes:>9}  '
+                  f'{"ok" if ok else "FAIL"}  {elapsed:7.2f} s  {nps:>9.0f} nps')
+    print(f'{"total":28} nodes {total_nodes}  {total_time:.2f} s  '
+          f'{total_nodes / total_time if total_time else 0:.0f} nps  {"passed" if passed else "FAILED"}')
+    return passed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Count move generation leaf nodes')
+    parser.add_argument('depth', type=int, nargs='?', default=4)
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--divide', action='store_true', help='print node counts per root move')
+    parser.add_argument('--suite', action='store_true', help='run the reference positions up to depth')
+    parser.add_argument('--max-nodes', type=int, default=None, help='skip suite entries above this count')
+    args = parser.parse_args()
+
+    if args.suite:
+        raise SystemExit(0 if run_suite(args.depth, args.max_nodes) else 1)
+
+    pos = Position.from_fen(args.fen)
+    if args.divide:
+        start = time.perf_counter()
+        result = divide(pos, args.depth)
+        elapsed = time.perf_counter() - start
+        for move, nodes in sorted(result.items()):
+            print(f'{move}: {nodes}')
+        nodes = sum(result.values())
+        print(f'moves {len(result)}  nodes {nodes}  {elapsed:.2f} s  {nodes / elapsed if elapsed else 0:.0f} nps')
+    else:
+        nodes, elapsed, nps = timed_perft(pos, args.depth)
+        print(f'depth {args.depth}  nodes {nodes}  {elapsed:.2f} s  {nps:.0f} nps')
+
+
+if __name__ == '__main__':
+    main()
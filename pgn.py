@@ -0,0 +1,211 @@
+import argparse
+import re
+import textwrap
+import time
+from typing import Iterable, Iterator, NamedTuple, Optional, TextIO
+from position import Position, Move, START_FEN, WHITE, PAWN, KING, square_name, parse_square
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+SEVEN_TAGS = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+
+_PIECE_LETTERS = ' PNBRQK'
+_TAG = re.compile(r'\[\s*(\w+)\s*"((?:[^"\\]|\\.)*)"\s*\]')
+_TAGS = re.compile(r'(?:[ \t]*(?:\[[^\n]*|%[^\n]*)?\n)*')
+# a game ends where a blank line is followed by the next game's tags, as in export format
+_GAME_BREAK = re.compile(r'\n[ \t]*\n(?=[ \t]*\[)')
+_COMMENT = re.compile(r'\{[^}]*\}|;[^\n]*')
+_VARIATION = re.compile(r'\([^()]*\)')
+# move numbers, NAGs and results start with a digit or $, moves never do (except 0-0 castling)
+_SAN_TOKEN = re.compile(r'[a-hNBRQKO][^\s(){};$]*|0-0(?:-0)?')
+_RESULT_TOKEN = re.compile(r'(1-0|0-1|1/2-1/2|\*)\s*$')
+_SAN_MOVE = re.compile(r'([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?')
+
+
+class PgnGame(NamedTuple):
+    headers: dict
+    sans: tuple
+    result: str
+
+    @property
+    def fen(self) -> str:
+        return self.headers.get('FEN', START_FEN)
+
+    def replay(self, pos: Optional[Position] = None) -> Iterator[Move]:
+        # plays every move on pos and yields it afterwards, so pos is always the position after the move
+        pos = Position.from_fen(self.fen) if pos is None else pos
+        for text in self.sans:
+            move = parse_san(pos, text)
+            pos.make_move(move)
+            yield move
+
+
+def san(pos: Position, move: Move) -> str:
+    squares = pos.squares
+    piece = squares[move.start]
+    kind = piece & 7
+    capture = pos.captured_square(move) is not None
+    if pos.castling_rook(move):
+        text = 'O-O' if move.end > move.start else 'O-O-O'
+    elif kind == PAWN:
+        text = (square_name(move.start)[0] + 'x' if capture else '') + square_name(move.end)
+        if move.promotion:
+            text += '=' + _PIECE_LETTERS[move.promotion]
+    else:
+        start = square_name(move.start)
+        others = [square_name(other.start) for other in pos.legal_moves()
+                  if other.end == move.end and other.start != move.start and squares[other.start] == piece]
+        if not others or kind == KING:
+            prefix = ''
+        elif all(other[0] != start[0] for other in others):
+            prefix = start[0]
+        elif all(other[1] != start[1] for other in others):
+            prefix = start[1]
+        else:
+            prefix = start
+        text = _PIECE_LETTERS[kind] + prefix + ('x' if capture else '') + square_name(move.end)
+
+    undo = pos._make(move)
+    if pos.is_checked():
+        text += '+' if pos.has_legal_moves() else '#'
+    pos._unmake(move, undo)
+    return text
+
+
+def parse_san(pos: Position, text: str) -> Move:
+    text = text.rstrip('+#!?')
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        for move in pos.legal_moves():
+            if pos.castling_rook(move) and (move.end < move.start) == (len(text) == 5):
+                return move
+        raise RuntimeError(f'illegal move {text} in {pos.fen()}')
+
+    match = _SAN_MOVE.fullmatch(text)
+    if not match:
+        raise RuntimeError(f'invalid move: {text}')
+    letter, file, rank, target, promotion = match.groups()
+    kind = _PIECE_LETTERS.index(letter) if letter else PAWN
+    end = parse_square(target)
+    promotion = _PIECE_LETTERS.index(promotion) if promotion else 0
+    squares = pos.squares
+    found = None
+    for move in pos.legal_moves():
+        if move.end != end or squares[move.start] & 7 != kind or move.promotion != promotion:
+            continue
+        start = square_name(move.start)
+        if (file and start[0] != file) or (rank and start[1] != rank):
+            continue
+        if found:
+            raise RuntimeError(f'ambiguous move {text} in {pos.fen()}')
+        found = move
+    if found is None:
+        raise RuntimeError(f'illegal move {text} in {pos.fen()}')
+    return found
+
+
+def _game(text: str) -> PgnGame:
+    tags_end = _TAGS.match(text).end()
+    headers = {name: value.replace('\\"', '"').replace('\\\\', '\\')
+               for name, value in _TAG.findall(text, 0, tags_end)}
+    text = text[tags_end:]
+    if '{' in text or ';' in text:
+        text = _COMMENT.sub(' ', text)
+    while '(' in text:
+        # innermost variations first, until nested ones are gone too
+        text, count = _VARIATION.subn(' ', text)
+        if not count:
+            break
+    match = _RESULT_TOKEN.search(text)
+    result = match[1] if match else headers.get('Result', '*')
+    return PgnGame(headers, tuple(_SAN_TOKEN.findall(text)), result)
+
+
+def read_games(source: TextIO, block_size: int = 1 << 20) -> Iterator[PgnGame]:
+    # reads fixed size blocks and carries only the unfinished last game over, so memory stays flat
+    pending = ''
+    while True:
+        block = source.read(block_size)
+        pieces = _GAME_BREAK.split(pending + block)
+        pending = pieces.pop() if block else ''
+        game = ''
+        for piece in pieces:
+            game = game + '\n\n' + piece if game else piece
+            # a break inside an open comment is no break, so keep collecting until it closes
+            if '{' in game and game.count('{') > game.count('}'):
+                continue
+            if game.strip():
+                yield _game(game + '\n')
+            game = ''
+        if not block:
+            if game.strip():
+                yield _game(game + '\n')
+            return
+        if game:
+            pending = game + '\n\n' + pending
+
+
+def open_games(path: str) -> Iterator[PgnGame]:
+    with open(path, encoding='utf-8', errors='replace') as source:
+        yield from read_games(source)
+
+
+def write_game(out: TextIO, moves: Iterable[Move], headers: Optional[dict] = None,
+               fen: str = START_FEN, result: Optional[str] = None) -> None:
+    pos = Position.from_fen(fen)
+    tokens = []
+    for move in moves:
+        # a move number is glued to its move with a no-break space, so wrapping never splits them
+        if pos.turn == WHITE:
+            tokens.append(f'{pos.fullmove_number}.\xa0{san(pos, move)}')
+        elif not tokens:
+            tokens.append(f'{pos.fullmove_number}...\xa0{san(pos, move)}')
+        else:
+            tokens.append(san(pos, move))
+        pos.make_move(move)
+    result = result or pos.result()
+
+    tags = {'Event': '?', 'Site': '?', 'Date': '????.??.??', 'Round': '?', 'White': '?', 'Black': '?'}
+    tags.update(headers or {})
+    tags['Result'] = result
+    # readers expect SetUp right before FEN, whatever order the caller's headers had
+    tags.pop('SetUp', None)
+    tags.pop('FEN', None)
+    if fen != START_FEN:
+        tags['SetUp'] = '1'
+        tags['FEN'] = fen
+    for name in SEVEN_TAGS + tuple(name for name in tags if name not in SEVEN_TAGS):
+        value = str(tags[name]).replace('\\', '\\\\').replace('"', '\\"')
+        out.write(f'[{name} "{value}"]\n')
+    movetext = textwrap.fill(' '.join(tokens + [result]), 79, break_long_words=False,
+                             break_on_hyphens=False).replace('\xa0', ' ')
+    out.write(f'\n{movetext}\n\n')
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Read a PGN file and report parsing speed')
+    parser.add_argument('path')
+    parser.add_argument('--replay', action='store_true', help='also play every move through the rules')
+    parser.add_argument('--limit', type=int, default=None, help='stop after this many games')
+    args = parser.parse_args()
+
+    games = plies = errors = 0
+    start = time.perf_counter()
+    for game in open_games(args.path):
+        if args.limit is not None and games >= args.limit:
+            break
+        games += 1
+        if args.replay:
+            try:
+                for _ in game.replay():
+                    plies += 1
+            except RuntimeError as error:
+                errors += 1
+                print(f'game {games}: {error}')
+        else:
+            plies += len(game.sans)
+    elapsed = time.perf_counter() - start
+    print(f'games {games}  moves {plies}  errors {errors}  {elapsed:.2f} s  '
+          f'{games / elapsed if elapsed else 0:.0f} games/s  {plies / elapsed if elapsed else 0:.0f} moves/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,704 @@
+import struct
+from array import array
+from typing import Iterable, NamedTuple, Optional, Union
+import bitboard
+import zobrist
+from bitboard import BETWEEN, LINE, KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, FULL
+
+WHITE, BLACK = 0, 1
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(1, 7)
+
+COLOR_NAMES = ('white', 'black')
+KIND_NAMES = (None, 'Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King')
+
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+
+ONGOING, CHECK, CHECKMATE, STALEMATE = 'ongoing', 'check', 'checkmate', 'stalemate'
+REPETITION, FIFTY_MOVES = 'repetition', 'fifty moves'
+GAME_OVER = (CHECKMATE, STALEMATE, REPETITION, FIFTY_MOVES)
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+SIZE = 8
+
+# white pawns walk towards y == 0, black pawns towards y == SIZE - 1
+_PAWN_STEP = (-SIZE, SIZE)
+_PAWN_START_ROW = (SIZE - 2, 1)
+_PAWN_LAST_ROW = (0, SIZE - 1)
+_PROMOTIONS = (QUEEN, ROOK, BISHOP, KNIGHT)
+# occupied squares, their piece codes two per byte in square order, turn | castling << 1,
+# en passant square (0xFF for none), halfmove clock (capped at 255) and fullmove number
+_PACKED = struct.Struct('<Q16sBBBH3x')
+PACKED_SIZE = _PACKED.size
+_PIECE_LETTERS = ' pnbrqk'
+_CASTLING_LETTERS = ((WHITE_KINGSIDE, 'K'), (WHITE_QUEENSIDE, 'Q'), (BLACK_KINGSIDE, 'k'), (BLACK_QUEENSIDE, 'q'))
+
+
+class Move(NamedTuple):
+    start: int
+    end: int
+    promotion: int = 0
+
+    @property
+    def uci(self) -> str:
+        return square_name(self.start) + square_name(self.end) + _PIECE_LETTERS[self.promotion].strip()
+
+    def pack(self) -> int:
+        return self.start | self.end << 6 | self.promotion << 12
+
+    @classmethod
+    def unpack(cls, value: int) -> 'Move':
+        return cls(value & 0x3F, value >> 6 & 0x3F, value >> 12 & 0x7)
+
+    @classmethod
+    def from_uci(cls, text: str) -> 'Move':
+        if len(text) not in (4, 5):
+            raise RuntimeError(f'invalid move: {text}')
+        promotion = _PIECE_LETTERS.find(text[4]) if len(text) == 5 else 0
+        if promotion not in (0, KNIGHT, BISHOP, ROOK, QUEEN):
+            raise RuntimeError(f'invalid move: {text}')
+        return cls(parse_square(text[:2]), parse_square(text[2:4]), promotion)
+
+
+class CheckState(NamedTuple):
+    checkers: int
+    pinned: int
+    danger: int
+
+
+def make_piece(color: int, kind: int) -> int:
+    return kind | (color << 3)
+
+
+def piece_color(piece: int) -> int:
+    return piece >> 3
+
+
+def piece_kind(piece: int) -> int:
+    return piece & 7
+
+
+def square(pos: tuple) -> int:
+    return pos[1] * SIZE + pos[0]
+
+
+def coords(sq: int) -> tuple:
+    return sq % SIZE, sq // SIZE
+
+
+def on_board(pos: tuple) -> bool:
+    return 0 <= pos[0] < SIZE and 0 <= pos[1] < SIZE
+
+
+def square_name(sq: int) -> str:
+    x, y = coords(sq)
+    return 'abcdefgh'[x] + str(SIZE - y)
+
+
+def parse_square(name: str) -> int:
+    if len(name) != 2 or name[0] not in 'abcdefgh' or name[1] not in '12345678':
+        raise RuntimeError(f'invalid square: {name}')
+    return square(('abcdefgh'.index(name[0]), SIZE - int(name[1])))
+
+
+def between(a: int, b: int) -> tuple:
+    return tuple(bitboard.iterate(BETWEEN[a][b]))
+
+
+_CASTLING_MASK = [0xF] * (SIZE * SIZE)
+_CASTLING_MASK[square((4, 7))] = 0xF & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+_CASTLING_MASK[square((7, 7))] = 0xF & ~WHITE_KINGSIDE
+_CASTLING_MASK[square((0, 7))] = 0xF & ~WHITE_QUEENSIDE
+_CASTLING_MASK[square((4, 0))] = 0xF & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+_CASTLING_MASK[square((7, 0))] = 0xF & ~BLACK_KINGSIDE
+_CASTLING_MASK[square((0, 0))] = 0xF & ~BLACK_QUEENSIDE
+
+# (right, king start, king end, rook start, squares that must be empty, squares that must not be attacked)
+_CASTLINGS = (
+    ((WHITE_KINGSIDE, 60, 62, 63, 0b11 << 61, 0b111 << 60),
+     (WHITE_QUEENSIDE, 60, 58, 56, 0b111 << 57, 0b111 << 58)),
+    ((BLACK_KINGSIDE, 4, 6, 7, 0b11 << 5, 0b111 << 4),
+     (BLACK_QUEENSIDE, 4, 2, 0, 0b111 << 1, 0b111 << 2)),
+)
+
+
+class Position:
+    def __init__(self) -> None:
+        self.__squares = [0] * (SIZE * SIZE)
+        self.__pieces = ([0] * (KING + 1), [0] * (KING + 1))
+        self.__occupied = [0, 0]
+        self.__kings = [None, None]
+        self.__turn = WHITE
+        self.__castling = 0
+        self.__ep_square = None
+        self.__halfmove_clock = 0
+        self.__fullmove_number = 1
+        self.__key = 0
+        # the en passant part of the key, only hashed when the capture is actually available
+        self.__ep_key = 0
+        # keys of the positions before each move, for repetition detection
+        self.__keys = []
+        # (move, undo) pairs of the moves played through make_move, newest last
+        self.__stack = []
+        # derived per side data: attack maps, check states and legal moves, dropped on every change
+        self.__cache = None
+
+    @classmethod
+    def initial(cls) -> 'Position':
+        return cls.from_fen(START_FEN)
+
+    @classmethod
+    def from_fen(cls, fen: str) -> 'Position':
+        fields = fen.split()
+        if len(fields) < 4 or len(fields[0].split('/')) != SIZE:
+            raise RuntimeError(f'invalid FEN: {fen}')
+        pos = cls()
+        for y, row in enumerate(fields[0].split('/')):
+            x = 0
+            for char in row:
+                if char.isdigit():
+                    x += int(char)
+                    continue
+                kind = _PIECE_LETTERS.find(char.lower())
+                if kind < PAWN or x >= SIZE:
+                    raise RuntimeError(f'invalid FEN: {fen}')
+                pos.__set(square((x, y)), make_piece(WHITE if char.isupper() else BLACK, kind))
+                x += 1
+            if x != SIZE:
+                raise RuntimeError(f'invalid FEN: {fen}')
+        if fields[1] not in ('w', 'b') or pos.__kings[WHITE] is None or pos.__kings[BLACK] is None:
+            raise RuntimeError(f'invalid FEN: {fen}')
+        pos.__turn = WHITE if fields[1] == 'w' else BLACK
+        pos.__castling = sum(right for right, letter in _CASTLING_LETTERS if letter in fields[2])
+        pos.__ep_square = None if fields[3] == '-' else parse_square(fields[3])
+        pos.__halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+        pos.__fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        # one king a side, and the side that just moved can't have left its own in check
+        if any(bitboard.popcount(pos.__pieces[color][KING]) != 1 for color in (WHITE, BLACK)) \
+                or pos.is_checked(pos.__turn ^ 1):
+            raise RuntimeError(f'invalid FEN: {fen}')
+        pos.__rehash()
+        return pos
+
+    @classmethod
+    def from_placement(cls, pieces: Iterable[tuple], turn: int = WHITE) -> 'Position':
+        # (square, piece) pairs, no castling rights or en passant square; hashed once at the end
+        pos = cls()
+        for sq, piece in pieces:
+            pos.__set(sq, piece)
+        pos.__turn = turn
+        pos.__rehash()
+        return pos
+
+    @classmethod
+    def unpack(cls, data: Union[bytes, memoryview], offset: int = 0) -> 'Position':
+        occupied, codes, flags, ep_square, halfmove_clock, fullmove_number = _PACKED.unpack_from(data, offset)
+        pos = cls()
+        for i, sq in enumerate(bitboard.iterate(occupied)):
+            pos.__set(sq, codes[i >> 1] >> ((i & 1) << 2) & 0xF)
+        pos.__turn = flags & 1
+        pos.__castling = flags >> 1 & 0xF
+        pos.__ep_square = None if ep_square == 0xFF else ep_square
+        pos.__halfmove_clock = halfmove_clock
+        pos.__fullmove_number = fullmove_number
+        pos.__rehash()
+        return pos
+
+    def pack(self) -> bytes:
+        occupied = self.__occupied[WHITE] | self.__occupied[BLACK]
+        codes = bytearray(16)
+        for i, sq in enumerate(bitboard.iterate(occupied)):
+            if i >= 32:
+                raise RuntimeError('too many pieces to pack')
+            codes[i >> 1] |= self.__squares[sq] << ((i & 1) << 2)
+        return _PACKED.pack(occupied, bytes(codes), self.__turn | self.__castling << 1,
+                            0xFF if self.__ep_square is None else self.__ep_square,
+                            min(self.__halfmove_clock, 0xFF), self.__fullmove_number)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'Position':
+        if len(data) < PACKED_SIZE or (len(data) - PACKED_SIZE) % 8:
+            raise RuntimeError('invalid position state')
+        pos = cls.unpack(data)
+        pos.__keys = array('Q', data[PACKED_SIZE:]).tolist()
+        return pos
+
+    def to_bytes(self) -> bytes:
+        # the packed position plus the reversible tail of the key history, the only keys that can repeat
+        keys = self.__keys[max(len(self.__keys) - self.__halfmove_clock, 0):]
+        return self.pack() + array('Q', keys).tobytes()
+
+    def fen(self) -> str:
+        rows = []
+        for y in range(SIZE):
+            row, empty = '', 0
+            for x in range(SIZE):
+                piece = self.__squares[square((x, y))]
+                if not piece:
+                    empty += 1
+                    continue
+                if empty:
+                    row, empty = row + str(empty), 0
+                letter = _PIECE_LETTERS[piece & 7]
+                row += letter.upper() if piece >> 3 == WHITE else letter
+            rows.append(row + (str(empty) if empty else ''))
+        castling = ''.join(letter for right, letter in _CASTLING_LETTERS if self.__castling & right) or '-'
+        ep_square = '-' if self.__ep_square is None else square_name(self.__ep_square)
+        return ' '.join(('/'.join(rows), 'wb'[self.__turn], castling, ep_square,
+                         str(self.__halfmove_clock), str(self.__fullmove_number)))
+
+    def copy(self, history: bool = True) -> 'Position':
+        # without history the copy has no repetition keys or move stack, only the position itself
+        pos = Position()
+        pos.__squares = self.__squares.copy()
+        pos.__pieces = (self.__pieces[WHITE].copy(), self.__pieces[BLACK].copy())
+        pos.__occupied = self.__occupied.copy()
+        pos.__kings = self.__kings.copy()
+        pos.__turn = self.__turn
+        pos.__castling = self.__castling
+        pos.__ep_square = self.__ep_square
+        pos.__halfmove_clock = self.__halfmove_clock
+        pos.__fullmove_number = self.__fullmove_number
+        pos.__key = self.__key
+        pos.__ep_key = self.__ep_key
+        if history:
+            pos.__keys = self.__keys.copy()
+            pos.__stack = self.__stack.copy()
+        return pos
+
+    @property
+    def key(self) -> int:
+        return self.__key
+
+    @property
+    def squares(self) -> list:
+        return self.__squares
+
+    @property
+    def occupied(self) -> int:
+        return self.__occupied[WHITE] | self.__occupied[BLACK]
+
+    def pieces(self, color: int, kind: Optional[int] = None) -> int:
+        return self.__occupied[color] if kind is None else self.__pieces[color][kind]
+
+    @property
+    def turn(self) -> int:
+        return self.__turn
+
+    @turn.setter
+    def turn(self, value: int) -> None:
+        self.__turn = value
+        self.__rehash()
+
+    @property
+    def castling(self) -> int:
+        return self.__castling
+
+    @castling.setter
+    def castling(self, value: int) -> None:
+        self.__castling = value
+        self.__rehash()
+
+    @property
+    def ep_square(self) -> Optional[int]:
+        return self.__ep_square
+
+    @ep_square.setter
+    def ep_square(self, value: Optional[int]) -> None:
+        self.__ep_square = value
+        self.__rehash()
+
+    @property
+    def halfmove_clock(self) -> int:
+        return self.__halfmove_clock
+
+    @halfmove_clock.setter
+    def halfmove_clock(self, value: int) -> None:
+        self.__halfmove_clock = value
+
+    @property
+    def fullmove_number(self) -> int:
+        return self.__fullmove_number
+
+    @fullmove_number.setter
+    def fullmove_number(self, value: int) -> None:
+        self.__fullmove_number = value
+
+    def get(self, pos: Union[tuple, int]) -> int:
+        return self.__squares[pos if isinstance(pos, int) else square(pos)]
+
+    def put(self, pos: Union[tuple, int], piece: int) -> None:
+        self.__set(pos if isinstance(pos, int) else square(pos), piece)
+        self.__rehash()
+
+    def __set(self, sq: int, piece: int) -> None:
+        old = self.__squares[sq]
+        if old:
+            self.__pieces[old >> 3][old & 7] ^= 1 << sq
+            self.__occupied[old >> 3] ^= 1 << sq
+            if old & 7 == KING and self.__kings[old >> 3] == sq:
+                self.__kings[old >> 3] = None
+        self.__squares[sq] = piece
+        if piece:
+            self.__pieces[piece >> 3][piece & 7] |= 1 << sq
+            self.__occupied[piece >> 3] |= 1 << sq
+            if piece & 7 == KING:
+                self.__kings[piece >> 3] = sq
+
+    def king_square(self, color: int) -> int:
+        sq = self.__kings[color]
+        if sq is None:
+            raise RuntimeError()
+        return sq
+
+    def attackers_mask(self, sq: int, by_color: int, occupied: Optional[int] = None) -> int:
+        pieces = self.__pieces[by_color]
+        occupied = self.__occupied[WHITE] | self.__occupied[BLACK] if occupied is None else occupied
+        return ((PAWN_ATTACKS[by_color ^ 1][sq] & pieces[PAWN])
+                | (KNIGHT_ATTACKS[sq] & pieces[KNIGHT])
+                | (KING_ATTACKS[sq] & pieces[KING])
+                | (bitboard.rook_attacks(sq, occupied) & (pieces[ROOK] | pieces[QUEEN]))
+                | (bitboard.bishop_attacks(sq, occupied) & (pieces[BISHOP] | pieces[QUEEN])))
+
+    def is_attacked(self, sq: int, by_color: int) -> bool:
+        pieces = self.__pieces[by_color]
+        if PAWN_ATTACKS[by_color ^ 1][sq] & pieces[PAWN] or KNIGHT_ATTACKS[sq] & pieces[KNIGHT] \
+                or KING_ATTACKS[sq] & pieces[KING]:
+            return True
+        occupied = self.__occupied[WHITE] | self.__occupied[BLACK]
+        return bool(bitboard.rook_attacks(sq, occupied) & (pieces[ROOK] | pieces[QUEEN])
+                    or bitboard.bishop_attacks(sq, occupied) & (pieces[BISHOP] | pieces[QUEEN]))
+
+    def attackers(self, sq: int, by_color: int) -> list:
+        return list(bitboard.iterate(self.attackers_mask(sq, by_color)))
+
+    def attack_map(self, color: int, occupied: Optional[int] = None) -> int:
+        if occupied is None:
+            cache = self.__cached()
+            if cache[color] is None:
+                cache[color] = self.attack_map(color, self.__occupied[WHITE] | self.__occupied[BLACK])
+            return cache[color]
+        pieces = self.__pieces[color]
+        attacks = bitboard.pawn_attacks(pieces[PAWN], color)
+        for sq in bitboard.iterate(pieces[KNIGHT]):
+            attacks |= KNIGHT_ATTACKS[sq]
+        for sq in bitboard.iterate(pieces[BISHOP] | pieces[QUEEN]):
+            attacks |= bitboard.bishop_attacks(sq, occupied)
+        for sq in bitboard.iterate(pieces[ROOK] | pieces[QUEEN]):
+            attacks |= bitboard.rook_attacks(sq, occupied)
+        for sq in bitboard.iterate(pieces[KING]):
+            attacks |= KING_ATTACKS[sq]
+        return attacks
+
+    def check_state(self, color: Optional[int] = None) -> CheckState:
+        color = self.__turn if color is None else color
+        cache = self.__cached()
+        if cache[2 + color] is None:
+            king = self.king_square(color)
+            enemy = self.__pieces[color ^ 1]
+            own = self.__occupied[color]
+            other = self.__occupied[color ^ 1]
+            occupied = own | other
+            pinned = 0
+            snipers = ((bitboard.rook_attacks(king, other) & (enemy[ROOK] | enemy[QUEEN]))
+                       | (bitboard.bishop_attacks(king, other) & (enemy[BISHOP] | enemy[QUEEN])))
+            for sniper in bitboard.iterate(snipers):
+                blockers = BETWEEN[king][sniper] & occupied
+                if blockers and not blockers & (blockers - 1) and blockers & own:
+                    pinned |= blockers
+            cache[2 + color] = CheckState(self.attackers_mask(king, color ^ 1, occupied), pinned,
+                                          self.attack_map(color ^ 1, occupied ^ (1 << king)))
+        return cache[2 + color]
+
+    def is_checked(self, color: Optional[int] = None) -> bool:
+        return self.check_state(color).checkers != 0
+
+    def pseudo_moves_from(self, start: int) -> list:
+        piece = self.__squares[start]
+        if not piece:
+            return []
+        return self.__generate(piece >> 3, 1 << start, False)
+
+    def pseudo_moves(self, color: Optional[int] = None) -> list:
+        return self.__generate(self.__turn if color is None else color, FULL, False)
+
+    def legal_moves_from(self, start: int) -> list:
+        piece = self.__squares[start]
+        if not piece:
+            return []
+        return [move for move in self.__legal_moves(piece >> 3) if move.start == start]
+
+    def legal_moves(self, color: Optional[int] = None) -> list:
+        return self.__legal_moves(self.__turn if color is None else color).copy()
+
+    def has_legal_moves(self, color: Optional[int] = None) -> bool:
+        return len(self.__legal_moves(self.__turn if color is None else color)) > 0
+
+    def is_checkmate(self, color: Optional[int] = None) -> bool:
+        return self.is_checked(color) and not self.has_legal_moves(color)
+
+    def is_stalemate(self, color: Optional[int] = None) -> bool:
+        return not self.is_checked(color) and not self.has_legal_moves(color)
+
+    def repetitions(self) -> int:
+        keys = self.__keys
+        count = 0
+        # only positions since the last pawn move or capture, with the same side to move, can repeat
+        for i in range(len(keys) - 2, max(len(keys) - self.__halfmove_clock, 0) - 1, -2):
+            if keys[i] == self.__key:
+                count += 1
+        return count
+
+    def is_repetition(self, count: int = 3) -> bool:
+        return self.repetitions() + 1 >= count
+
+    def status(self) -> str:
+        if not self.has_legal_moves():
+            return CHECKMATE if self.is_checked() else STALEMATE
+        if self.is_repetition(3):
+            return REPETITION
+        if self.__halfmove_clock >= 100:
+            return FIFTY_MOVES
+        return CHECK if self.is_checked() else ONGOING
+
+    def result(self) -> str:
+        status = self.status()
+        if status == CHECKMATE:
+            return '0-1' if self.__turn == WHITE else '1-0'
+        return '1/2-1/2' if status in GAME_OVER else '*'
+
+    def find_move(self, start: int, end: int, promotion: int = 0) -> Optional[Move]:
+        for move in self.legal_moves_from(start):
+            if move.end == end and move.promotion in (0, promotion or QUEEN):
+                return move
+        return None
+
+    def captured_square(self, move: Move) -> Optional[int]:
+        squares = self.__squares
+        if squares[move.end]:
+            return move.end
+        piece = squares[move.start]
+        if piece & 7 == PAWN and move.end == self.__ep_square and (move.start - move.end) % SIZE:
+            return move.end - _PAWN_STEP[piece >> 3]
+        return None
+
+    def castling_rook(self, move: Move) -> Optional[tuple]:
+        start, end = move.start, move.end
+        if self.__squares[start] & 7 != KING or (end - start != 2 and start - end != 2):
+            return None
+        return (start + 3, start + 1) if end > start else (start - 4, start - 1)
+
+    @property
+    def move_stack(self) -> tuple:
+        return tuple(move for move, _ in self.__stack)
+
+    @property
+    def last_move(self) -> Optional[Move]:
+        return self.__stack[-1][0] if self.__stack else None
+
+    def make_move(self, move: Move) -> None:
+        self.__stack.append((move, self._make(move)))
+
+    def undo_move(self) -> Move:
+        if not self.__stack:
+            raise RuntimeError('no move to undo')
+        move, undo = self.__stack.pop()
+        self._unmake(move, undo)
+        return move
+
+    def _make(self, move: Move) -> tuple:
+        squares = self.__squares
+        start, end, promotion = move
+        piece = squares[start]
+        color = piece >> 3
+        kind = piece & 7
+        pieces = self.__pieces[color]
+        occupied = self.__occupied
+
+        captured = squares[end]
+        captured_sq = end if captured else None
+        if kind == PAWN and not captured and end == self.__ep_square and (start - end) % SIZE:
+            captured_sq = end - _PAWN_STEP[color]
+            captured = squares[captured_sq]
+        undo = (captured, captured_sq, self.__turn, self.__castling, self.__ep_square, self.__halfmove_clock,
+                self.__cache, self.__key, self.__ep_key)
+        self.__cache = None
+        self.__keys.append(self.__key)
+        keys = zobrist.PIECES
+        key = self.__key ^ self.__ep_key ^ zobrist.CASTLING[self.__castling]
+        if self.__turn == color:
+            key ^= zobrist.SIDE
+
+        if captured:
+            captured_bit = 1 << captured_sq
+            self.__pieces[color ^ 1][captured & 7] ^= captured_bit
+            occupied[color ^ 1] ^= captured_bit
+            squares[captured_sq] = 0
+            key ^= keys[captured][captured_sq]
+        move_bits = (1 << start) | (1 << end)
+        occupied[color] ^= move_bits
+        squares[start] = 0
+        if promotion:
+            pieces[PAWN] ^= 1 << start
+            pieces[promotion] ^= 1 << end
+            squares[end] = make_piece(color, promotion)
+        else:
+            pieces[kind] ^= move_bits
+            squares[end] = piece
+        key ^= keys[piece][start] ^ keys[squares[end]][end]
+        if kind == KING:
+            self.__kings[color] = end
+            if end - start == 2 or start - end == 2:
+                rook_start, rook_end = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+                rook_bits = (1 << rook_start) | (1 << rook_end)
+                pieces[ROOK] ^= rook_bits
+                occupied[color] ^= rook_bits
+                squares[rook_end], squares[rook_start] = squares[rook_start], 0
+                key ^= keys[squares[rook_end]][rook_start] ^ keys[squares[rook_end]][rook_end]
+
+        self.__castling &= _CASTLING_MASK[start] & _CASTLING_MASK[end]
+        self.__ep_square = (start + end) // 2 if kind == PAWN and abs(end - start) == 2 * SIZE else None
+        self.__halfmove_clock = 0 if kind == PAWN or captured else self.__halfmove_clock + 1
+        if color == BLACK:
+            self.__fullmove_number += 1
+        self.__turn = color ^ 1
+        self.__ep_key = self.__ep_hash()
+        self.__key = key ^ zobrist.CASTLING[self.__castling] ^ self.__ep_key
+        return undo
+
+    def _unmake(self, move: Move, undo: tuple) -> None:
+        squares = self.__squares
+        start, end, promotion = move
+        captured, captured_sq, self.__turn, self.__castling, self.__ep_square, self.__halfmove_clock, \
+            self.__cache, self.__key, self.__ep_key = undo
+        self.__keys.pop()
+        piece = squares[end]
+        color = piece >> 3
+        kind = piece & 7
+        pieces = self.__pieces[color]
+        occupied = self.__occupied
+
+        move_bits = (1 << start) | (1 << end)
+        occupied[color] ^= move_bits
+        squares[end] = 0
+        if promotion:
+            pieces[promotion] ^= 1 << end
+            pieces[PAWN] ^= 1 << start
+            squares[start] = make_piece(color, PAWN)
+        else:
+            pieces[kind] ^= move_bits
+            squares[start] = piece
+        if captured:
+            captured_bit = 1 << captured_sq
+            self.__pieces[color ^ 1][captured & 7] ^= captured_bit
+            occupied[color ^ 1] ^= captured_bit
+            squares[captured_sq] = captured
+        if kind == KING:
+            self.__kings[color] = start
+            if end - start == 2 or start - end == 2:
+                rook_start, rook_end = (start + 3, start + 1) if end > start else (start - 4, start - 1)
+                rook_bits = (1 << rook_start) | (1 << rook_end)
+                pieces[ROOK] ^= rook_bits
+                occupied[color] ^= rook_bits
+                squares[rook_start], squares[rook_end] = squares[rook_end], 0
+        if color == BLACK:
+            self.__fullmove_number -= 1
+
+    def __ep_hash(self) -> int:
+        ep_square = self.__ep_square
+        if ep_square is not None and PAWN_ATTACKS[self.__turn ^ 1][ep_square] & self.__pieces[self.__turn][PAWN]:
+            return zobrist.EP_FILE[ep_square % SIZE]
+        return 0
+
+    def __rehash(self) -> None:
+        key = 0
+        for sq, piece in enumerate(self.__squares):
+            if piece:
+                key ^= zobrist.PIECES[piece][sq]
+        if self.__turn == BLACK:
+            key ^= zobrist.SIDE
+        self.__ep_key = self.__ep_hash()
+        self.__key = key ^ zobrist.CASTLING[self.__castling] ^ self.__ep_key
+        self.__cache = None
+
+    def __cached(self) -> list:
+        if self.__cache is None:
+            self.__cache = [None] * 6
+        return self.__cache
+
+    def __legal_moves(self, color: int) -> list:
+        cache = self.__cached()
+        if cache[4 + color] is None:
+            cache[4 + color] = self.__generate(color, FULL, True)
+        return cache[4 + color]
+
+    def __generate(self, color: int, from_mask: int, legal: bool) -> list:
+        pieces = self.__pieces[color]
+        own = self.__occupied[color]
+        other = self.__occupied[color ^ 1]
+        occupied = own | other
+        king = self.__kings[color]
+        moves = []
+        append = moves.append
+
+        checkers = pinned = danger = 0
+        if legal and king is not None:
+            checkers, pinned, danger = self.check_state(color)
+
+        if king is not None and from_mask >> king & 1:
+            for end in bitboard.iterate(KING_ATTACKS[king] & ~own & ~danger):
+                append(Move(king, end))
+            if not checkers:
+                for right, king_start, king_end, rook_start, empty, passed in _CASTLINGS[color]:
+                    if self.__castling & right and king == king_start and pieces[ROOK] >> rook_start & 1 \
+                            and not empty & occupied and not (legal and passed & danger):
+                        append(Move(king_start, king_end))
+
+        if checkers & (checkers - 1):
+            return moves
+        targets = ~own & FULL
+        if checkers:
+            targets &= checkers | BETWEEN[king][bitboard.lsb(checkers)]
+
+        for start in bitboard.iterate(pieces[KNIGHT] & ~pinned & from_mask):
+            for end in bitboard.iterate(KNIGHT_ATTACKS[start] & targets):
+                append(Move(start, end))
+        for kind, slide in ((BISHOP, bitboard.bishop_attacks), (ROOK, bitboard.rook_attacks)):
+            for start in bitboard.iterate((pieces[kind] | pieces[QUEEN]) & from_mask):
+                attacks = slide(start, occupied) & targets
+                if pinned >> start & 1:
+                    attacks &= LINE[king][start]
+                for end in bitboard.iterate(attacks):
+                    append(Move(start, end))
+
+        step = _PAWN_STEP[color]
+        start_row = _PAWN_START_ROW[color]
+        last_row = _PAWN_LAST_ROW[color]
+        pawn_attacks = PAWN_ATTACKS[color]
+        ep_square = self.__ep_square if color == self.__turn else None
+        for start in bitboard.iterate(pieces[PAWN] & from_mask):
+            ends = pawn_attacks[start] & other
+            end = start + step
+            if not occupied >> end & 1:
+                ends |= 1 << end
+                if start // SIZE == start_row and not occupied >> (end + step) & 1:
+                    ends |= 1 << (end + step)
+            ends &= targets
+            if pinned >> start & 1:
+                ends &= LINE[king][start]
+            for end in bitboard.iterate(ends):
+                if end // SIZE == last_row:
+                    for promotion in _PROMOTIONS:
+                        append(Move(start, end, promotion))
+                else:
+                    append(Move(start, end))
+            if ep_square is not None and pawn_attacks[start] >> ep_square & 1:
+                move = Move(start, ep_square)
+                if not legal or king is None:
+                    append(move)
+                else:
+                    undo = self._make(move)
+                    if not self.is_attacked(king, color ^ 1):
+                        append(move)
+                    self._unmake(move, undo)
+        return moves
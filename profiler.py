@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Iterator, Optional
+import pygame as pg
+import assets
+import utility
+
+ENV_VAR = 'CHESS_PROFILE'
+TOGGLE_KEY = pg.K_F3
+EXPORT_KEY = pg.K_F4
+
+_TEXT_COLOR = (230, 230, 230)
+_WARN_COLOR = (255, 170, 60)
+_PANEL_COLOR = (0, 0, 0)
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False, window: int = 240, trace_limit: int = 500000,
+                 top: int = 8, refresh: float = 0.5) -> None:
+        self.enabled = enabled
+        self.__origin = time.perf_counter_ns()
+        # (name, category, start ns, duration ns, thread) for every timed call, oldest dropped first
+        self.__trace = deque(maxlen=trace_limit)
+        self.__frames = deque(maxlen=window)
+        self.__frame_ends = deque(maxlen=window)
+        self.__frame_start = None
+        # name -> [total ns, calls] since the overlay was last refreshed
+        self.__totals = {}
+        self.__summary_frames = 0
+        self.__summary = []
+        self.__summary_time = 0.0
+        self.__top = top
+        self.__refresh = refresh
+        self.__line_size = 14
+        self.__overlay_rect = pg.Rect(0, 0, 0, 0)
+
+    @property
+    def trace_size(self) -> int:
+        return len(self.__trace)
+
+    def toggle(self) -> bool:
+        self.enabled = not self.enabled
+        self.__frame_start = None
+        return self.enabled
+
+    def clear(self) -> None:
+        self.__trace.clear()
+        self.__frames.clear()
+        self.__frame_ends.clear()
+        self.__totals = {}
+        self.__summary_frames = 0
+        self.__summary = []
+
+    def record(self, name: str, start: int, end: int, category: str = 'call') -> None:
+        totals = self.__totals.get(name)
+        if totals is None:
+            totals = self.__totals[name] = [0, 0]
+        totals[0] += end - start
+        totals[1] += 1
+        self.__trace.append((name, category, start, end - start, threading.get_ident()))
+
+    def call(self, name: str, func: Callable, *args: Any, **kwargs: Any) -> Any:
+        if not self.enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.record(name, start, time.perf_counter_ns())
+
+    @contextmanager
+    def span(self, name: str, category: str = 'frame') -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter_ns(), category)
+
+    def begin_frame(self) -> None:
+        self.__frame_start = time.perf_counter_ns() if self.enabled else None
+
+    def end_frame(self) -> None:
+        if self.__frame_start is None:
+            return
+        end = time.perf_counter_ns()
+        self.__frames.append(end - self.__frame_start)
+        self.__frame_ends.append(end)
+        self.__summary_frames += 1
+        self.__trace.append(('frame', 'frame', self.__frame_start, end - self.__frame_start, threading.get_ident()))
+        self.__frame_start = None
+
+    @property
+    def fps(self) -> float:
+        if len(self.__frame_ends) < 2:
+            return 0.0
+        return (len(self.__frame_ends) - 1) * 1e9 / (self.__frame_ends[-1] - self.__frame_ends[0])
+
+    def frame_ms(self, percentile: float) -> float:
+        if not self.__frames:
+            return 0.0
+        ordered = sorted(self.__frames)
+        return ordered[min(int(len(ordered) * percentile / 100), len(ordered) - 1)] / 1e6
+
+    def top(self, count: Optional[int] = None) -> list:
+        # (name, ms per frame, calls per frame) for the costliest calls since the last refresh
+        frames = max(self.__summary_frames, 1)
+        ranked = sorted(self.__totals.items(), key=lambda item: -item[1][0])[:count or self.__top]
+        return [(name, total / frames / 1e6, calls / frames) for name, (total, calls) in ranked]
+
+    def export(self, path: str) -> int:
+        # Chrome trace event format, loadable in chrome://tracing or Perfetto
+        pid = os.getpid()
+        events = [{'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - self.__origin) / 1000, 'dur': duration / 1000}
+                  for name, category, start, duration, tid in list(self.__trace)]
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'Simple chess'}})
+        with open(path, 'w') as out:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, out)
+        return len(events) - 1
+
+    def overlay_rect(self, canvas: pg.Surface) -> pg.Rect:
+        lines = self.__top + 3
+        width, height = 420, lines * (self.__line_size + 4) + 12
+        return pg.Rect(canvas.get_width() - width - 10, 10, width, height)
+
+    def draw(self, canvas: pg.Surface) -> None:
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if now - self.__summary_time >= self.__refresh:
+            self.__summary_time = now
+            self.__summary = self.__lines()
+            self.__totals = {}
+            self.__summary_frames = 0
+
+        rect = self.overlay_rect(canvas)
+        panel = pg.Surface(rect.size)
+        panel.set_alpha(170)
+        panel.fill(_PANEL_COLOR)
+        canvas.blit(panel, rect)
+        y = rect.top + 6
+        for text, color in self.__summary:
+            canvas.blit(assets.texts.render(text, self.__line_size, color, bold=False), (rect.left + 8, y))
+            y += self.__line_size + 4
+
+    def __lines(self) -> list:
+        p50, p99 = self.frame_ms(50), self.frame_ms(99)
+        lines = [(f'FPS {self.fps:5.1f}  frame p50 {p50:5.2f} ms  p99 {p99:5.2f} ms',
+                  _WARN_COLOR if p99 > 1000 / 30 else _TEXT_COLOR),
+                 (f'trace {len(self.__trace)} events  F3 hide  F4 export', _TEXT_COLOR)]
+        text = assets.texts.stats
+        lines.append((f'sprites {len(assets.sprites)}  text {text["surfaces"]} cached, {text["hits"]} hits, '
+                      f'{text["misses"]} misses', _TEXT_COLOR))
+        for name, ms, calls in self.top():
+            lines.append((f'{ms:7.3f} ms {calls:6.1f}x  {name[-40:]}', _TEXT_COLOR))
+        return lines
+
+
+profiler = Profiler(os.environ.get(ENV_VAR, '') not in ('', '0'))
+utility.GameEvent.profiler = profiler
+
+
+def profiled(name: Optional[str] = None, category: str = 'rules') -> Callable:
+    def decorate(func: Callable) -> Callable:
+        label = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if not profiler.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profiler.record(label, start, time.perf_counter_ns(), category)
+        return wrapper
+    return decorate
@@ -0,0 +1,197 @@
+import argparse
+import random
+import struct
+import sys
+import time
+from array import array
+from typing import Iterable
+import pgn
+from position import Position, Move, START_FEN, PACKED_SIZE
+
+# header, then the packed position at every interval-th ply starting with the first, then every
+# move packed into 16 bits; all little-endian
+_MAGIC = b'SCHREPL\0'
+_VERSION = 1
+_HEADER = struct.Struct('<8sIII')
+DEFAULT_INTERVAL = 16
+
+
+class ReplayLog:
+    def __init__(self, start_fen: str = START_FEN, interval: int = DEFAULT_INTERVAL) -> None:
+        if interval < 1:
+            raise RuntimeError(f'invalid keyframe interval: {interval}')
+        self.__interval = interval
+        self.reset(start_fen)
+
+    @classmethod
+    def from_moves(cls, start_fen: str, moves: Iterable[Move], interval: int = DEFAULT_INTERVAL) -> 'ReplayLog':
+        log = cls(start_fen, interval)
+        for move in moves:
+            log.append(move)
+        return log
+
+    @classmethod
+    def from_pgn(cls, path: str, index: int = 0, interval: int = DEFAULT_INTERVAL) -> 'ReplayLog':
+        for n, game in enumerate(pgn.open_games(path)):
+            if n == index:
+                return cls.from_moves(game.fen, game.replay(), interval)
+        raise RuntimeError(f'{path} has no game {index + 1}')
+
+    @classmethod
+    def load(cls, path: str) -> 'ReplayLog':
+        with open(path, 'rb') as source:
+            data = source.read()
+        if len(data) < _HEADER.size:
+            raise RuntimeError(f'not a replay log: {path}')
+        magic, version, interval, plies = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION or not interval:
+            raise RuntimeError(f'not a replay log: {path}')
+        frames = plies // interval + 1
+        move_start = _HEADER.size + frames * PACKED_SIZE
+        if len(data) < move_start + 2 * plies:
+            raise RuntimeError(f'truncated replay log: {path}')
+
+        log = cls(Position.unpack(data, _HEADER.size).fen(), interval)
+        log.__keyframes = [Position.unpack(data, _HEADER.size + n * PACKED_SIZE) for n in range(frames)]
+        log.__moves = array('H', data[move_start:move_start + 2 * plies])
+        if sys.byteorder != 'little':
+            log.__moves.byteswap()
+        log.__tip = log.seek(plies)
+        return log
+
+    def save(self, path: str) -> None:
+        moves = array('H', self.__moves)
+        if sys.byteorder != 'little':
+            moves.byteswap()
+        with open(path, 'wb') as out:
+            out.write(_HEADER.pack(_MAGIC, _VERSION, self.__interval, len(self.__moves)))
+            out.writelines(keyframe.pack() for keyframe in self.__keyframes)
+            out.write(moves.tobytes())
+
+    @property
+    def start_fen(self) -> str:
+        return self.__start_fen
+
+    @property
+    def interval(self) -> int:
+        return self.__interval
+
+    @property
+    def plies(self) -> int:
+        return len(self.__moves)
+
+    def __len__(self) -> int:
+        return len(self.__moves)
+
+    @property
+    def moves(self) -> tuple:
+        return tuple(Move.unpack(move) for move in self.__moves)
+
+    def move(self, ply: int) -> Move:
+        # the move that leads to ply
+        return Move.unpack(self.__moves[ply - 1])
+
+    def reset(self, start_fen: str) -> None:
+        start = Position.from_fen(start_fen)
+        self.__start_fen = start.fen()
+        self.__moves = array('H')
+        # kept unpacked, a copy is much cheaper than rebuilding a position from its packed form; like
+        # the ones load() unpacks they carry no history, which would make every keyframe cost its ply
+        self.__keyframes = [start.copy(history=False)]
+        # position after the last move, so appending never has to seek
+        self.__tip = start
+
+    def append(self, move: Move) -> None:
+        self.__tip._make(move)
+        self.__moves.append(move.pack())
+        if len(self.__moves) % self.__interval == 0:
+            self.__keyframes.append(self.__tip.copy(history=False))
+
+    def truncate(self, plies: int) -> None:
+        if plies >= len(self.__moves):
+            return
+        del self.__moves[plies:]
+        del self.__keyframes[plies // self.__interval + 1:]
+        self.__tip = self.seek(plies)
+
+    def sync(self, start_fen: str, moves: tuple) -> None:
+        # brings the log in line with a game's move list: takebacks cut it, new moves are appended
+        if start_fen != self.__start_fen:
+            self.reset(start_fen)
+        common = min(len(self.__moves), len(moves))
+        while common and self.__moves[common - 1] != moves[common - 1].pack():
+            common -= 1
+        self.truncate(common)
+        for move in moves[common:]:
+            self.append(move)
+
+    def seek(self, ply: int) -> Position:
+        # the position after ply moves: the keyframe at or before it and at most interval - 1 moves;
+        # its history only goes back to the keyframe, so status() won't see repetitions from before it
+        if not 0 <= ply <= len(self.__moves):
+            raise RuntimeError(f'no ply {ply} in a game of {len(self.__moves)}')
+        frame = ply // self.__interval
+        pos = self.__keyframes[frame].copy()
+        for move in self.__moves[frame * self.__interval:ply]:
+            pos.make_move(Move.unpack(move))
+        return pos
+
+
+def _random_game(plies: int, seed: int) -> list:
+    rng = random.Random(seed)
+    pos = Position.initial()
+    moves = []
+    while len(moves) < plies:
+        legal = pos.legal_moves()
+        if not legal:
+            # start over rather than end early, the benchmark wants long games
+            pos, moves = Position.initial(), []
+            continue
+        moves.append(rng.choice(legal))
+        pos._make(moves[-1])
+    return moves
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Record and seek through keyframed game logs')
+    commands = parser.add_subparsers(dest='command', required=True)
+    record = commands.add_parser('record', help='convert a PGN game into a replay log')
+    record.add_argument('pgn')
+    record.add_argument('log')
+    record.add_argument('--game', type=int, default=1, help='game number within the PGN file')
+    record.add_argument('--interval', type=int, default=DEFAULT_INTERVAL, help='plies between keyframes')
+    show = commands.add_parser('show', help='print the position at a ply')
+    show.add_argument('log')
+    show.add_argument('ply', type=int)
+    bench = commands.add_parser('bench', help='time seeks against replaying from the start')
+    bench.add_argument('--plies', type=int, default=300)
+    bench.add_argument('--interval', type=int, nargs='+', default=[8, 16, 32])
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        log = ReplayLog.from_pgn(args.pgn, args.game - 1, args.interval)
+        log.save(args.log)
+        print(f'plies {log.plies}  keyframes {log.plies // log.interval + 1}')
+        return
+    if args.command == 'show':
+        pos = ReplayLog.load(args.log).seek(args.ply)
+        print(pos.fen())
+        return
+
+    moves = _random_game(args.plies, 0)
+    rng = random.Random(1)
+    plies = [rng.randint(0, args.plies) for _ in range(1000)]
+    # an interval longer than the game never keyframes, every seek replays from the start
+    for interval in [args.plies + 1] + args.interval:
+        log = ReplayLog.from_moves(START_FEN, moves, interval)
+        start = time.perf_counter()
+        for ply in plies:
+            log.seek(ply)
+        elapsed = (time.perf_counter() - start) / len(plies)
+        label = 'none' if interval > args.plies else str(interval)
+        print(f'keyframes every {label:>4} plies  {elapsed * 1e6:8.1f} us per seek  '
+              f'{(log.plies // interval + 1) * PACKED_SIZE + 2 * log.plies:6d} bytes')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+import argparse
+import json
+import multiprocessing
+import random
+import time
+from typing import NamedTuple, Optional, TextIO
+import pgn
+from book import OpeningBook
+from engine import Engine, MAX_PLY
+from position import Position, Move, START_FEN, GAME_OVER
+from tablebase import Tablebase
+from transposition import TranspositionTable
+
+PLAYERS = ('engine', 'random')
+PLY_LIMIT = 'ply limit'
+
+
+class Settings(NamedTuple):
+    players: tuple
+    depth: int
+    move_time: Optional[float]
+    random_plies: int
+    max_plies: int
+    check: bool
+    fen: str
+    hash_mb: float
+    book: Optional[str] = None
+    tablebases: Optional[str] = None
+
+
+class GameRecord(NamedTuple):
+    index: int
+    seed: int
+    fen: str
+    moves: tuple
+    termination: str
+    result: str
+    elapsed: float
+
+    @property
+    def plies(self) -> int:
+        return len(self.moves)
+
+    def to_json(self) -> str:
+        return json.dumps({**self._asdict(), 'moves': ' '.join(self.moves)})
+
+    def write_pgn(self, out: TextIO) -> None:
+        headers = {'Event': 'Self-play', 'Round': self.index + 1, 'Seed': self.seed, 'Termination': self.termination}
+        pgn.write_game(out, map(Move.from_uci, self.moves), headers, self.fen, self.result)
+
+
+_settings = None
+_engine = None
+
+
+def _init_worker(settings: Settings) -> None:
+    global _settings, _engine
+    _settings = settings
+    if 'engine' in settings.players:
+        book = OpeningBook(settings.book) if settings.book else None
+        tablebase = Tablebase(settings.tablebases) if settings.tablebases else None
+        _engine = Engine(settings.depth, settings.move_time, TranspositionTable(settings.hash_mb), book=book,
+                         tablebase=tablebase)
+
+
+def _check(pos: Position, move: str) -> None:
+    # the incrementally updated position must agree with one built from scratch
+    fresh = Position.from_fen(pos.fen())
+    if fresh.key != pos.key or sorted(fresh.legal_moves()) != sorted(pos.legal_moves()):
+        raise RuntimeError(f'inconsistent position after {move}: {pos.fen()}')
+
+
+def play_game(index: int, seed: int, settings: Settings, engine: Optional[Engine] = None) -> GameRecord:
+    rng = random.Random(seed)
+    pos = Position.from_fen(settings.fen)
+    moves = []
+    start = time.perf_counter()
+    status = pos.status()
+    while status not in GAME_OVER and len(moves) < settings.max_plies:
+        if len(moves) < settings.random_plies or settings.players[pos.turn] == 'random':
+            move = rng.choice(pos.legal_moves())
+        else:
+            move = engine.search(pos).move
+        pos.make_move(move)
+        moves.append(move.uci)
+        if settings.check:
+            _check(pos, move.uci)
+        status = pos.status()
+
+    if status not in GAME_OVER:
+        status = PLY_LIMIT
+    return GameRecord(index, seed, settings.fen, tuple(moves), status, pos.result(), time.perf_counter() - start)
+
+
+def _play(task: tuple) -> GameRecord:
+    return play_game(*task, _settings, _engine)
+
+
+def run(games: int, workers: int, settings: Settings, seed: int, output: str, report_every: float = 5.0,
+        output_format: str = 'jsonl') -> dict:
+    results = {'1-0': 0, '0-1': 0, '1/2-1/2': 0, '*': 0}
+    terminations = {}
+    plies = 0
+    start = last_report = time.perf_counter()
+
+    def report(done: int) -> None:
+        elapsed = time.perf_counter() - start
+        print(f'games {done}/{games}  {done / elapsed:.2f} games/s  {plies / elapsed:.0f} moves/s  '
+              f'white {results["1-0"]}  black {results["0-1"]}  draws {results["1/2-1/2"]}  '
+              f'unfinished {results["*"]}', flush=True)
+
+    tasks = ((index, seed + index) for index in range(games))
+    with multiprocessing.Pool(workers, _init_worker, (settings,)) as pool, open(output, 'w') as out:
+        # every game goes to disk as soon as any worker finishes it
+        for done, record in enumerate(pool.imap_unordered(_play, tasks), 1):
+            if output_format == 'pgn':
+                record.write_pgn(out)
+            else:
+                out.write(record.to_json() + '\n')
+            out.flush()
+            results[record.result] += 1
+            terminations[record.termination] = terminations.get(record.termination, 0) + 1
+            plies += record.plies
+            if time.perf_counter() - last_report >= report_every:
+                last_report = time.perf_counter()
+                report(done)
+    report(games)
+    print('  '.join(f'{name} {count}' for name, count in sorted(terminations.items())))
+    return {'results': results, 'terminations': terminations, 'plies': plies,
+            'elapsed': time.perf_counter() - start}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Play games without a window and save them as JSON lines')
+    parser.add_argument('games', type=int, help='number of games')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--white', choices=PLAYERS, default='engine')
+    parser.add_argument('--black', choices=PLAYERS, default='engine')
+    parser.add_argument('--move-time', type=float, default=0.1, help='engine seconds per move')
+    parser.add_argument('--depth', type=int, default=MAX_PLY, help='engine depth limit')
+    parser.add_argument('--random-plies', type=int, default=4, help='random opening moves, so games differ')
+    parser.add_argument('--max-plies', type=int, default=400, help='stop unfinished games after this many moves')
+    parser.add_argument('--seed', type=int, default=0, help='game i uses seed + i')
+    parser.add_argument('--fen', default=START_FEN)
+    parser.add_argument('--hash', type=float, default=16, help='transposition table size in MB per worker')
+    parser.add_argument('--book', default=None, help='opening book the engines play from')
+    parser.add_argument('--tablebases', default=None, help='directory of endgame tables the engines play from')
+    parser.add_argument('--check', action='store_true', help='verify every position against a fresh rebuild')
+    parser.add_argument('--output', default='selfplay.jsonl')
+    parser.add_argument('--format', choices=('jsonl', 'pgn'), default='jsonl')
+    args = parser.parse_args()
+
+    settings = Settings((args.white, args.black), args.depth, args.move_time, args.random_plies,
+                        args.max_plies, args.check, args.fen, args.hash, args.book, args.tablebases)
+    run(args.games, args.workers, settings, args.seed, args.output, output_format=args.format)
+
+
+if __name__ == '__main__':
+    main()
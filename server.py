@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Optional
+import pgn
+from engine import Engine, MAX_PLY
+from position import Position, Move, START_FEN, COLOR_NAMES, GAME_OVER
+from transposition import TranspositionTable
+
+DEFAULT_PORT = 8765
+OPERATIONS = ('new', 'move', 'moves', 'state', 'undo', 'go', 'close', 'ping')
+# longest request line accepted; a FEN with a few hundred moves fits easily
+LINE_LIMIT = 1 << 16
+
+
+class _Game:
+    def __init__(self, game_id: int, fen: str, owner: object) -> None:
+        self.id = game_id
+        self.position = Position.from_fen(fen)
+        self.start_fen = self.position.fen()
+        self.owner = owner
+        # a move can't slip in while the engine is thinking about the previous position
+        self.lock = asyncio.Lock()
+
+    def state(self) -> dict:
+        pos = self.position
+        last = pos.last_move
+        return {'game': self.id, 'fen': pos.fen(), 'turn': COLOR_NAMES[pos.turn], 'status': pos.status(),
+                'result': pos.result(), 'plies': len(pos.move_stack), 'last': last.uci if last else None}
+
+
+_local = threading.local()
+
+
+def _think(state: bytes, depth: int, time_limit: Optional[float], hash_mb: float) -> Optional[Move]:
+    # runs on an executor thread, each thread keeps one engine and table between requests
+    engine = getattr(_local, 'engine', None)
+    if engine is None:
+        engine = _local.engine = Engine(table=TranspositionTable(hash_mb))
+    return engine.search(Position.from_bytes(state), depth, time_limit).move
+
+
+class GameServer:
+    def __init__(self, max_games: int = 100000, max_inflight: int = 64, engine_depth: int = 3,
+                 engine_time: Optional[float] = 0.1, engine_threads: int = 2, hash_mb: float = 4,
+                 max_time: float = 5.0) -> None:
+        self.max_games = max_games
+        self.max_inflight = max_inflight
+        self.engine_depth = engine_depth
+        self.engine_time = engine_time
+        # the game stays locked while the engine thinks, so no client gets to ask for longer than this
+        self.max_time = max_time
+        self.hash_mb = hash_mb
+        self.__games = {}
+        self.__next_id = 1
+        self.__executor = ThreadPoolExecutor(engine_threads, thread_name_prefix='engine')
+        self.__connections = 0
+        self.__requests = 0
+
+    @property
+    def games(self) -> int:
+        return len(self.__games)
+
+    @property
+    def stats(self) -> dict:
+        return {'games': len(self.__games), 'connections': self.__connections, 'requests': self.__requests}
+
+    async def start(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT) -> asyncio.base_events.Server:
+        return await asyncio.start_server(self.handle, host, port, limit=LINE_LIMIT)
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.__connections += 1
+        owner = object()
+        # requests of one connection run concurrently up to this many; past it the server stops
+        # reading, so a client that floods requests is held back by TCP instead of by memory
+        slots = asyncio.Semaphore(self.max_inflight)
+        tasks = set()
+        try:
+            while True:
+                await slots.acquire()
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):
+                    slots.release()
+                    break
+                if not line:
+                    slots.release()
+                    break
+                task = asyncio.create_task(self.__respond(line, writer, owner, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.__connections -= 1
+            for game_id in [game.id for game in self.__games.values() if game.owner is owner]:
+                del self.__games[game_id]
+            writer.close()
+
+    async def __respond(self, line: bytes, writer: asyncio.StreamWriter, owner: object,
+                        slots: asyncio.Semaphore) -> None:
+        try:
+            try:
+                response = await self.request(line, owner)
+            except Exception as error:
+                # whatever goes wrong, the client gets an answer instead of waiting forever
+                response = {'id': None, 'ok': False, 'error': f'internal error: {error!r}'}
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            slots.release()
+
+    async def request(self, line: bytes, owner: object = None) -> dict:
+        self.__requests += 1
+        request_id = None
+        try:
+            message = json.loads(line)
+            if not isinstance(message, dict):
+                raise RuntimeError('request must be a JSON object')
+            request_id = message.get('id')
+            op = message.get('op')
+            if op not in OPERATIONS:
+                raise RuntimeError(f'unknown op: {op}')
+            if op == 'ping':
+                result = {'pong': True}
+            elif op == 'new':
+                result = self.__new(message, owner)
+            else:
+                game = self.__game(message)
+                async with game.lock:
+                    result = await self.__apply(op, game, message)
+        except (RuntimeError, ValueError, TypeError) as error:
+            return {'id': request_id, 'ok': False, 'error': str(error)}
+        except Exception as error:
+            # a bug must not cost the client its answer, it matches replies to requests by id
+            return {'id': request_id, 'ok': False, 'error': f'internal error: {error!r}'}
+        return {'id': request_id, 'ok': True, **result}
+
+    def __new(self, message: dict, owner: object) -> dict:
+        if len(self.__games) >= self.max_games:
+            raise RuntimeError('too many games')
+        fen = message.get('fen') or START_FEN
+        if not isinstance(fen, str):
+            raise RuntimeError('fen must be a string')
+        game = _Game(self.__next_id, fen, owner)
+        self.__next_id += 1
+        self.__games[game.id] = game
+        return game.state()
+
+    def __game(self, message: dict) -> _Game:
+        game = self.__games.get(message.get('game'))
+        if game is None:
+            raise RuntimeError(f'no game {message.get("game")}')
+        return game
+
+    async def __apply(self, op: str, game: _Game, message: dict) -> dict:
+        pos = game.position
+        if op == 'moves':
+            return {'game': game.id, 'moves': [move.uci for move in pos.legal_moves()]}
+        if op == 'state':
+            return game.state()
+        if op == 'close':
+            del self.__games[game.id]
+            return {'game': game.id, 'closed': True}
+        if op == 'undo':
+            pos.undo_move()
+            return game.state()
+
+        if pos.status() in GAME_OVER:
+            raise RuntimeError('game is over')
+        if op == 'move':
+            text = message.get('move', '')
+            uci = len(text) in (4, 5) and text[:1].islower() and text[1:2].isdigit() and text[3:4].isdigit()
+            move = Move.from_uci(text) if uci else None
+            move = pos.find_move(move.start, move.end, move.promotion) if move else pgn.parse_san(pos, text)
+            if move is None:
+                raise RuntimeError(f'illegal move {text} in {pos.fen()}')
+        else:
+            depth = int(message.get('depth') or self.engine_depth)
+            time_limit = message.get('time', self.engine_time)
+            time_limit = self.max_time if time_limit is None else float(time_limit)
+            if depth < 1 or not time_limit > 0:
+                raise RuntimeError('depth and time must be positive')
+            loop = asyncio.get_running_loop()
+            move = await loop.run_in_executor(self.__executor, _think, pos.to_bytes(), min(depth, MAX_PLY),
+                                              min(time_limit, self.max_time), self.hash_mb)
+        pos.make_move(move)
+        return {**game.state(), 'move': move.uci}
+
+
+async def serve(host: str, port: int, server: GameServer) -> None:
+    listener = await server.start(host, port)
+    print(f'listening on {host}:{port}', flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+class _Client:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.__reader = reader
+        self.__writer = writer
+        self.__pending = {}
+        self.__next_id = 0
+        self.__listener = asyncio.create_task(self.__listen())
+
+    @classmethod
+    async def connect(cls, host: str, port: int) -> '_Client':
+        return cls(*await asyncio.open_connection(host, port, limit=LINE_LIMIT))
+
+    async def __listen(self) -> None:
+        while True:
+            line = await self.__reader.readline()
+            if not line:
+                break
+            response = json.loads(line)
+            future = self.__pending.pop(response.get('id'), None)
+            if future is not None:
+                future.set_result(response)
+        for future in self.__pending.values():
+            future.set_exception(ConnectionError('server closed the connection'))
+
+    async def call(self, **message: Any) -> dict:
+        self.__next_id += 1
+        message['id'] = self.__next_id
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[self.__next_id] = future
+        self.__writer.write(json.dumps(message).encode() + b'\n')
+        await self.__writer.drain()
+        return await future
+
+    async def close(self) -> None:
+        self.__writer.close()
+        await self.__writer.wait_closed()
+        self.__listener.cancel()
+
+
+async def _play(client: _Client, rng: random.Random, max_plies: int, latencies: list) -> int:
+    # one game of random moves; every request's round trip is recorded
+    async def timed(**message: Any) -> dict:
+        start = time.perf_counter()
+        response = await client.call(**message)
+        latencies.append(time.perf_counter() - start)
+        if not response['ok']:
+            raise RuntimeError(response['error'])
+        return response
+
+    game = (await timed(op='new'))['game']
+    plies = 0
+    while plies < max_plies:
+        moves = (await timed(op='moves', game=game))['moves']
+        if not moves:
+            break
+        state = await timed(op='move', game=game, move=rng.choice(moves))
+        plies += 1
+        if state['status'] in GAME_OVER:
+            break
+    await timed(op='close', game=game)
+    return plies
+
+
+async def load_test(host: str, port: int, games: int, connections: int, max_plies: int, seed: int = 0) -> dict:
+    clients = [await _Client.connect(host, port) for _ in range(min(connections, games))]
+    latencies = []
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    # every game runs at once, spread evenly over the connections
+    plies = await asyncio.gather(*(_play(clients[n % len(clients)], random.Random(rng.random()), max_plies, latencies)
+                                   for n in range(games)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+    latencies.sort()
+    moves = sum(plies)
+    report = {'games': games, 'connections': len(clients), 'moves': moves, 'requests': len(latencies),
+              'elapsed': elapsed, 'moves_per_s': moves / elapsed,
+              'p50_ms': latencies[len(latencies) // 2] * 1000,
+              'p99_ms': latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000}
+    print(f'games {games:>5}  connections {len(clients):>4}  moves {moves:>7}  {elapsed:6.2f} s  '
+          f'{report["moves_per_s"]:8.0f} moves/s  {len(latencies) / elapsed:8.0f} requests/s  '
+          f'p50 {report["p50_ms"]:7.2f} ms  p99 {report["p99_ms"]:7.2f} ms', flush=True)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Host many games over a JSON lines TCP protocol')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('serve', help='run the server')
+    run.add_argument('--host', default='127.0.0.1')
+    run.add_argument('--port', type=int, default=DEFAULT_PORT)
+    run.add_argument('--max-games', type=int, default=100000)
+    run.add_argument('--max-inflight', type=int, default=64, help='concurrent requests per connection')
+    run.add_argument('--depth', type=int, default=3, help='default engine depth for "go"')
+    run.add_argument('--engine-threads', type=int, default=2)
+    run.add_argument('--max-time', type=float, default=5.0, help='longest search a "go" may ask for, in seconds')
+    bench = commands.add_parser('bench', help='play random games against a server and report throughput')
+    bench.add_argument('--host', default='127.0.0.1')
+    bench.add_argument('--port', type=int, default=DEFAULT_PORT)
+    bench.add_argument('--games', type=int, nargs='+', default=[100, 1000], help='concurrent games per round')
+    bench.add_argument('--connections', type=int, default=100)
+    bench.add_argument('--max-plies', type=int, default=40)
+    bench.add_argument('--spawn', action='store_true', help='start a server process for the run')
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        server = GameServer(args.max_games, args.max_inflight, args.depth, engine_threads=args.engine_threads,
+                            max_time=args.max_time)
+        try:
+            asyncio.run(serve(args.host, args.port, server))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+        return
+
+    process = None
+    if args.spawn:
+        process = subprocess.Popen([sys.executable, __file__, 'serve', '--host', args.host, '--port', str(args.port)],
+                                   stdout=subprocess.PIPE, text=True)
+        process.stdout.readline()
+    try:
+        for games in args.games:
+            asyncio.run(load_test(args.host, args.port, games, args.connections, args.max_plies))
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
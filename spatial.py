@@ -0,0 +1,59 @@
+from typing import Iterator, Optional
+from pygame import Rect
+
+
+class ColliderGrid:
+    def __init__(self, bucket_size: int = 128) -> None:
+        if bucket_size <= 0:
+            raise RuntimeError()
+        self.__bucket_size = bucket_size
+        # bucket -> colliders overlapping it, topmost layer first
+        self.__buckets = {}
+        self.__keys = {}
+
+    def __len__(self) -> int:
+        return len(self.__keys)
+
+    def __contains__(self, collider: 'Clickable') -> bool:
+        return collider in self.__keys
+
+    def __iter__(self) -> Iterator:
+        return iter(self.__keys)
+
+    def __bucket_keys(self, rect: Rect) -> list:
+        size = self.__bucket_size
+        if rect.width <= 0 or rect.height <= 0:
+            return []
+        return [(x, y) for x in range(rect.left // size, (rect.right - 1) // size + 1)
+                for y in range(rect.top // size, (rect.bottom - 1) // size + 1)]
+
+    def add(self, collider: 'Clickable') -> None:
+        if collider in self.__keys:
+            self.remove(collider)
+        keys = self.__bucket_keys(collider.rect)
+        for key in keys:
+            bucket = self.__buckets.setdefault(key, [])
+            # among equal layers the most recently added collider is found first
+            index = 0
+            while index < len(bucket) and bucket[index].layer > collider.layer:
+                index += 1
+            bucket.insert(index, collider)
+        self.__keys[collider] = keys
+
+    def remove(self, collider: 'Clickable') -> None:
+        for key in self.__keys.pop(collider):
+            bucket = self.__buckets[key]
+            bucket.remove(collider)
+            if not bucket:
+                del self.__buckets[key]
+
+    def update(self, collider: 'Clickable') -> None:
+        # call after the collider's rect or layer changed
+        self.add(collider)
+
+    def at(self, pos: tuple) -> Optional['Clickable']:
+        size = self.__bucket_size
+        for collider in self.__buckets.get((int(pos[0] // size), int(pos[1] // size)), ()):
+            if collider.rect.collidepoint(pos):
+                return collider
+        return None
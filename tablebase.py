@@ -0,0 +1,525 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import struct
+import time
+from functools import lru_cache
+from typing import Any, Iterable, NamedTuple, Optional
+import numpy as np
+import bitboard
+from position import (Position, Move, WHITE, BLACK, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, SIZE,
+                      make_piece, piece_color, piece_kind)
+
+MAX_PIECES = 4
+WIN, DRAW, LOSS = 1, 0, -1
+EXTENSION = '.tbl'
+
+# header, then one code per position packed into `bits` bits each, least significant bit first;
+# code 0 is a draw, code c stands for c - 1 plies to mate (odd: the side to move mates, even: it
+# gets mated) and the all ones code marks positions that can't occur
+_MAGIC = b'SCHTBL\0\0'
+_VERSION = 1
+_HEADER = struct.Struct('<8sII8sQ')
+_LETTERS = ' PNBRQK'
+_ORDER = 'KQRBNP'
+_VALUES = {'K': 0, 'Q': 9, 'R': 5, 'B': 3, 'N': 3, 'P': 1}
+# no mate is possible with these, they are draws without a table
+TRIVIAL = ('KvK', 'KBvK', 'KNvK')
+
+# forward pass results per position, before the retrograde pass
+_NORMAL, _ILLEGAL, _MATED, _STALEMATE = 0, 1, 2, 3
+_NO_WIN = 255
+
+
+class Probe(NamedTuple):
+    # for the side to move; dtm counts plies to mate and is None for draws
+    wdl: int
+    dtm: Optional[int]
+
+    @property
+    def text(self) -> str:
+        if self.wdl == DRAW:
+            return 'draw'
+        return f'{"win" if self.wdl == WIN else "loss"} in {(self.dtm + 1) // 2}'
+
+
+# eight board symmetries: bit 0 mirrors the files, bit 1 the ranks, bit 2 swaps files with ranks
+def _transform(sq: int, symmetry: int) -> int:
+    if symmetry & 1:
+        sq ^= SIZE - 1
+    if symmetry & 2:
+        sq ^= (SIZE - 1) * SIZE
+    if symmetry & 4:
+        sq = (sq % SIZE) * SIZE + sq // SIZE
+    return sq
+
+
+_TRANSFORMS = tuple(tuple(_transform(sq, symmetry) for sq in range(SIZE * SIZE)) for symmetry in range(8))
+
+
+def _king_symmetry(sq: int, pawns: bool) -> int:
+    # the symmetry that brings the white king into a1-d1-d4 (pawnless) or the a-d files (pawns)
+    x, y = sq % SIZE, sq // SIZE
+    symmetry = int(x >= SIZE // 2)
+    if pawns:
+        return symmetry
+    symmetry |= int(y >= SIZE // 2) << 1
+    sq = _transform(sq, symmetry)
+    return symmetry | int(sq % SIZE > sq // SIZE) << 2
+
+
+# white king square -> (symmetry, index among the canonical king squares), for tables without and with pawns
+_KINGS = tuple(tuple(_king_symmetry(sq, pawns) for sq in range(SIZE * SIZE)) for pawns in (False, True))
+_KING_SQUARES = tuple(sorted({_TRANSFORMS[_KINGS[pawns][sq]][sq] for sq in range(SIZE * SIZE)})
+                      for pawns in (False, True))
+_KING_INDEX = tuple({sq: i for i, sq in enumerate(squares)} for squares in _KING_SQUARES)
+
+
+class _Layout(NamedTuple):
+    name: str
+    # piece codes in index order: white king, black king, the other white pieces, the other black ones
+    pieces: tuple
+    pawns: bool
+    size: int
+
+
+@lru_cache(maxsize=None)
+def layout(name: str) -> _Layout:
+    white, black = name.split('v')
+    pieces = [make_piece(WHITE, KING), make_piece(BLACK, KING)]
+    pieces += [make_piece(WHITE, _LETTERS.index(letter)) for letter in white[1:]]
+    pieces += [make_piece(BLACK, _LETTERS.index(letter)) for letter in black[1:]]
+    pawns = 'P' in name
+    return _Layout(name, tuple(pieces), pawns, 2 * len(_KING_SQUARES[pawns]) * 64 ** (len(pieces) - 1))
+
+
+def _side(pieces: Iterable[int], color: int) -> str:
+    return ''.join(sorted((_LETTERS[piece_kind(piece)] for piece in pieces if piece_color(piece) == color),
+                          key=_ORDER.index))
+
+
+def _strength(side: str) -> tuple:
+    return sum(_VALUES[letter] for letter in side), [-_ORDER.index(letter) for letter in side]
+
+
+def material(pieces: Iterable[int]) -> tuple:
+    # table name with the stronger side as white, and whether the colours had to be swapped for it
+    return _material(tuple(sorted(pieces)))
+
+
+@lru_cache(maxsize=None)
+def _material(pieces: tuple) -> tuple:
+    white, black = _side(pieces, WHITE), _side(pieces, BLACK)
+    if _strength(black) > _strength(white):
+        return f'{black}v{white}', True
+    return f'{white}v{black}', False
+
+
+def _index(table: _Layout, turn: int, squares: list) -> int:
+    symmetry = _KINGS[table.pawns][squares[0]]
+    transform = _TRANSFORMS[symmetry]
+    index = turn * len(_KING_SQUARES[table.pawns]) + _KING_INDEX[table.pawns][transform[squares[0]]]
+    for sq in squares[1:]:
+        index = index * 64 + transform[sq]
+    return index
+
+
+def _squares(table: _Layout, placement: Iterable[tuple], swapped: bool) -> list:
+    # squares in the order of table.pieces; a swapped position is mirrored top to bottom
+    slots = {}
+    for sq, piece in placement:
+        if swapped:
+            sq, piece = sq ^ (SIZE - 1) * SIZE, piece ^ 8
+        slots.setdefault(piece, []).append(sq)
+    return [slots[piece].pop() for piece in table.pieces]
+
+
+def dependencies(name: str) -> list:
+    # the tables a capture or a promotion can lead to
+    table = layout(name)
+    found = []
+    for i, piece in enumerate(table.pieces):
+        if piece_kind(piece) == KING:
+            continue
+        rest = table.pieces[:i] + table.pieces[i + 1:]
+        children = [rest]
+        if piece_kind(piece) == PAWN:
+            children += [rest + (make_piece(piece_color(piece), kind),) for kind in (QUEEN, ROOK, BISHOP, KNIGHT)]
+        for child in children:
+            child_name = material(child)[0]
+            if child_name not in found:
+                found.append(child_name)
+    return found
+
+
+def _ep_capture(pos: Position) -> bool:
+    # placement and turn don't cover the en passant right, positions where it matters aren't indexed
+    return pos.ep_square is not None and any(pos.captured_square(move) not in (None, move.end)
+                                             for move in pos.legal_moves())
+
+
+def _code_probe(code: int) -> Probe:
+    if code == 0:
+        return Probe(DRAW, None)
+    return Probe(WIN if code & 1 == 0 else LOSS, code - 1)
+
+
+class Tablebase:
+    def __init__(self, directory: str) -> None:
+        self.__directory = directory
+        # table name -> (file, mapping, bits), None for tables that aren't there
+        self.__tables = {}
+
+    def __enter__(self) -> 'Tablebase':
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @property
+    def directory(self) -> str:
+        return self.__directory
+
+    @property
+    def names(self) -> list:
+        if not os.path.isdir(self.__directory):
+            return []
+        return sorted(name[:-len(EXTENSION)] for name in os.listdir(self.__directory) if name.endswith(EXTENSION))
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.__directory, name + EXTENSION)
+
+    def __table(self, name: str) -> Optional[tuple]:
+        if name in self.__tables:
+            return self.__tables[name]
+        path = self.path(name)
+        if not os.path.exists(path):
+            self.__tables[name] = None
+            return None
+        file = open(path, 'rb')
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, bits, stored_name, size = _HEADER.unpack_from(mapping)
+        if magic != _MAGIC or version != _VERSION or stored_name.rstrip(b'\0').decode() != name \
+                or size != layout(name).size or len(mapping) < _HEADER.size + (size * bits + 7) // 8:
+            mapping.close()
+            file.close()
+            raise RuntimeError(f'not a {name} table: {path}')
+        self.__tables[name] = (file, mapping, bits)
+        return self.__tables[name]
+
+    def code(self, placement: list, turn: int) -> Optional[int]:
+        # raw code of a position given as (square, piece) pairs; -1 for positions that can't occur,
+        # None when the table is missing
+        name, swapped = material(piece for _, piece in placement)
+        if name in TRIVIAL:
+            return 0
+        entry = self.__table(name)
+        if entry is None:
+            return None
+        _, mapping, bits = entry
+        table = layout(name)
+        index = _index(table, turn ^ swapped, _squares(table, placement, swapped))
+        offset = _HEADER.size + (index * bits >> 3)
+        code = int.from_bytes(mapping[offset:offset + 2], 'little') >> (index * bits & 7) & ((1 << bits) - 1)
+        return -1 if code == (1 << bits) - 1 else code
+
+    def probe(self, pos: Position) -> Optional[Probe]:
+        # None when the position isn't covered: too many pieces, castling rights, an en passant
+        # capture or a missing table; the fifty move rule is not taken into account
+        if bitboard.popcount(pos.occupied) > MAX_PIECES or pos.castling:
+            return None
+        if _ep_capture(pos):
+            return None
+        code = self.code([(sq, pos.get(sq)) for sq in bitboard.iterate(pos.occupied)], pos.turn)
+        if code is None or code < 0:
+            return None
+        return _code_probe(code)
+
+    def rank_moves(self, pos: Position) -> list:
+        # (move, probe of the position after it) pairs, best for the side to move first
+        ranked = []
+        child = pos.copy()
+        for move in pos.legal_moves():
+            undo = child._make(move)
+            probe = self.probe(child)
+            child._unmake(move, undo)
+            if probe is None:
+                return []
+            ranked.append((move, probe))
+        # mate fastest, lose slowest, and among draws anything goes
+        ranked.sort(key=lambda item: (item[1].wdl, item[1].dtm if item[1].wdl == LOSS else -(item[1].dtm or 0)))
+        return ranked
+
+    def best_move(self, pos: Position) -> Optional[Move]:
+        ranked = self.rank_moves(pos)
+        return ranked[0][0] if ranked else None
+
+    def close(self) -> None:
+        for entry in self.__tables.values():
+            if entry is not None:
+                entry[1].close()
+                entry[0].close()
+        self.__tables = {}
+
+
+_base = None
+
+
+def _init_worker(directory: str) -> None:
+    global _base
+    _base = Tablebase(directory)
+
+
+def _decode(table: _Layout, start: int, end: int) -> tuple:
+    # index range -> (turn, squares by piece, mask of positions worth generating moves for)
+    index = np.arange(start, end, dtype=np.int64)
+    count = len(table.pieces)
+    squares = np.empty((count, end - start), np.int64)
+    for i in range(count - 1, 0, -1):
+        squares[i] = index % 64
+        index //= 64
+    kings = len(_KING_SQUARES[table.pawns])
+    squares[0] = np.array(_KING_SQUARES[table.pawns])[index % kings]
+    turn = index // kings
+
+    valid = np.ones(end - start, bool)
+    for i in range(count):
+        for j in range(i + 1, count):
+            valid &= squares[i] != squares[j]
+        if piece_kind(table.pieces[i]) == PAWN:
+            valid &= (squares[i] >= SIZE) & (squares[i] < SIZE * (SIZE - 1))
+    distance = np.maximum(np.abs(squares[0] % SIZE - squares[1] % SIZE), np.abs(squares[0] // SIZE - squares[1] // SIZE))
+    valid &= distance > 1
+    return turn, squares, valid
+
+
+def _expand(table: _Layout, pos: Position, placed: list, node: int, edges: tuple, extra: list) -> tuple:
+    # (blocked, shortest win, longest loss) through the moves of one position that leave the table;
+    # the moves that stay in it become (node, child) edges
+    sources, targets = edges
+    side = pos.turn
+    blocked, win, floor = 0, _NO_WIN, 0
+    for move in pos.legal_moves():
+        mover = placed.index(move.start)
+        captured = pos.captured_square(move)
+        if captured is None and not move.promotion:
+            child = list(placed)
+            child[mover] = move.end
+            sources.append(node)
+            if piece_kind(table.pieces[mover]) == PAWN and abs(move.end - move.start) == 2 * SIZE:
+                after = pos.copy()
+                after._make(move)
+                if _ep_capture(after):
+                    targets.append(_extra_node(table, after, child, edges, extra))
+                    continue
+            targets.append(_index(table, side ^ 1, child))
+            continue
+        placement = [(sq, piece) for sq, piece in zip(placed, table.pieces) if sq not in (move.start, captured)]
+        piece = make_piece(side, move.promotion) if move.promotion else table.pieces[mover]
+        code = _base.code(placement + [(move.end, piece)], side ^ 1)
+        if code is None or code < 0:
+            raise RuntimeError(f'{table.name} needs the {material(p for _, p in placement + [(move.end, piece)])[0]} table')
+        if code == 0:
+            blocked += 1
+        elif code & 1:
+            # the opponent is mated in code - 1 plies
+            blocked += 1
+            win = min(win, code)
+        else:
+            floor = max(floor, code)
+    return blocked, win, floor
+
+
+def _extra_node(table: _Layout, pos: Position, placed: list, edges: tuple, extra: list) -> int:
+    # a position right after a double push that allows an en passant reply differs from the indexed one
+    # with the same placement, it gets a node of its own past the end of the table
+    node = table.size + len(extra)
+    extra.append(None)
+    extra[node - table.size] = _expand(table, pos, placed, node, edges, extra)
+    return node
+
+
+def _forward(task: tuple) -> tuple:
+    # move generation for one slice of a table: every position gets its state, how many children
+    # still have to turn out winning for the opponent before it is lost, the shortest win and the
+    # longest loss through captures and promotions, and (position, child) index pairs for the rest;
+    # extra nodes are numbered from table.size on, per slice
+    name, start, end = task
+    table = layout(name)
+    turn, squares, valid = _decode(table, start, end)
+    state = np.full(end - start, _ILLEGAL, np.uint8)
+    count = np.zeros(end - start, np.int32)
+    ext_win = np.full(end - start, _NO_WIN, np.uint8)
+    floor = np.zeros(end - start, np.uint8)
+    edges = ([], [])
+    extra = []
+    pieces = table.pieces
+
+    for offset in np.flatnonzero(valid).tolist():
+        side = int(turn[offset])
+        placed = squares[:, offset].tolist()
+        pos = Position.from_placement(zip(placed, pieces), side)
+        if pos.is_checked(side ^ 1):
+            continue
+        if not pos.has_legal_moves():
+            state[offset] = _MATED if pos.is_checked(side) else _STALEMATE
+            continue
+        state[offset] = _NORMAL
+        count[offset], ext_win[offset], floor[offset] = _expand(table, pos, placed, start + offset, edges, extra)
+    return (start, state, count, ext_win, floor, np.array(edges[0], np.uint32), np.array(edges[1], np.uint32),
+            np.array(extra, np.int32).reshape(-1, 3))
+
+
+def _solve(state: np.ndarray, count: np.ndarray, ext_win: np.ndarray, floor: np.ndarray,
+           sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    # retrograde pass: plies to mate per position, -1 for draws and positions that can't occur
+    size = len(state)
+    count += np.bincount(sources, minlength=size).astype(np.int32)
+    order = np.argsort(targets, kind='stable')
+    parents = sources[order]
+    del order
+    offsets = np.zeros(size + 1, np.int64)
+    np.cumsum(np.bincount(targets, minlength=size), out=offsets[1:])
+
+    def gather(nodes: np.ndarray) -> np.ndarray:
+        starts = offsets[nodes]
+        lengths = offsets[nodes + 1] - starts
+        total = int(lengths.sum())
+        if not total:
+            return np.empty(0, np.int64)
+        steps = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return parents[np.repeat(starts, lengths) + steps].astype(np.int64)
+
+    dtm = np.full(size, -1, np.int16)
+    decided = (state == _ILLEGAL) | (state == _STALEMATE)
+    # candidates by ply: a position is settled by the first bucket that reaches it
+    buckets = {0: [np.flatnonzero(state == _MATED)]}
+    wins = np.flatnonzero((state == _NORMAL) & (ext_win != _NO_WIN))
+    losses = np.flatnonzero((state == _NORMAL) & (count == 0))
+    for nodes, plies in ((wins, ext_win[wins]), (losses, floor[losses])):
+        for ply in np.unique(plies).tolist():
+            buckets.setdefault(ply, []).append(nodes[plies == ply])
+
+    ply = 0
+    while buckets:
+        nodes = np.unique(np.concatenate(buckets.pop(ply, [np.empty(0, np.int64)])))
+        nodes = nodes[~decided[nodes]]
+        decided[nodes] = True
+        dtm[nodes] = ply
+        parents_of = gather(nodes)
+        if ply % 2 == 0:
+            # a move into a lost position wins
+            found = np.unique(parents_of)
+            found = found[~decided[found]]
+            if len(found):
+                buckets.setdefault(ply + 1, []).append(found)
+        elif len(parents_of):
+            # a position is lost once every move leads to a win for the opponent
+            found, hits = np.unique(parents_of, return_counts=True)
+            count[found] -= hits.astype(np.int32)
+            found = found[(count[found] == 0) & ~decided[found]]
+            plies = np.maximum(floor[found], ply + 1)
+            for lost in np.unique(plies).tolist():
+                buckets.setdefault(lost, []).append(found[plies == lost])
+        ply += 1
+    return np.where(state == _ILLEGAL, -2, dtm)
+
+
+def _write(path: str, name: str, dtm: np.ndarray) -> int:
+    codes = np.where(dtm >= 0, dtm + 1, 0).astype(np.uint8)
+    bits = int(codes.max() + 1).bit_length()
+    codes[dtm == -2] = (1 << bits) - 1
+    packed = np.packbits(np.unpackbits(codes[:, None], axis=1, count=bits, bitorder='little'), bitorder='little')
+    with open(path, 'wb') as out:
+        out.write(_HEADER.pack(_MAGIC, _VERSION, bits, name.encode(), len(codes)))
+        out.write(packed.tobytes())
+        # a probe reads two bytes at a time
+        out.write(bytes(1))
+    return bits
+
+
+def generate(name: str, directory: str, workers: Optional[int] = None, log: bool = True) -> list:
+    # builds name and every table it depends on that isn't there yet; returns the names built
+    name = material(layout(name).pieces)[0]
+    if name in TRIVIAL:
+        return []
+    table = layout(name)
+    if len(table.pieces) > MAX_PIECES:
+        raise RuntimeError(f'{name}: tables go up to {MAX_PIECES} pieces')
+    path = os.path.join(directory, name + EXTENSION)
+    if os.path.exists(path):
+        return []
+    built = []
+    for dependency in dependencies(name):
+        built += generate(dependency, directory, workers, log)
+
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    workers = workers or multiprocessing.cpu_count()
+    chunk = max(4096, table.size // (workers * 16))
+    tasks = [(name, lo, min(lo + chunk, table.size)) for lo in range(0, table.size, chunk)]
+    state = np.empty(table.size, np.uint8)
+    count = np.empty(table.size, np.int32)
+    ext_win = np.empty(table.size, np.uint8)
+    floor = np.empty(table.size, np.uint8)
+    sources, targets, extra = [], [], []
+    extras = 0
+    with multiprocessing.Pool(workers, _init_worker, (directory,)) as pool:
+        for lo, *parts in pool.imap_unordered(_forward, tasks):
+            hi = lo + len(parts[0])
+            state[lo:hi], count[lo:hi], ext_win[lo:hi], floor[lo:hi] = parts[:4]
+            # move the slice's extra nodes past the ones collected so far
+            for nodes in parts[4:6]:
+                nodes[nodes >= table.size] += extras
+            sources.append(parts[4])
+            targets.append(parts[5])
+            extra.append(parts[6])
+            extras += len(parts[6])
+    forward = time.perf_counter() - start
+    sources, targets, extra = np.concatenate(sources), np.concatenate(targets), np.concatenate(extra)
+    state = np.concatenate((state, np.full(extras, _NORMAL, np.uint8)))
+    count = np.concatenate((count, extra[:, 0]))
+    ext_win = np.concatenate((ext_win, extra[:, 1].astype(np.uint8)))
+    floor = np.concatenate((floor, extra[:, 2].astype(np.uint8)))
+    dtm = _solve(state, count, ext_win, floor, sources, targets)[:table.size]
+    bits = _write(path, name, dtm)
+    if log:
+        wins = int(((dtm >= 0) & (dtm % 2 == 1)).sum())
+        losses = int(((dtm >= 0) & (dtm % 2 == 0)).sum())
+        draws = int((dtm == -1).sum())
+        print(f'{name}: {table.size} entries, {wins} wins, {draws} draws, {losses} losses, '
+              f'longest mate {int(dtm.max())} plies, {bits} bits each, {len(sources)} moves, '
+              f'{forward:.1f} s forward, {time.perf_counter() - start:.1f} s total', flush=True)
+    return built + [name]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Generate and probe endgame tablebases')
+    commands = parser.add_subparsers(dest='command', required=True)
+    make = commands.add_parser('generate', help='build tables and everything they depend on')
+    make.add_argument('tables', nargs='+', help='material such as KQvK or KBNvK')
+    make.add_argument('--directory', default='tablebases')
+    make.add_argument('--workers', type=int, default=None)
+    probe = commands.add_parser('probe', help='classify a position and rank its moves')
+    probe.add_argument('fen')
+    probe.add_argument('--directory', default='tablebases')
+    args = parser.parse_args()
+
+    if args.command == 'generate':
+        for name in args.tables:
+            generate(name, args.directory, args.workers)
+        return
+    with Tablebase(args.directory) as tablebase:
+        pos = Position.from_fen(args.fen)
+        result = tablebase.probe(pos)
+        if result is None:
+            print('not in the tablebases')
+            return
+        print(result.text)
+        for move, child in tablebase.rank_moves(pos):
+            print(f'{move.uci:<6} {Probe(-child.wdl, None if child.dtm is None else child.dtm + 1).text}')
+
+
+if __name__ == '__main__':
+    main()
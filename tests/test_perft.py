@@ -0,0 +1,83 @@
+import io
+import pytest
+import pgn
+from perft import SUITE, perft
+from position import Position, Move, START_FEN
+
+MAX_NODES = 50000
+
+SHALLOW = [(f'{name} {depth}', fen, depth, nodes)
+           for name, fen, expected in SUITE
+           for depth, nodes in enumerate(expected, 1) if nodes <= MAX_NODES]
+
+ILLEGAL_FENS = [
+    # the side not to move is in check, h1h8 would capture the king
+    'K6k/8/8/8/8/8/8/7R w - - 0 1',
+    'KK5k/8/8/8/8/8/8/8 w - - 0 1',
+    'K7/8/8/8/8/8/8/8 w - - 0 1',
+    'K5kk/8/8/8/8/8/8/8 b - - 0 1',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR x KQkq - 0 1',
+    'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP w KQkq - 0 1',
+]
+
+
+@pytest.mark.parametrize('fen, depth, nodes', [case[1:] for case in SHALLOW], ids=[case[0] for case in SHALLOW])
+def test_perft(fen: str, depth: int, nodes: int) -> None:
+    assert perft(Position.from_fen(fen), depth) == nodes
+
+
+@pytest.mark.parametrize('fen', [fen for _, fen, _ in SUITE])
+def test_fen_round_trip(fen: str) -> None:
+    pos = Position.from_fen(fen)
+    assert pos.fen() == fen
+    assert Position.unpack(pos.pack()).fen() == fen
+
+
+@pytest.mark.parametrize('fen', ILLEGAL_FENS)
+def test_illegal_fen(fen: str) -> None:
+    with pytest.raises(RuntimeError, match='invalid FEN'):
+        Position.from_fen(fen)
+
+
+@pytest.mark.parametrize('fen', [fen for _, fen, _ in SUITE])
+def test_incremental_key(fen: str) -> None:
+    # the key after make/unmake matches the one computed from scratch
+    pos = Position.from_fen(fen)
+    key = pos.key
+    for move in pos.legal_moves():
+        undo = pos._make(move)
+        assert pos.key == Position.from_fen(pos.fen()).key
+        pos._unmake(move, undo)
+        assert pos.key == key
+
+
+def test_repetition() -> None:
+    pos = Position.initial()
+    for _ in range(2):
+        for uci in ('g1f3', 'g8f6', 'f3g1', 'f6g8'):
+            move = Move.from_uci(uci)
+            pos.make_move(pos.find_move(move.start, move.end))
+    assert pos.is_repetition(3)
+    assert Position.from_bytes(pos.to_bytes()).is_repetition(3)
+
+
+@pytest.mark.parametrize('fen', [START_FEN, SUITE[1][1], '4k3/8/8/8/8/8/4P3/4K3 b - - 0 7'])
+def test_pgn_round_trip(fen: str) -> None:
+    pos = Position.from_fen(fen)
+    moves = []
+    for _ in range(40):
+        legal = pos.legal_moves()
+        if not legal:
+            break
+        moves.append(legal[len(moves) * 7 % len(legal)])
+        pos.make_move(moves[-1])
+    out = io.StringIO()
+    pgn.write_game(out, moves, {'FEN': 'stale', 'White': 'w'}, fen=fen)
+    text = out.getvalue()
+    if fen != START_FEN:
+        assert text.index('[SetUp "1"]') < text.index('[FEN ')
+    assert not any(line.endswith('.') for line in text.splitlines())
+    game, = pgn.read_games(io.StringIO(text))
+    assert game.fen == fen
+    assert list(game.replay()) == moves
+
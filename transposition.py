@@ -0,0 +1,121 @@
+from array import array
+from typing import NamedTuple, Optional
+from position import Move
+
+EXACT, LOWER, UPPER = 1, 2, 3
+
+_ENTRY_BYTES = 16
+_SCORE_OFFSET = 1 << 29
+_MOVE_BITS, _DEPTH_BITS, _FLAG_BITS, _AGE_BITS = 16, 8, 2, 8
+_DEPTH_SHIFT = _MOVE_BITS
+_FLAG_SHIFT = _DEPTH_SHIFT + _DEPTH_BITS
+_AGE_SHIFT = _FLAG_SHIFT + _FLAG_BITS
+_SCORE_SHIFT = _AGE_SHIFT + _AGE_BITS
+
+
+class Entry(NamedTuple):
+    move: Optional[Move]
+    score: int
+    depth: int
+    flag: int
+    age: int
+
+
+def table_bytes(size_mb: float) -> int:
+    entries = max(int(size_mb * (1 << 20)) // _ENTRY_BYTES, 1)
+    # a power of two, so the slot is just the low bits of the key
+    return (1 << (entries.bit_length() - 1)) * _ENTRY_BYTES
+
+
+# holds search results only: check and mate state stay cached on each Position and repetitions are
+# found in its key history, a lossy table shared between lines would get both wrong on overwrites
+class TranspositionTable:
+    def __init__(self, size_mb: float = 16, buffer: Optional[memoryview] = None) -> None:
+        if buffer is None:
+            self.__size = table_bytes(size_mb) // _ENTRY_BYTES
+            self.__keys = array('Q', bytes(8 * self.__size))
+            self.__data = array('Q', bytes(8 * self.__size))
+        else:
+            # a caller owned buffer, e.g. shared memory, that several processes probe and store into
+            self.__size = table_bytes(len(buffer) / (1 << 20)) // _ENTRY_BYTES
+            words = memoryview(buffer).cast('B').cast('Q')
+            self.__keys = words[:self.__size]
+            self.__data = words[self.__size:2 * self.__size]
+        self.__mask = self.__size - 1
+        self.__age = 0
+        self.__filled = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def size_mb(self) -> float:
+        return self.__size * _ENTRY_BYTES / (1 << 20)
+
+    @property
+    def age(self) -> int:
+        return self.__age
+
+    def new_search(self, age: Optional[int] = None) -> None:
+        # processes sharing one buffer pass the age of the search they take part in
+        self.__age = (self.__age + 1 if age is None else age) & ((1 << _AGE_BITS) - 1)
+
+    def clear(self) -> None:
+        for words in (self.__keys, self.__data):
+            words[:] = array('Q', bytes(8 * self.__size))
+        self.__filled = 0
+        self.probes = self.hits = self.stores = 0
+
+    def probe(self, key: int) -> Optional[Entry]:
+        self.probes += 1
+        slot = key & self.__mask
+        data = self.__data[slot]
+        # keys are stored xor data, so an entry torn by a concurrent writer simply misses
+        if self.__keys[slot] ^ data != key:
+            return None
+        self.hits += 1
+        packed_move = data & 0xFFFF
+        return Entry(Move.unpack(packed_move) if packed_move else None,
+                     (data >> _SCORE_SHIFT) - _SCORE_OFFSET,
+                     data >> _DEPTH_SHIFT & 0xFF,
+                     data >> _FLAG_SHIFT & 0x3,
+                     data >> _AGE_SHIFT & 0xFF)
+
+    def store(self, key: int, move: Optional[Move], score: int, depth: int, flag: int) -> None:
+        slot = key & self.__mask
+        old = self.__data[slot]
+        old_key = self.__keys[slot] ^ old
+        if old_key and old_key != key:
+            # keep deeper results from the current search, anything from an older search may go
+            if old >> _AGE_SHIFT & 0xFF == self.__age and old >> _DEPTH_SHIFT & 0xFF > depth:
+                return
+        elif old_key == key and move is None:
+            move = Move.unpack(old & 0xFFFF) if old & 0xFFFF else None
+        if not old_key:
+            self.__filled += 1
+        self.stores += 1
+        data = ((move.pack() if move else 0)
+                | min(max(depth, 0), 0xFF) << _DEPTH_SHIFT
+                | flag << _FLAG_SHIFT
+                | self.__age << _AGE_SHIFT
+                | (score + _SCORE_OFFSET) << _SCORE_SHIFT)
+        self.__keys[slot] = key ^ data
+        self.__data[slot] = data
+
+    @property
+    def occupancy(self) -> float:
+        return self.__filled / self.__size
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.probes if self.probes else 0.0
+
+    @property
+    def stats(self) -> dict:
+        return {'size_mb': self.size_mb, 'entries': self.__size, 'filled': self.__filled,
+                'occupancy': self.occupancy, 'probes': self.probes, 'hits': self.hits,
+                'hit_rate': self.hit_rate, 'stores': self.stores}
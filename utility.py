@@ -12,6 +12,9 @@ BG = (52, 95, 110)
 
 
 class GameEvent:
+    # installed by the profiler module when the GUI loads it, so this one doesn't need pygame
+    profiler = None
+
     def __init__(self, **kwargs: Any) -> None:
         for k, v in kwargs.items():
             self.__setattr__(k, v)
@@ -26,5 +29,12 @@ class GameEvent:
         return self
 
     def __call__(self, *args: Any, **kwargs: Any) -> None:
+        profiler = GameEvent.profiler
+        if profiler is None or not profiler.enabled:
+            for handler in self.__handlers.copy():
+                handler(*args, **kwargs)
+            return
+        prefix = getattr(self, 'event_type', 'event')
         for handler in self.__handlers.copy():
-            handler(*args, **kwargs)
+            name = getattr(handler, '__qualname__', type(handler).__name__)
+            profiler.call(f'{prefix}: {name}', handler, *args, **kwargs)
@@ -0,0 +1,21 @@
+import random
+
+_random = random.Random(0x5EED)
+
+# indexed by piece code (color << 3 | kind) and square
+PIECES = tuple(tuple(_random.getrandbits(64) for _ in range(64)) for _ in range(16))
+SIDE = _random.getrandbits(64)
+EP_FILE = tuple(_random.getrandbits(64) for _ in range(8))
+_CASTLING_RIGHTS = tuple(_random.getrandbits(64) for _ in range(4))
+
+
+def _castling_key(mask: int) -> int:
+    key = 0
+    for i, right_key in enumerate(_CASTLING_RIGHTS):
+        if mask >> i & 1:
+            key ^= right_key
+    return key
+
+
+# indexed by the whole castling rights mask, so a rights change is a single xor
+CASTLING = tuple(_castling_key(mask) for mask in range(16))